@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+API Cache - Cache de Respostas Validada pela Versão dos Dados
+=============================================================
+
+Cache em memória das respostas da API, indexada por endpoint + argumentos.
+Cada entrada guarda a versão dos dados (LockerDatabase.get_data_version)
+com que foi gerada; quando a versão muda, a cache inteira é invalidada.
+
+Não depende do Flask - guarda apenas bytes, status e mimetype.
+"""
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+
+class ResponseCache:
+    """Cache LRU de respostas, invalidada quando a versão dos dados muda"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _check_version(self, version):
+        """Descarta todas as entradas se a versão dos dados mudou (com o lock)"""
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key, version):
+        """Entrada (body, status, mimetype) para a chave, ou None"""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def put(self, key, version, body: bytes, status: int = 200, mimetype: str = 'application/json'):
+        """Guarda uma resposta gerada com a versão dada"""
+        with self._lock:
+            self._check_version(version)
+            if version != self._version:
+                return
+            self._entries[key] = (body, status, mimetype)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Esvazia a cache"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Métricas da cache: entradas, hits/misses e versão atual"""
+        with self._lock:
+            requests = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'version': self._version,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / requests, 3) if requests else 0.0
+            }
+
+
+def make_etag(version, *parts) -> str:
+    """ETag (sem aspas) para a versão dos dados e partes extra (ex.: a data)"""
+    return '-'.join(str(part) for part in (version,) + parts)
+
+
+def parse_db_timestamp(value):
+    """Converte CURRENT_TIMESTAMP do SQLite (UTC) num datetime com fuso"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
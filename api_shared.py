@@ -0,0 +1,545 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+API Shared - Partes Comuns aos Servidores da API
+================================================
+
+Usado por database_api.py (Flask) e database_api_async.py (asyncio):
+página do dashboard, formatação de eventos SSE, filtros da exportação e
+compressão gzip em streaming. Não depende de nenhum framework web.
+"""
+
+import json
+import zlib
+from datetime import datetime, timezone
+
+# Server-Sent Events: intervalo do keep-alive e eventos em espera por cliente
+SSE_HEARTBEAT_SECONDS = 15
+SSE_CLIENT_QUEUE_SIZE = 500
+
+
+def cache_version(data_version) -> tuple:
+    """Chave de validade das caches/ETags para a versão dos dados dada
+    
+    Inclui a data: as janelas "últimos N dias" mudam à meia-noite, mesmo
+    sem escritas. A data é UTC, como date('now') e CURRENT_TIMESTAMP no
+    SQLite (booking_time e os agregados diários de booking_stats), para a
+    cache e as contagens mudarem de dia ao mesmo tempo.
+    """
+    return (data_version, datetime.now(timezone.utc).strftime('%Y%m%d'))
+
+
+def format_sse(event: dict) -> str:
+    """Formata um evento de alteração como mensagem SSE"""
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+
+def enrich_change_events(database, events: list) -> list:
+    """Junta a reserva completa aos eventos de reservas (para a UI a mostrar)"""
+    bookings = database.get_bookings_by_ids([e['booking_id'] for e in events if e['booking_id']])
+    for event in events:
+        if event['booking_id'] in bookings:
+            event['booking'] = bookings[event['booking_id']]
+    return events
+
+
+def notification_metrics(database) -> dict:
+    """Métricas de notificações: último snapshot gravado pelo kiosk e a fila atual
+    
+    'notifications' fica None enquanto o kiosk não tiver gravado nenhum
+    snapshot (as métricas vivem no processo do kiosk, não no da API).
+    """
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'notifications': database.get_metrics_snapshot('notifications'),
+        'queue': database.get_notification_queue_depth()
+    }
+
+
+def parse_export_filters(args) -> dict:
+    """Filtros da exportação (?start=YYYY-MM-DD&end=YYYY-MM-DD&locker=)
+    
+    args é qualquer mapeamento com .get (request.args, request.query).
+    Levanta ValueError se uma data for inválida.
+    """
+    filters = {
+        'start_date': args.get('start') or None,
+        'end_date': args.get('end') or None,
+        'locker_number': args.get('locker') or None,
+    }
+    for key in ('start_date', 'end_date'):
+        if filters[key]:
+            datetime.strptime(filters[key], '%Y-%m-%d')
+    return filters
+
+
+def gzip_stream(chunks):
+    """Comprime um gerador de texto em gzip, bloco a bloco"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 -> formato gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+# Template HTML simples para interface web
+HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Locker System - Database Viewer</title>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <style>
+        body { font-family: 'Segoe UI', Arial, sans-serif; margin: 0; padding: 20px; background: #f5f7fa; }
+        .container { max-width: 1200px; margin: 0 auto; }
+        .header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; border-radius: 12px; margin-bottom: 30px; box-shadow: 0 4px 15px rgba(0,0,0,0.1); }
+        .header h1 { margin: 0; font-size: 2.5em; text-align: center; }
+        .header p { margin: 10px 0 0 0; text-align: center; opacity: 0.9; }
+        .section { background: white; padding: 25px; margin-bottom: 25px; border-radius: 12px; box-shadow: 0 2px 10px rgba(0,0,0,0.08); }
+        .booking { border: 1px solid #e1e8ed; padding: 15px; margin: 10px 0; border-radius: 8px; transition: all 0.3s ease; }
+        .booking:hover { box-shadow: 0 2px 8px rgba(0,0,0,0.1); }
+        .booking.booked { border-left: 4px solid #f39c12; background: #fef9e7; }
+        .booking.unlocked { border-left: 4px solid #e74c3c; background: #fdedec; }
+        .booking.completed { border-left: 4px solid #27ae60; background: #eafaf1; }
+        .booking.available { border-left: 4px solid #95a5a6; background: #f8f9fa; }
+        .stats { display: grid; grid-template-columns: repeat(auto-fit, minmax(250px, 1fr)); gap: 20px; margin-bottom: 20px; }
+        .stat-box { background: white; padding: 20px; border-radius: 10px; border-left: 4px solid #3498db; text-align: center; box-shadow: 0 2px 8px rgba(0,0,0,0.05); }
+        .stat-box h3 { margin: 0 0 10px 0; color: #2c3e50; font-size: 1.1em; }
+        .stat-box p { margin: 0; font-size: 2em; font-weight: bold; color: #3498db; }
+        .controls { display: flex; flex-wrap: wrap; gap: 10px; margin-bottom: 20px; }
+        .btn { padding: 12px 20px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; border: none; border-radius: 6px; cursor: pointer; font-size: 14px; transition: all 0.3s ease; }
+        .btn:hover { transform: translateY(-2px); box-shadow: 0 4px 15px rgba(102, 126, 234, 0.4); }
+        .btn.secondary { background: linear-gradient(135deg, #74b9ff 0%, #0984e3 100%); }
+        .btn.success { background: linear-gradient(135deg, #55efc4 0%, #00b894 100%); }
+        .btn.warning { background: linear-gradient(135deg, #fdcb6e 0%, #e17055 100%); }
+        .search-box { padding: 12px; border: 2px solid #ddd; border-radius: 6px; font-size: 14px; width: 200px; transition: border-color 0.3s ease; }
+        .search-box:focus { outline: none; border-color: #667eea; }
+        .loading { text-align: center; padding: 40px; color: #74b9ff; font-size: 1.2em; }
+        .error { text-align: center; padding: 40px; color: #e74c3c; font-size: 1.2em; }
+        .no-data { text-align: center; padding: 40px; color: #95a5a6; font-size: 1.2em; }
+        .status-badge { display: inline-block; padding: 4px 8px; border-radius: 12px; font-size: 0.8em; font-weight: bold; text-transform: uppercase; }
+        .status-booked { background: #fff3cd; color: #856404; }
+        .status-unlocked { background: #f8d7da; color: #721c24; }
+        .status-completed { background: #d1ecf1; color: #0c5460; }
+        .status-available { background: #e2e3e5; color: #383d41; }
+        .refresh-info { text-align: center; margin-top: 20px; color: #6c757d; font-size: 0.9em; }
+        .booking-id { font-weight: bold; color: #495057; }
+        .booking-locker { font-weight: bold; color: #667eea; }
+        .booking-contact { color: #28a745; }
+        .booking-time { color: #6c757d; font-size: 0.9em; }
+        .contact-details { line-height: 1.4; }
+        .contact-details strong { margin-right: 5px; }
+        
+        @media (max-width: 768px) {
+            .container { padding: 10px; }
+            .stats { grid-template-columns: 1fr; }
+            .controls { flex-direction: column; }
+            .search-box { width: 100%; }
+        }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <div class="header">
+            <h1>🔒 Locker System Database</h1>
+            <p>Remote Database Access - Last Updated: <span id="lastUpdate">Loading...</span></p>
+        </div>
+
+        <div class="section">
+            <h2>📊 System Overview</h2>
+            <div class="stats" id="statsContainer">
+                <div class="stat-box">
+                    <h3>Total Bookings</h3>
+                    <p id="totalBookings">-</p>
+                </div>
+                <div class="stat-box">
+                    <h3>Active Bookings</h3>
+                    <p id="activeBookings">-</p>
+                </div>
+                <div class="stat-box">
+                    <h3>Completed Today</h3>
+                    <p id="completedToday">-</p>
+                </div>
+                <div class="stat-box">
+                    <h3>Most Used Locker</h3>
+                    <p id="mostUsed">-</p>
+                </div>
+            </div>
+        </div>
+
+        <div class="section">
+            <h2>🔍 Query Options</h2>
+            <div class="controls">
+                <button class="btn" onclick="loadAllBookings()">📋 All Bookings</button>
+                <button class="btn secondary" onclick="loadActiveBookings()">🔴 Active Only</button>
+                <button class="btn success" onclick="loadRecentBookings()">📅 Recent (7 days)</button>
+                <button class="btn warning" onclick="loadStats()">📊 Detailed Stats</button>
+                <input type="text" class="search-box" id="searchContact" placeholder="Search by name, email, phone..." onkeypress="handleSearchKeyPress(event)">
+                <button class="btn" onclick="searchByContact()">🔍 Search</button>
+                <button class="btn secondary" onclick="exportData()">📄 Export CSV</button>
+            </div>
+        </div>
+
+        <div class="section">
+            <h2 id="dataTitle">📋 Booking Data</h2>
+            <div id="dataContainer">
+                <div class="no-data">Click a button above to load data...</div>
+            </div>
+            <div class="refresh-info">
+                <small id="liveStatus">Data refreshes automatically every 30 seconds</small>
+            </div>
+        </div>
+    </div>
+
+    <script>
+        const API_BASE = window.location.origin;
+        let currentEndpoint = null;
+        let currentTitle = 'Data';
+        let nextCursor = null;
+        let loadedCount = 0;
+        let currentView = null;  // 'all', 'active', 'recent', 'search' ou null (estatísticas)
+        let refreshInterval = null;
+        let eventSource = null;
+        let statsRefreshTimer = null;
+        const ACTIVE_STATUSES = ['booked', 'active', 'unlocked'];
+        
+        function updateLastUpdate() {
+            document.getElementById('lastUpdate').textContent = new Date().toLocaleString();
+        }
+        
+        function handleSearchKeyPress(event) {
+            if (event.key === 'Enter') {
+                searchByContact();
+            }
+        }
+        
+        function updateStatCards(stats) {
+            document.getElementById('totalBookings').textContent = stats.total_bookings || 0;
+            
+            document.getElementById('activeBookings').textContent = stats.active_bookings || 0;
+            
+            // Get today's completed (mock for now)
+            document.getElementById('completedToday').textContent = stats.status_counts?.completed || 0;
+            
+            document.getElementById('mostUsed').textContent = 
+                stats.most_used_locker ? stats.most_used_locker.locker : 'N/A';
+        }
+        
+        // Atualiza só os cartões (não substitui a lista que está a ser vista)
+        async function refreshStats() {
+            try {
+                const response = await fetch(`${API_BASE}/api/stats`);
+                updateStatCards(await response.json());
+            } catch (error) {
+                console.error('Error refreshing stats:', error);
+            }
+        }
+        
+        function scheduleStatsRefresh() {
+            // Agrupa rajadas de eventos num único pedido
+            if (statsRefreshTimer) clearTimeout(statsRefreshTimer);
+            statsRefreshTimer = setTimeout(refreshStats, 500);
+        }
+        
+        async function loadStats() {
+            try {
+                const response = await fetch(`${API_BASE}/api/stats`);
+                const stats = await response.json();
+                
+                updateStatCards(stats);
+                currentView = null;
+                currentEndpoint = null;
+                
+                document.getElementById('dataTitle').textContent = '📊 Detailed Statistics';
+                document.getElementById('dataContainer').innerHTML = `
+                    <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(300px, 1fr)); gap: 20px;">
+                        <div style="background: #f8f9fa; padding: 20px; border-radius: 8px;">
+                            <h3 style="margin-top: 0; color: #495057;">Status Distribution</h3>
+                            <ul style="list-style: none; padding: 0;">
+                                ${Object.entries(stats.status_counts || {}).map(([status, count]) => `
+                                    <li style="margin: 10px 0; display: flex; justify-content: space-between;">
+                                        <span class="status-badge status-${status}">${status}</span>
+                                        <strong>${count}</strong>
+                                    </li>
+                                `).join('')}
+                            </ul>
+                        </div>
+                        
+                        ${stats.most_used_locker ? `
+                            <div style="background: #f8f9fa; padding: 20px; border-radius: 8px;">
+                                <h3 style="margin-top: 0; color: #495057;">Most Popular</h3>
+                                <p style="font-size: 1.5em; margin: 10px 0;">
+                                    <span class="booking-locker">Locker ${stats.most_used_locker.locker}</span>
+                                </p>
+                                <p style="color: #6c757d;">${stats.most_used_locker.count} total bookings</p>
+                            </div>
+                        ` : ''}
+                        
+                        ${stats.average_duration_hours > 0 ? `
+                            <div style="background: #f8f9fa; padding: 20px; border-radius: 8px;">
+                                <h3 style="margin-top: 0; color: #495057;">Average Usage</h3>
+                                <p style="font-size: 1.5em; margin: 10px 0; color: #28a745;">
+                                    ${stats.average_duration_hours.toFixed(1)} hours
+                                </p>
+                                <p style="color: #6c757d;">Per completed booking</p>
+                            </div>
+                        ` : ''}
+                    </div>
+                `;
+                updateLastUpdate();
+            } catch (error) {
+                console.error('Error loading stats:', error);
+                document.getElementById('dataContainer').innerHTML = '<div class="error">❌ Error loading statistics</div>';
+            }
+        }
+        
+        async function loadAllBookings() {
+            currentView = 'all';
+            currentEndpoint = '/api/bookings?limit=50';
+            await loadBookings(currentEndpoint, 'All Bookings');
+        }
+        
+        async function loadActiveBookings() {
+            currentView = 'active';
+            currentEndpoint = '/api/bookings/active';
+            await loadBookings(currentEndpoint, 'Active Bookings');
+        }
+        
+        async function loadRecentBookings() {
+            currentView = 'recent';
+            currentEndpoint = '/api/bookings/recent?days=7';
+            await loadBookings(currentEndpoint, 'Recent Bookings (7 days)');
+        }
+        
+        async function searchByContact() {
+            const contact = document.getElementById('searchContact').value.trim();
+            if (!contact) {
+                alert('Please enter a name, email, or phone number to search for');
+                return;
+            }
+            currentView = 'search';
+            currentEndpoint = `/api/bookings/contact/${encodeURIComponent(contact)}`;
+            await loadBookings(currentEndpoint, `Bookings for "${contact}"`);
+        }
+        
+        async function loadMoreBookings() {
+            if (currentEndpoint && nextCursor) {
+                await loadBookings(currentEndpoint, currentTitle, nextCursor);
+            }
+        }
+        
+        async function loadBookings(endpoint, title, cursor = null) {
+            try {
+                const container = document.getElementById('dataContainer');
+                if (!cursor) {
+                    container.innerHTML = '<div class="loading">⏳ Loading data...</div>';
+                }
+                currentTitle = title;
+                
+                const separator = endpoint.includes('?') ? '&' : '?';
+                const url = cursor ? `${endpoint}${separator}cursor=${encodeURIComponent(cursor)}` : endpoint;
+                const response = await fetch(`${API_BASE}${url}`);
+                
+                if (!response.ok) {
+                    throw new Error(`HTTP ${response.status}`);
+                }
+                
+                const page = await response.json();
+                const bookings = page.bookings;
+                nextCursor = page.next_cursor;
+                loadedCount = cursor ? loadedCount + bookings.length : bookings.length;
+                
+                document.getElementById('dataTitle').textContent = `📋 ${title} (${loadedCount}${nextCursor ? '+' : ''})`;
+                
+                const oldMore = document.getElementById('loadMore');
+                if (oldMore) oldMore.remove();
+                
+                if (loadedCount === 0) {
+                    document.getElementById('dataContainer').innerHTML = '<div class="no-data">📭 No bookings found.</div>';
+                    return;
+                }
+                
+                const bookingsHtml = bookings.map(renderBooking).join('');
+                
+                const moreHtml = nextCursor
+                    ? '<div id="loadMore" style="text-align: center; margin-top: 15px;"><button class="btn" onclick="loadMoreBookings()">⬇️ Load more</button></div>'
+                    : '';
+                
+                if (cursor) {
+                    container.insertAdjacentHTML('beforeend', bookingsHtml + moreHtml);
+                } else {
+                    container.innerHTML = bookingsHtml + moreHtml;
+                }
+                updateLastUpdate();
+            } catch (error) {
+                console.error('Error loading bookings:', error);
+                document.getElementById('dataContainer').innerHTML = '<div class="error">❌ Error loading data. Please check your connection.</div>';
+            }
+        }
+        
+        function renderBooking(booking) {
+            return `
+            <div class="booking ${booking.status}" id="booking-${booking.id}">
+                <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 10px;">
+                    <span class="booking-id">ID: ${booking.id}</span>
+                    <span class="status-badge status-${booking.status}">${booking.status}</span>
+                </div>
+                <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 10px;">
+                    <div class="contact-details">
+                        <strong>🔒 Locker:</strong> <span class="booking-locker">${booking.locker_number}</span><br>
+                        ${booking.name ? `<strong>👤 Name:</strong> <span class="booking-contact">${booking.name}</span><br>` : ''}
+                        ${booking.email ? `<strong>📧 Email:</strong> <span class="booking-contact">${booking.email}</span><br>` : ''}
+                        ${booking.phone ? `<strong>📱 Phone:</strong> <span class="booking-contact">${booking.phone}</span><br>` : ''}
+                        ${booking.birth_date ? `<strong>🎂 Birth Date:</strong> <span class="booking-contact">${booking.birth_date}</span><br>` : ''}
+                        ${booking.contact && !booking.email ? `<strong>👤 Contact:</strong> <span class="booking-contact">${booking.contact}</span><br>` : ''}
+                        <strong>🔑 PIN:</strong> <span style="color: #e74c3c; font-weight: bold;">${booking.pin || 'N/A'}</span>
+                    </div>
+                    <div>
+                        <div class="booking-time"><strong>📅 Booked:</strong> ${formatDateTime(booking.booking_time)}</div>
+                        ${booking.unlock_time ? `<div class="booking-time"><strong>🔓 Unlocked:</strong> ${formatDateTime(booking.unlock_time)}</div>` : ''}
+                        ${booking.return_time ? `<div class="booking-time"><strong>🔄 Returned:</strong> ${formatDateTime(booking.return_time)}</div>` : ''}
+                    </div>
+                </div>
+                ${booking.notes ? `<div style="margin-top: 10px; padding-top: 10px; border-top: 1px solid #eee;"><strong>📝 Notes:</strong> ${booking.notes}</div>` : ''}
+            </div>
+            `;
+        }
+        
+        function updateDataTitle() {
+            if (currentView) {
+                document.getElementById('dataTitle').textContent = `📋 ${currentTitle} (${loadedCount}${nextCursor ? '+' : ''})`;
+            }
+        }
+        
+        // Aplica uma reserva criada/alterada à lista atual sem a recarregar
+        function applyBookingChange(booking) {
+            const container = document.getElementById('dataContainer');
+            const existing = document.getElementById(`booking-${booking.id}`);
+            const isActive = ACTIVE_STATUSES.includes(booking.status);
+            
+            if (existing) {
+                if (currentView === 'active' && !isActive) {
+                    existing.remove();
+                    loadedCount--;
+                } else {
+                    existing.outerHTML = renderBooking(booking);
+                }
+            } else if (currentView === 'all' || currentView === 'recent' || (currentView === 'active' && isActive)) {
+                const placeholder = container.querySelector('.no-data');
+                if (placeholder) placeholder.remove();
+                container.insertAdjacentHTML('afterbegin', renderBooking(booking));
+                loadedCount++;
+            } else {
+                return;
+            }
+            updateDataTitle();
+        }
+        
+        function setLiveStatus(live) {
+            document.getElementById('liveStatus').textContent = live
+                ? '🟢 Live updates (server events)'
+                : 'Data refreshes automatically every 30 seconds';
+        }
+        
+        // Feed de alterações (SSE) - substitui o polling enquanto estiver ligado
+        function connectEvents() {
+            if (!window.EventSource) {
+                startAutoRefresh();
+                return;
+            }
+            
+            eventSource = new EventSource(`${API_BASE}/api/events`);
+            
+            eventSource.onopen = () => {
+                stopAutoRefresh();
+                setLiveStatus(true);
+            };
+            
+            // O browser volta a ligar sozinho (com Last-Event-ID); entretanto usa polling
+            eventSource.onerror = () => {
+                setLiveStatus(false);
+                if (!refreshInterval) startAutoRefresh();
+            };
+            
+            ['booking_created', 'booking_updated'].forEach(type => {
+                eventSource.addEventListener(type, event => {
+                    const change = JSON.parse(event.data);
+                    if (change.booking) applyBookingChange(change.booking);
+                    scheduleStatsRefresh();
+                    updateLastUpdate();
+                });
+            });
+            
+            eventSource.addEventListener('locker_status', () => scheduleStatsRefresh());
+            
+            // O servidor perdeu eventos deste cliente - recarregar tudo
+            eventSource.addEventListener('resync', () => {
+                if (currentEndpoint) loadBookings(currentEndpoint, currentTitle);
+                refreshStats();
+            });
+        }
+        
+        function formatDateTime(dateTimeString) {
+            if (!dateTimeString) return 'N/A';
+            try {
+                const date = new Date(dateTimeString);
+                return date.toLocaleString();
+            } catch (e) {
+                return dateTimeString;
+            }
+        }
+        
+        async function exportData() {
+            try {
+                // Link direto: o browser descarrega o CSV à medida que o servidor o envia
+                const a = document.createElement('a');
+                a.style.display = 'none';
+                a.href = `${API_BASE}/api/export`;
+                a.download = `locker_bookings_${new Date().toISOString().split('T')[0]}.csv`;
+                document.body.appendChild(a);
+                a.click();
+                a.remove();
+            } catch (error) {
+                console.error('Export error:', error);
+                alert('❌ Export failed. Please try again.');
+            }
+        }
+        
+        // Auto-refresh current data
+        function startAutoRefresh() {
+            if (refreshInterval) clearInterval(refreshInterval);
+            refreshInterval = setInterval(() => {
+                // Só a primeira página - nunca recarregar o histórico completo
+                if (currentEndpoint) {
+                    loadBookings(currentEndpoint, currentTitle);
+                }
+                refreshStats(); // Always refresh stats
+            }, 30000); // 30 seconds
+        }
+        
+        function stopAutoRefresh() {
+            if (refreshInterval) clearInterval(refreshInterval);
+            refreshInterval = null;
+        }
+        
+        // Initialize
+        document.addEventListener('DOMContentLoaded', function() {
+            loadStats();
+            connectEvents();
+            updateLastUpdate();
+        });
+        
+        // Stop refresh when page is hidden
+        document.addEventListener('visibilitychange', function() {
+            if (document.hidden) {
+                stopAutoRefresh();
+            } else if (!eventSource || eventSource.readyState !== EventSource.OPEN) {
+                startAutoRefresh();
+            }
+        });
+    </script>
+</body>
+</html>
+"""
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Booking Export - Exportação do Histórico de Reservas
+====================================================
+
+Formatos partilhados pela API (database_api.py), pelo menu local
+(booking_queries.py) e pelo cliente remoto (remote_client.py):
+
+- csv      - texto, mesmas colunas e ordem do export antigo (name, email e
+             phone acrescentadas no fim)
+- ndjson   - um objeto JSON por linha (stream)
+- arrow    - ficheiro Arrow IPC com colunas tipadas (requer pyarrow)
+- parquet  - ficheiro Parquet com colunas tipadas (requer pyarrow)
+
+As reservas chegam de LockerDatabase.iter_bookings() e são convertidas em
+lotes, por isso a memória usada não depende do tamanho do histórico.
+"""
+
+import csv
+import json
+from datetime import datetime
+from io import StringIO
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    pq = None
+    PYARROW_AVAILABLE = False
+
+# Colunas exportadas (por ordem) - as do export antigo primeiro, as novas no fim,
+# para não deslocar colunas lidas por posição
+EXPORT_FIELDS = ['id', 'locker_number', 'contact', 'pin', 'status',
+                 'booking_time', 'unlock_time', 'return_time', 'notes',
+                 'name', 'email', 'phone']
+
+# Colunas guardadas como timestamp nos formatos colunares
+TIMESTAMP_FIELDS = ('booking_time', 'unlock_time', 'return_time')
+
+# Formato -> (extensão, mimetype)
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'ndjson': ('ndjson', 'application/x-ndjson'),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.file'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+}
+COLUMNAR_FORMATS = ('arrow', 'parquet')
+
+# Reservas por lote (texto) e por RecordBatch (colunar)
+TEXT_BATCH_SIZE = 200
+COLUMNAR_BATCH_SIZE = 5000
+
+
+def available_formats() -> list:
+    """Formatos suportados nesta instalação"""
+    return [fmt for fmt in EXPORT_FORMATS if fmt not in COLUMNAR_FORMATS or PYARROW_AVAILABLE]
+
+
+def check_format(fmt: str):
+    """Valida o formato pedido - levanta ValueError se não for suportado"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato desconhecido: {fmt} (disponíveis: {', '.join(available_formats())})")
+    if fmt in COLUMNAR_FORMATS and not PYARROW_AVAILABLE:
+        raise ValueError(f"O formato {fmt} requer pyarrow (pip install pyarrow)")
+
+
+def export_filename(fmt: str, prefix: str = 'locker_bookings') -> str:
+    """Nome de ficheiro com data/hora para o formato dado"""
+    return f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{EXPORT_FORMATS[fmt][0]}"
+
+
+def _parse_timestamp(value):
+    """Converte o texto do SQLite (CURRENT_TIMESTAMP ou ISO) em datetime"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ============================================
+# FORMATOS DE TEXTO (stream de str)
+# ============================================
+
+def iter_csv(bookings, batch_size: int = TEXT_BATCH_SIZE):
+    """Gera o CSV em blocos de texto à medida que as reservas são lidas"""
+    buffer = StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction='ignore')
+    writer.writeheader()
+
+    for count, booking in enumerate(bookings, 1):
+        writer.writerow(booking)
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+def iter_ndjson(bookings, batch_size: int = TEXT_BATCH_SIZE):
+    """Gera NDJSON (um objeto por linha) em blocos de texto"""
+    lines = []
+    for booking in bookings:
+        lines.append(json.dumps({field: booking.get(field) for field in EXPORT_FIELDS}, ensure_ascii=False))
+        if len(lines) >= batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+# ============================================
+# FORMATOS COLUNARES (pyarrow)
+# ============================================
+
+def arrow_schema():
+    """Schema Arrow das reservas (timestamps tipados, sem fuso - UTC do SQLite)"""
+    fields = []
+    for name in EXPORT_FIELDS:
+        if name == 'id':
+            fields.append(pa.field(name, pa.int64()))
+        elif name in TIMESTAMP_FIELDS:
+            fields.append(pa.field(name, pa.timestamp('s')))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+def iter_record_batches(bookings, batch_size: int = COLUMNAR_BATCH_SIZE):
+    """Converte as reservas em RecordBatches de até batch_size linhas"""
+    schema = arrow_schema()
+    columns = {name: [] for name in EXPORT_FIELDS}
+    rows = 0
+
+    for booking in bookings:
+        for name in EXPORT_FIELDS:
+            value = booking.get(name)
+            if name in TIMESTAMP_FIELDS:
+                value = _parse_timestamp(value)
+            elif name != 'id' and value is not None:
+                value = str(value)
+            columns[name].append(value)
+        rows += 1
+
+        if rows >= batch_size:
+            yield pa.RecordBatch.from_pydict(columns, schema=schema)
+            columns = {name: [] for name in EXPORT_FIELDS}
+            rows = 0
+
+    if rows:
+        yield pa.RecordBatch.from_pydict(columns, schema=schema)
+
+
+def write_columnar(bookings, sink, fmt: str, batch_size: int = COLUMNAR_BATCH_SIZE) -> int:
+    """Escreve as reservas em Arrow IPC ou Parquet num ficheiro/stream
+
+    Returns:
+        Número de reservas escritas
+    """
+    check_format(fmt)
+    schema = arrow_schema()
+    total = 0
+
+    if fmt == 'parquet':
+        writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    else:
+        writer = pa.ipc.new_file(sink, schema)
+
+    try:
+        for batch in iter_record_batches(bookings, batch_size):
+            if fmt == 'parquet':
+                writer.write_table(pa.Table.from_batches([batch], schema=schema))
+            else:
+                writer.write_batch(batch)
+            total += batch.num_rows
+    finally:
+        writer.close()
+
+    return total
+
+
+# ============================================
+# EXPORTAÇÃO PARA FICHEIRO
+# ============================================
+
+def export_bookings(db, filename: str = None, fmt: str = 'csv', **filters) -> dict:
+    """Exporta reservas da base de dados local para um ficheiro
+
+    Args:
+        db: instância de LockerDatabase
+        filename: destino (None para gerar um nome com data/hora)
+        fmt: 'csv', 'ndjson', 'arrow' ou 'parquet'
+        filters: start_date, end_date, locker_number (ver iter_bookings)
+
+    Returns:
+        {'filename', 'format', 'count'}
+    """
+    check_format(fmt)
+    filename = filename or export_filename(fmt, prefix='reservas_export')
+    count = 0
+
+    def counted(bookings):
+        nonlocal count
+        for booking in bookings:
+            count += 1
+            yield booking
+
+    bookings = counted(db.iter_bookings(**filters))
+
+    if fmt in COLUMNAR_FORMATS:
+        write_columnar(bookings, filename, fmt)
+    else:
+        chunks = iter_csv(bookings) if fmt == 'csv' else iter_ndjson(bookings)
+        with open(filename, 'w', newline='', encoding='utf-8') as f:
+            for chunk in chunks:
+                f.write(chunk)
+
+    return {'filename': filename, 'format': fmt, 'count': count}
@@ -22,6 +22,7 @@ import os
 import sys
 from datetime import datetime, timedelta
 from database import LockerDatabase
+import booking_export
 
 
 class BookingQuerySystem:
@@ -41,7 +42,7 @@ class BookingQuerySystem:
         print("4. Ver reservas recentes (últimos 7 dias)")
         print("5. Ver reservas ativas")
         print("6. Estatísticas do sistema")
-        print("7. Exportar dados para CSV")
+        print("7. Exportar dados (CSV/NDJSON/Parquet)")
         print("0. Sair")
         print("="*60)
         
@@ -137,8 +138,7 @@ class BookingQuerySystem:
     def query_active_bookings(self):
         """Consulta reservas ativas"""
         try:
-            bookings = self.db.get_all_bookings()
-            active_bookings = [b for b in bookings if b['status'] in ['booked', 'unlocked']]
+            active_bookings = self.db.get_active_bookings()
             self.display_bookings(active_bookings, "Reservas Ativas")
             
         except Exception as e:
@@ -181,25 +181,15 @@ class BookingQuerySystem:
             print(f"Erro ao obter estatísticas: {e}")
     
     def export_to_csv(self):
-        """Exporta dados para CSV"""
+        """Exporta dados para CSV, NDJSON, Arrow ou Parquet"""
         try:
-            import csv
-            from datetime import datetime
+            formats = booking_export.available_formats()
+            fmt = input(f"\nFormato ({'/'.join(formats)}, padrão csv): ").strip().lower() or 'csv'
             
-            filename = f"reservas_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            bookings = self.db.get_all_bookings()
+            result = booking_export.export_bookings(self.db, fmt=fmt)
             
-            with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-                fieldnames = ['id', 'locker_number', 'contact', 'pin', 'status', 
-                             'booking_time', 'unlock_time', 'return_time', 'notes']
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-                
-                writer.writeheader()
-                for booking in bookings:
-                    writer.writerow(booking)
-            
-            print(f"\nDados exportados para: {filename}")
-            print(f"Total de registos: {len(bookings)}")
+            print(f"\nDados exportados para: {result['filename']}")
+            print(f"Total de registos: {result['count']}")
             
         except Exception as e:
             print(f"Erro ao exportar dados: {e}")
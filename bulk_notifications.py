@@ -0,0 +1,243 @@
+# bulk_notifications.py
+# Envio de notificações em massa (alertas de permanência, encerramento do local)
+#
+# Os destinatários saem de uma única consulta às reservas ativas
+# (database.get_notification_recipients). O envio corre numa thread própria,
+# sem bloquear o kiosk: emails em lotes, cada lote numa sessão SMTP do pool
+# (um worker por sessão), e SMS em paralelo até ao tamanho do pool HTTP.
+# Cada canal tem um limite de envios por segundo (token bucket) para não
+# ultrapassar os limites do servidor SMTP e dos fornecedores de SMS. O
+# resultado de cada destinatário fica em bulk_notification_results.
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from notification_queue import EMAIL_BATCH_SIZE
+from notification_service import notification_service
+from notification_templates import CompiledTemplate
+
+# Envios por segundo por canal (o Twilio aceita ~1 SMS/s por número)
+BULK_EMAIL_RATE = 5.0
+BULK_SMS_RATE = 1.0
+
+# Envios seguidos permitidos acima do ritmo (capacidade do token bucket)
+BULK_RATE_BURST = 5
+
+# Resultados acumulados antes de os gravar (uma transação por bloco)
+BULK_RESULT_FLUSH_SIZE = 50
+
+# Campos disponíveis nos textos de um envio em massa
+BULK_TEMPLATE_FIELDS = {'customer', 'locker', 'booking_time'}
+
+
+class TokenBucket:
+    """Limita o ritmo de envios: rate por segundo, com rajadas até burst"""
+
+    def __init__(self, rate: float, burst: int = BULK_RATE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, cancelled: threading.Event = None) -> bool:
+        """Espera por uma vaga - False se o envio foi cancelado entretanto"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = (1 - self._tokens) / self.rate
+            if cancelled is None:
+                time.sleep(wait)
+            elif cancelled.wait(wait):
+                return False
+
+
+class _ResultRecorder:
+    """Acumula os resultados dos workers e grava-os em blocos"""
+
+    def __init__(self, database, flush_size: int = BULK_RESULT_FLUSH_SIZE):
+        self.db = database
+        self.flush_size = flush_size
+        self.sent = 0
+        self.failed = 0
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def add(self, result_id: int, success: bool, error: str = None):
+        with self._lock:
+            self._pending.append((result_id, success, error))
+            if success:
+                self.sent += 1
+            else:
+                self.failed += 1
+            if len(self._pending) < self.flush_size:
+                return
+            results, self._pending = self._pending, []
+        self.db.record_bulk_results(results)
+
+    def flush(self):
+        with self._lock:
+            results, self._pending = self._pending, []
+        self.db.record_bulk_results(results)
+
+
+class BulkNotifier:
+    """Envios em massa para as reservas ativas"""
+
+    def __init__(self, database, service=None, email_rate: float = BULK_EMAIL_RATE,
+                 sms_rate: float = BULK_SMS_RATE):
+        self.db = database
+        self.service = service or notification_service
+        self.email_rate = email_rate
+        self.sms_rate = sms_rate
+        self._cancelled = {}
+        self._lock = threading.Lock()
+
+    def notify_overstay(self, hours: float, subject: str, body: str, sms_body: str,
+                        channels=('email', 'sms'), wait: bool = False) -> dict:
+        """Notifica quem tem uma reserva ativa há mais de `hours` horas"""
+        recipients = self.db.get_notification_recipients(older_than_hours=hours)
+        return self.send('overstay', recipients, subject, body, sms_body, channels, wait)
+
+    def notify_all_active(self, subject: str, body: str, sms_body: str,
+                          channels=('email', 'sms'), wait: bool = False) -> dict:
+        """Notifica todos os utilizadores com reserva ativa (ex.: encerramento do local)"""
+        recipients = self.db.get_notification_recipients()
+        return self.send('all_active', recipients, subject, body, sms_body, channels, wait)
+
+    def send(self, kind: str, recipients: list, subject: str, body: str, sms_body: str,
+             channels=('email', 'sms'), wait: bool = False) -> dict:
+        """
+        Envia subject/body (email) e sms_body (SMS) a cada destinatário
+
+        Os textos podem usar {customer}, {locker} e {booking_time}.
+
+        Returns:
+            dict: {'success', 'bulk_id', 'total'} - com wait=False o envio
+            continua em segundo plano (ver get_status)
+        """
+        try:
+            templates = {
+                'subject': CompiledTemplate(subject),
+                'body': CompiledTemplate(body),
+                'sms_body': CompiledTemplate(sms_body)
+            }
+        except ValueError as e:
+            return {'success': False, 'error': str(e)}
+        unknown = {field for template in templates.values() for _, field in template.fields} - BULK_TEMPLATE_FIELDS
+        if unknown:
+            return {'success': False, 'error': f"Campos desconhecidos: {', '.join(sorted(unknown))}"}
+
+        messages = []
+        for recipient in recipients:
+            if 'email' in channels and recipient.get('email'):
+                messages.append(dict(recipient, channel='email', recipient=recipient['email']))
+            if 'sms' in channels and recipient.get('phone'):
+                messages.append(dict(recipient, channel='sms',
+                                     recipient=self.service.format_phone(recipient['phone'])))
+
+        created = self.db.create_bulk_notification(kind, subject, body, sms_body, messages)
+        if not created:
+            return {'success': False, 'error': 'Não foi possível registar o envio'}
+        bulk_id = created['bulk_id']
+        for message, result_id in zip(messages, created['result_ids']):
+            message['result_id'] = result_id
+
+        print(f"📣 Envio em massa {bulk_id} ({kind}): {len(messages)} mensagens")
+        cancelled = threading.Event()
+        with self._lock:
+            self._cancelled[bulk_id] = cancelled
+
+        if wait:
+            self._run(bulk_id, messages, templates, cancelled)
+        else:
+            threading.Thread(target=self._run, args=(bulk_id, messages, templates, cancelled),
+                             name=f'bulk-notify-{bulk_id}', daemon=True).start()
+        return {'success': True, 'bulk_id': bulk_id, 'total': len(messages)}
+
+    def cancel(self, bulk_id: int) -> bool:
+        """Para um envio em curso (o que ainda não saiu fica 'failed')"""
+        with self._lock:
+            cancelled = self._cancelled.get(bulk_id)
+        if cancelled is None:
+            return False
+        cancelled.set()
+        return True
+
+    def get_status(self, bulk_id: int, include_results: bool = False):
+        """Estado do envio e contagens por destinatário (ver database.get_bulk_notification)"""
+        return self.db.get_bulk_notification(bulk_id, include_results)
+
+    # ============================================
+    # WORKERS
+    # ============================================
+
+    def _run(self, bulk_id: int, messages: list, templates: dict, cancelled: threading.Event):
+        recorder = _ResultRecorder(self.db)
+        limits = {
+            'email': TokenBucket(self.email_rate),
+            'sms': TokenBucket(self.sms_rate)
+        }
+        emails = [message for message in messages if message['channel'] == 'email']
+        sms = [message for message in messages if message['channel'] == 'sms']
+
+        # Um worker de email por sessão SMTP, um de SMS por ligação HTTP
+        email_workers = max(1, self.service.smtp_pool.max_size)
+        sms_workers = max(1, self.service.http.pool_size)
+        try:
+            with ThreadPoolExecutor(max_workers=email_workers, thread_name_prefix='bulk-email') as email_pool, \
+                    ThreadPoolExecutor(max_workers=sms_workers, thread_name_prefix='bulk-sms') as sms_pool:
+                for start in range(0, len(emails), EMAIL_BATCH_SIZE):
+                    email_pool.submit(self._deliver_batch, emails[start:start + EMAIL_BATCH_SIZE],
+                                      templates, limits['email'], recorder, cancelled)
+                for message in sms:
+                    sms_pool.submit(self._deliver_batch, [message], templates,
+                                    limits['sms'], recorder, cancelled)
+        finally:
+            recorder.flush()
+            status = 'cancelled' if cancelled.is_set() else 'completed'
+            self.db.finish_bulk_notification(bulk_id, status)
+            with self._lock:
+                self._cancelled.pop(bulk_id, None)
+            print(f"📣 Envio em massa {bulk_id} {status}: "
+                  f"{recorder.sent} enviadas, {recorder.failed} falharam")
+
+    def _deliver_batch(self, messages: list, templates: dict, limit: TokenBucket,
+                       recorder: _ResultRecorder, cancelled: threading.Event):
+        if messages[0]['channel'] == 'email' and len(messages) > 1:
+            with self.service.batch():
+                for message in messages:
+                    self._deliver(message, templates, limit, recorder, cancelled)
+        else:
+            for message in messages:
+                self._deliver(message, templates, limit, recorder, cancelled)
+
+    def _deliver(self, message: dict, templates: dict, limit: TokenBucket,
+                 recorder: _ResultRecorder, cancelled: threading.Event):
+        if cancelled.is_set() or not limit.acquire(cancelled):
+            return
+
+        values = {
+            'customer': message.get('name') or message.get('contact') or '',
+            'locker': message.get('locker_number') or '',
+            'booking_time': message.get('booking_time') or ''
+        }
+        error = None
+        try:
+            if message['channel'] == 'email':
+                success = self.service.send_email(message['recipient'], templates['subject'].render(values),
+                                                  templates['body'].render(values))
+            else:
+                success = self.service.send_sms(message['recipient'], templates['sms_body'].render(values))
+            if not success:
+                error = f"envio por {message['channel']} falhou"
+        except Exception as e:
+            success = False
+            error = str(e)
+        recorder.add(message['result_id'], bool(success), error)
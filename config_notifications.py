@@ -82,6 +82,52 @@ def setup_sms_textbelt():
     # notification_service.configure_sms_textbelt(API_KEY)
     # print(f"✅ SMS TextBelt configurado com API key: {API_KEY}")
 
+def setup_http():
+    """
+    Configurar as ligações HTTP aos fornecedores de SMS (Twilio e TextBelt)
+    
+    - Timeouts: um fornecedor lento ou pendurado nunca bloqueia um envio
+    - Pool: ligações keep-alive reutilizadas (sem novo handshake TLS por SMS)
+    - Retry: só falhas de ligação e respostas 429/503, com backoff e jitter
+    """
+    
+    HTTP_CONNECT_TIMEOUT = 5     # segundos para estabelecer a ligação
+    HTTP_READ_TIMEOUT = 15       # segundos à espera da resposta
+    HTTP_POOL_SIZE = 4           # ligações keep-alive por fornecedor
+    HTTP_MAX_RETRIES = 2         # novas tentativas automáticas
+    HTTP_BACKOFF_FACTOR = 0.5    # espera base entre tentativas (s)
+    
+    notification_service.configure_http(
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        read_timeout=HTTP_READ_TIMEOUT,
+        pool_size=HTTP_POOL_SIZE,
+        max_retries=HTTP_MAX_RETRIES,
+        backoff_factor=HTTP_BACKOFF_FACTOR
+    )
+
+def setup_sms_routing():
+    """
+    Configurar a escolha do fornecedor de SMS
+    
+    - Circuit breaker: após várias falhas seguidas o fornecedor é saltado
+      durante algum tempo (os SMS seguem logo pelo outro)
+    - Hedged: se o primeiro fornecedor não responder a tempo, o segundo é
+      lançado em paralelo. Limita a latência, mas o utilizador pode receber
+      o SMS duas vezes - por isso está desligado por omissão
+    """
+    
+    SMS_HEDGED = False               # lançar o 2.º fornecedor se o 1.º demorar
+    SMS_HEDGE_DELAY = 3.0            # espera máxima (s) antes de o lançar
+    SMS_BREAKER_FAILURES = 3         # falhas seguidas que abrem o circuito
+    SMS_BREAKER_RESET = 60           # segundos até voltar a experimentar
+    
+    notification_service.configure_sms_routing(
+        hedged=SMS_HEDGED,
+        hedge_delay=SMS_HEDGE_DELAY,
+        failure_threshold=SMS_BREAKER_FAILURES,
+        reset_timeout=SMS_BREAKER_RESET
+    )
+
 def initialize_notifications():
     """Inicializar todas as configurações de notificação"""
     print("🔧 Configurando sistema de notificações...")
@@ -95,6 +141,12 @@ def initialize_notifications():
     # Configurar SMS TextBelt (fallback gratuito)
     setup_sms_textbelt()
     
+    # Timeouts e pool de ligações HTTP dos fornecedores de SMS
+    setup_http()
+    
+    # Circuit breakers e hedging entre fornecedores de SMS
+    setup_sms_routing()
+    
     print("📬 Sistema de notificações inicializado!")
     return notification_service
 
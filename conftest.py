@@ -0,0 +1,42 @@
+# conftest.py
+# Fixtures partilhadas pelos testes (pytest)
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database import LockerDatabase
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Caminho de uma base de dados nova no diretório temporário do teste"""
+    return str(tmp_path / 'locker_system.db')
+
+
+@pytest.fixture
+def open_database(db_path):
+    """Abre instâncias de LockerDatabase (por defeito em db_path)
+
+    Todas são fechadas no fim do teste, mesmo que este falhe, para não
+    deixar conexões do pool nem a thread watcher abertas.
+    """
+    opened = []
+
+    def factory(path=None, **kwargs):
+        database = LockerDatabase(path or db_path, **kwargs)
+        opened.append(database)
+        return database
+
+    yield factory
+    for database in reversed(opened):
+        database.close()
+
+
+@pytest.fixture
+def db(open_database):
+    """LockerDatabase nova num diretório temporário"""
+    return open_database()
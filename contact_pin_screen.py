@@ -12,12 +12,17 @@ from kivy.uix.popup import Popup
 from kivy.uix.behaviors import ButtonBehavior
 from kivy.clock import Clock
 from translations import translator
-from notification_service import notification_service
-import threading
+from notification_queue import get_notification_dispatcher
 import time
 import random
 from datetime import datetime
 
+# Estado das notificações enquanto a primeira tentativa de envio decorre
+NOTIFICATIONS_PENDING = {'email': None, 'sms': None}
+
+# Tempo máximo (s) a acompanhar a porta depois de abrir o cacifo
+LOCKER_MONITORING_TIMEOUT = 300
+
 
 class ImageButton(ButtonBehavior, AsyncImage):
     """Botão clicável que usa uma imagem"""
@@ -507,38 +512,16 @@ class ContactPinScreen(Screen):
             db = self.manager.gpio_controller.db
         
         if db:
-            # Try to book the locker in the database - PIN será gerado automaticamente
-            success = db.book_locker(selected_locker, contact, user_data=user_data)
+            # Reservar no pool de workers - o hash do PIN (PBKDF2) não pode
+            # congelar o ecrã tátil. O resultado volta à thread da UI via Clock.
+            self.confirm_button.disabled = True
             
-            if success and success.get('success', False):
-                # Obter PIN gerado automaticamente
-                generated_pin = success.get('pin', '0000')
-                
-                # Open the locker physically with 20ms pulse
-                if self.manager.gpio_controller:
-                    unlock_success = self.manager.gpio_controller.pulse_locker_unlock(selected_locker, 0.02)
-                    if unlock_success:
-                        print(f'Locker {selected_locker} opened with 20ms pulse! Generated PIN: {generated_pin}')
-                    else:
-                        print(f'Error sending pulse to locker {selected_locker}')
-                
-                # 🔔 ENVIAR NOTIFICAÇÕES COM PIN
-                print(f"📧📱 Enviando notificações para {user_data['name']}...")
-                notification_results = notification_service.send_pin_notification(
-                    user_data=user_data,
-                    locker_number=selected_locker,
-                    pin=generated_pin,
-                    notification_methods=['email', 'sms']
+            def on_booking_done(result):
+                Clock.schedule_once(
+                    lambda dt: self.on_booking_result(result, selected_locker, contact, user_data), 0
                 )
-                
-                print(f"📧 Email: {'✅ Enviado' if notification_results['email'] else '❌ Falhou'}")
-                print(f"📱 SMS: {'✅ Enviado' if notification_results['sms'] else '❌ Falhou'}")
-                
-                # Show success popup with generated PIN and notification status
-                self.show_success_popup(selected_locker, contact, generated_pin, notification_results)
-            else:
-                error_msg = success.get('message', f'Error booking locker {selected_locker}') if success else f'Error booking locker {selected_locker}'
-                self.show_error_popup(error_msg)
+            
+            db.book_locker_async(selected_locker, contact, user_data=user_data, callback=on_booking_done)
         else:
             # Fallback to simulation mode - usar sistema automático de PIN da database
             if hasattr(self.manager, 'gpio_controller') and self.manager.gpio_controller and self.manager.gpio_controller.db:
@@ -554,20 +537,11 @@ class ContactPinScreen(Screen):
                         self.manager.gpio_controller.pulse_locker_unlock(selected_locker, 0.02)
                         print(f'20ms pulse sent to locker {selected_locker} (simulation mode)')
                     
-                    # 🔔 ENVIAR NOTIFICAÇÕES COM PIN (modo simulação)
-                    print(f"📧📱 Enviando notificações para {user_data['name']} (simulação)...")
-                    notification_results = notification_service.send_pin_notification(
-                        user_data=user_data,
-                        locker_number=selected_locker,
-                        pin=generated_pin,
-                        notification_methods=['email', 'sms']
-                    )
-                    
-                    print(f"📧 Email: {'✅ Enviado' if notification_results['email'] else '❌ Falhou'}")
-                    print(f"📱 SMS: {'✅ Enviado' if notification_results['sms'] else '❌ Falhou'}")
+                    # 🔔 ENVIAR NOTIFICAÇÕES COM PIN (modo simulação, em segundo plano)
+                    self.queue_notifications(selected_locker, generated_pin, user_data, success.get('booking_id'))
                     
                     # Show success popup
-                    self.show_success_popup(selected_locker, contact, generated_pin, notification_results)
+                    self.show_success_popup(selected_locker, contact, generated_pin, NOTIFICATIONS_PENDING)
                 else:
                     error_msg = success.get('message', f'Error booking locker {selected_locker}') if success else f'Error booking locker {selected_locker}'
                     self.show_error_popup(error_msg)
@@ -582,52 +556,72 @@ class ContactPinScreen(Screen):
                     self.manager.gpio_controller.pulse_locker_unlock(selected_locker, 0.02)
                     print(f'20ms pulse sent to locker {selected_locker} (full simulation mode)')
                 
-                # 🔔 ENVIAR NOTIFICAÇÕES COM PIN (simulação completa)
-                print(f"📧📱 Enviando notificações para {user_data['name']} (simulação completa)...")
-                notification_results = notification_service.send_pin_notification(
-                    user_data=user_data,
-                    locker_number=selected_locker,
-                    pin=generated_pin,
-                    notification_methods=['email', 'sms']
-                )
-                
-                print(f"📧 Email: {'✅ Enviado' if notification_results['email'] else '❌ Falhou'}")
-                print(f"📱 SMS: {'✅ Enviado' if notification_results['sms'] else '❌ Falhou'}")
+                # 🔔 ENVIAR NOTIFICAÇÕES COM PIN (simulação completa, em segundo plano)
+                self.queue_notifications(selected_locker, generated_pin, user_data)
                 
                 # Show success popup
-                self.show_success_popup(selected_locker, contact, generated_pin, notification_results)
+                self.show_success_popup(selected_locker, contact, generated_pin, NOTIFICATIONS_PENDING)
     
-    def show_success_popup(self, locker_number, contact, pin, notification_results=None):
-        """Show confirmation popup with real-time monitoring"""
+    def on_booking_result(self, success, selected_locker, contact, user_data):
+        """Called on the UI thread when the background booking finishes"""
+        self.confirm_button.disabled = False
         
-        # Popup layout
-        popup_layout = BoxLayout(orientation='vertical', padding=dp(20), spacing=dp(15))
+        if success and success.get('success', False):
+            # Obter PIN gerado automaticamente
+            generated_pin = success.get('pin', '0000')
+            
+            # Open the locker physically with 20ms pulse
+            if self.manager.gpio_controller:
+                unlock_success = self.manager.gpio_controller.pulse_locker_unlock(selected_locker, 0.02)
+                if unlock_success:
+                    print(f'Locker {selected_locker} opened with 20ms pulse! Generated PIN: {generated_pin}')
+                else:
+                    print(f'Error sending pulse to locker {selected_locker}')
+            
+            # 🔔 ENVIAR NOTIFICAÇÕES COM PIN (em segundo plano - o popup abre já)
+            self.queue_notifications(selected_locker, generated_pin, user_data, success.get('booking_id'))
+            
+            # Show success popup with generated PIN; notification status arrives later
+            self.show_success_popup(selected_locker, contact, generated_pin, NOTIFICATIONS_PENDING)
+        else:
+            error_msg = success.get('message', f'Error booking locker {selected_locker}') if success else f'Error booking locker {selected_locker}'
+            self.show_error_popup(error_msg)
+    
+    def queue_notifications(self, locker_number, pin, user_data, booking_id=None):
+        """Guarda as notificações com PIN na fila de envio (não bloqueia a UI)
         
-        # Success title
-        self.title_label = Label(
-            text=f'[color=2ECC40][b]✅ Locker {locker_number} Opened![/b][/color]',
-            markup=True,
-            font_size='24sp',
-            size_hint_y=None,
-            height=dp(40),
-            halign='center'
-        )
-        self.title_label.bind(size=lambda instance, value: setattr(instance, 'text_size', (instance.width, None)))
-        popup_layout.add_widget(self.title_label)
+        O resultado da primeira tentativa volta à thread da UI via Clock e
+        atualiza o popup; falhas continuam a ser repetidas em segundo plano.
+        """
+        print(f"📧📱 Enviando notificações para {user_data['name']} (em segundo plano)...")
         
-        # Real-time status
-        self.status_label = Label(
-            text='[color=FF851B][b]🔓 LOCKER OPEN - WAITING FOR CLOSURE[/b][/color]',
-            markup=True,
-            font_size='18sp',
-            size_hint_y=None,
-            height=dp(40),
-            halign='center'
-        )
-        self.status_label.bind(size=lambda instance, value: setattr(instance, 'text_size', (instance.width, None)))
-        popup_layout.add_widget(self.status_label)
+        db = None
+        if hasattr(self.manager, 'gpio_controller') and self.manager.gpio_controller:
+            db = self.manager.gpio_controller.db
         
-        # Booking information
+        def on_sent(results):
+            Clock.schedule_once(lambda dt: self.on_notification_result(results), 0)
+        
+        get_notification_dispatcher(db).queue_pin_notification(
+            user_data=user_data,
+            locker_number=locker_number,
+            pin=pin,
+            notification_methods=['email', 'sms'],
+            callback=on_sent,
+            booking_id=booking_id
+        )
+    
+    def on_notification_result(self, notification_results):
+        """Called on the UI thread after the first delivery attempt"""
+        print(f"📧 Email: {'✅ Enviado' if notification_results['email'] else '❌ Falhou'}")
+        print(f"📱 SMS: {'✅ Enviado' if notification_results['sms'] else '❌ Falhou'}")
+        
+        # Atualizar o popup, se ainda estiver aberto
+        if getattr(self, 'info_label', None) and getattr(self, 'booking_details', None):
+            self.info_label.text = self.booking_info_text(*self.booking_details, notification_results)
+    
+    def booking_info_text(self, locker_number, contact, pin, notification_results=None):
+        """Texto do popup de sucesso (detalhes, estado das notificações e instruções)"""
         info_text = f'''[b]Booking Details:[/b]
         
 • Locker: {locker_number}
@@ -637,22 +631,37 @@ class ContactPinScreen(Screen):
         # Adicionar status das notificações se disponível
         if notification_results:
             info_text += f"\n\n[b]📬 Notifications:[/b]"
+            retrying = notification_results.get('retrying', [])
+            unconfigured = notification_results.get('unconfigured', [])
             
             # Status do email
-            if notification_results.get('email'):
+            if notification_results.get('email') is None:
+                info_text += f"\n• 📧 Email: [color=AAAAAA][b]⏳ Sending...[/b][/color]"
+            elif notification_results.get('email'):
                 info_text += f"\n• 📧 Email: [color=2ECC40][b]✅ Sent[/b][/color]"
-            else:
+            elif 'email' in retrying:
+                info_text += f"\n• 📧 Email: [color=FF851B][b]🔁 Retrying[/b][/color]"
+            elif 'email' in unconfigured:
                 info_text += f"\n• 📧 Email: [color=FF851B][b]⚠️ Not configured[/b][/color]"
+            else:
+                info_text += f"\n• 📧 Email: [color=FF851B][b]⚠️ Delivery failed[/b][/color]"
             
             # Status do SMS
-            if notification_results.get('sms'):
+            if notification_results.get('sms') is None:
+                info_text += f"\n• 📱 SMS: [color=AAAAAA][b]⏳ Sending...[/b][/color]"
+            elif notification_results.get('sms'):
                 info_text += f"\n• 📱 SMS: [color=2ECC40][b]✅ Sent[/b][/color]"
+            elif 'sms' in retrying:
+                info_text += f"\n• 📱 SMS: [color=FF851B][b]🔁 Retrying[/b][/color]"
+            elif 'sms' in unconfigured:
+                info_text += f"\n• 📱 SMS: [color=FF851B][b]⚠️ Not configured[/b][/color]"
             else:
                 info_text += f"\n• 📱 SMS: [color=FF851B][b]⚠️ Service unavailable[/b][/color]"
             
-            # Adicionar nota sobre configuração
-            info_text += f"\n\n[color=AAAAAA][size=12sp]💡 To enable notifications:[/size][/color]"
-            info_text += f"\n[color=AAAAAA][size=12sp]Configure email/SMS in config_notifications.py[/size][/color]"
+            # Adicionar nota sobre configuração (só se falta configurar algum canal)
+            if unconfigured:
+                info_text += f"\n\n[color=AAAAAA][size=12sp]💡 To enable notifications:[/size][/color]"
+                info_text += f"\n[color=AAAAAA][size=12sp]Configure email/SMS in config_notifications.py[/size][/color]"
         
         info_text += f'''
 
@@ -664,6 +673,41 @@ class ContactPinScreen(Screen):
 
 [color=AAAAAA]This popup will close automatically 
 when the locker is closed[/color]'''
+        return info_text
+    
+    def show_success_popup(self, locker_number, contact, pin, notification_results=None):
+        """Show confirmation popup with real-time monitoring"""
+        
+        # Popup layout
+        popup_layout = BoxLayout(orientation='vertical', padding=dp(20), spacing=dp(15))
+        
+        # Success title
+        self.title_label = Label(
+            text=f'[color=2ECC40][b]✅ Locker {locker_number} Opened![/b][/color]',
+            markup=True,
+            font_size='24sp',
+            size_hint_y=None,
+            height=dp(40),
+            halign='center'
+        )
+        self.title_label.bind(size=lambda instance, value: setattr(instance, 'text_size', (instance.width, None)))
+        popup_layout.add_widget(self.title_label)
+        
+        # Real-time status
+        self.status_label = Label(
+            text='[color=FF851B][b]🔓 LOCKER OPEN - WAITING FOR CLOSURE[/b][/color]',
+            markup=True,
+            font_size='18sp',
+            size_hint_y=None,
+            height=dp(40),
+            halign='center'
+        )
+        self.status_label.bind(size=lambda instance, value: setattr(instance, 'text_size', (instance.width, None)))
+        popup_layout.add_widget(self.status_label)
+        
+        # Booking information
+        self.booking_details = (locker_number, contact, pin)
+        info_text = self.booking_info_text(locker_number, contact, pin, notification_results)
         
         self.info_label = Label(
             text=info_text,
@@ -693,7 +737,7 @@ when the locker is closed[/color]'''
         
         # Function to close popup manually
         def manual_close(button_instance):
-            self.stop_monitoring = True
+            self.stop_locker_monitoring()
             self.monitoring_popup.dismiss()
             if self.manager:
                 self.manager.current = 'home'
@@ -713,51 +757,77 @@ when the locker is closed[/color]'''
         self.start_locker_monitoring(locker_number)
     
     def start_locker_monitoring(self, locker_number):
-        """Start real-time locker status monitoring"""
+        """Start real-time locker status monitoring
+        
+        O fecho da porta chega como evento do DoorEventMonitor (sem ler o
+        GPIO periodicamente); o relógio só atualiza o tempo decorrido. O pin
+        é lido diretamente no início e, sem DoorEventMonitor, a cada tique.
+        """
+        self.monitoring_gpio = getattr(self.manager, 'gpio_controller', None)
+        self.door_monitor = getattr(self.monitoring_gpio, 'door_monitor', None)
+        
+        if not self.monitoring_gpio:
+            # Sem GPIO não há porta para acompanhar - fecho manual, sem limite de tempo
+            self.stop_locker_monitoring()
+            if hasattr(self, 'status_label') and self.status_label:
+                self.status_label.text = '[color=FF851B][b]🔓 LOCKER OPEN - DOOR SENSOR UNAVAILABLE[/b][/color]'
+            return
         
-        def monitor_locker():
-            """Function that runs in separate thread to monitor the locker"""
-            
-            check_interval = 1.0  # Check every 1 second
-            max_monitoring_time = 300  # 5 minutes maximum
-            
-            while not self.stop_monitoring:
-                try:
-                    current_time = time.time()
-                    elapsed_time = current_time - self.popup_start_time
-                    
-                    # Stop monitoring after maximum time
-                    if elapsed_time > max_monitoring_time:
-                        Clock.schedule_once(lambda dt: self.timeout_monitoring(), 0)
-                        break
-                    
-                    # Check locker status
-                    if hasattr(self.manager, 'gpio_controller') and self.manager.gpio_controller:
-                        # Check if the locker was physically closed
-                        is_occupied = self.manager.gpio_controller.is_locker_occupied(locker_number)
-                        
-                        if not is_occupied:
-                            # Locker was closed!
-                            Clock.schedule_once(lambda dt: self.on_locker_closed(), 0)
-                            break
-                        else:
-                            # Locker still open, update status
-                            elapsed_minutes = int(elapsed_time // 60)
-                            elapsed_seconds = int(elapsed_time % 60)
-                            Clock.schedule_once(
-                                lambda dt: self.update_status_open(elapsed_minutes, elapsed_seconds), 0
-                            )
-                    
-                    time.sleep(check_interval)
-                    
-                except Exception as e:
-                    print(f"Monitoring error: {e}")
-                    Clock.schedule_once(lambda dt: self.on_monitoring_error(str(e)), 0)
-                    break
-        
-        # Start monitoring thread
-        monitoring_thread = threading.Thread(target=monitor_locker, daemon=True)
-        monitoring_thread.start()
+        def on_door_event(event_locker, is_open):
+            # Evento chega na thread do GPIO - tratar na thread da UI
+            if not is_open:
+                Clock.schedule_once(lambda dt: self.on_door_closed(), 0)
+        
+        self.door_event_callback = on_door_event
+        if self.door_monitor:
+            self.door_monitor.subscribe(on_door_event, locker_number)
+        
+        # Porta já fechada (ou fechada antes de subscrever) não gera flanco:
+        # ler o pin agora. Não usar door_monitor.is_open - só é atualizado
+        # depois do debounce e o pulso de abertura foi enviado há instantes
+        if not self.monitoring_gpio.is_locker_occupied(locker_number):
+            self.on_door_closed()
+            return
+        
+        self.monitoring_clock = Clock.schedule_interval(self.update_monitoring_time, 1.0)
+        self.update_monitoring_time(0)
+    
+    def stop_locker_monitoring(self):
+        """Deixa de receber eventos da porta e para o relógio do popup"""
+        self.stop_monitoring = True
+        if getattr(self, 'door_monitor', None) and getattr(self, 'door_event_callback', None):
+            self.door_monitor.unsubscribe(self.door_event_callback)
+        self.door_event_callback = None
+        if getattr(self, 'monitoring_clock', None):
+            self.monitoring_clock.cancel()
+            self.monitoring_clock = None
+    
+    def update_monitoring_time(self, dt):
+        """Atualiza o tempo com a porta aberta (Clock, uma vez por segundo)"""
+        if self.stop_monitoring:
+            return False
+        
+        elapsed_time = time.time() - self.popup_start_time
+        
+        # Stop monitoring after maximum time
+        if elapsed_time > LOCKER_MONITORING_TIMEOUT:
+            self.stop_locker_monitoring()
+            self.timeout_monitoring()
+            return False
+        
+        # Sem DoorEventMonitor não há eventos - ler o pin
+        if not self.door_monitor and not self.monitoring_gpio.is_locker_occupied(self.monitoring_locker):
+            self.on_door_closed()
+            return False
+        
+        self.update_status_open(int(elapsed_time // 60), int(elapsed_time % 60))
+    
+    def on_door_closed(self):
+        """Evento de fecho da porta do cacifo monitorizado"""
+        if self.stop_monitoring:
+            return
+        self.stop_locker_monitoring()
+        self.on_locker_closed()
     
     def update_status_open(self, minutes, seconds):
         """Update status when locker is still open"""
@@ -800,12 +870,6 @@ when the locker is closed[/color]'''
         # Close popup automatically after 2 seconds
         Clock.schedule_once(lambda dt: self.auto_close_popup(), 2.0)
     
-    def on_monitoring_error(self, error_message):
-        """Called when there's a monitoring error"""
-        
-        if hasattr(self, 'status_label') and self.status_label:
-            self.status_label.text = f'[color=FF4136][b]❌ ERROR: {error_message}[/b][/color]'
-    
     def timeout_monitoring(self):
         """Called when monitoring reaches time limit"""
         
@@ -819,7 +883,7 @@ when the locker is closed[/color]'''
     def auto_close_popup(self):
         """Close popup automatically"""
         
-        self.stop_monitoring = True
+        self.stop_locker_monitoring()
         if hasattr(self, 'monitoring_popup') and self.monitoring_popup:
             self.monitoring_popup.dismiss()
         
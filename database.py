@@ -1,24 +1,121 @@
 import sqlite3
-import hashlib
+import base64
 import datetime
+import json
 import os
 import threading
 import time
 import random
+import re
 from typing import Optional, List, Dict
+from pin_hashing import hash_pin, verify_pin, submit_pin_task
 
-class LockerDatabase:
-    def __init__(self, db_path="locker_system.db"):
-        """Inicializa a base de dados SQLite com melhor gestão de locks"""
-        self.db_path = db_path
-        self.lock = threading.Lock()
-        self.timeout = 10.0  # 10 segundos de timeout
-        self.init_database()
+# Estados de uma reserva que ainda ocupa o cacifo (espelhados em active_bookings)
+ACTIVE_BOOKING_STATUSES = ('booked', 'active', 'unlocked')
+
+# Colunas devolvidas pelas consultas de reservas (ver _row_to_booking)
+BOOKING_COLUMNS = '''
+    b.id, b.locker_number, b.contact, b.name, b.email, b.phone, b.birth_date, b.status,
+    b.booking_time, b.unlock_time, b.return_time, b.notes, b.pin_display
+'''
+
+# Paginação por cursor (keyset em booking_time, id) das listagens de reservas
+BOOKING_PAGE_SIZE = 50
+MAX_BOOKING_PAGE_SIZE = 500
+
+# Intervalo máximo (s) entre verificações de change_events pelo watcher
+CHANGE_POLL_INTERVAL = 0.5
+
+# Eventos de alteração guardados (só servem para reconexões recentes) e
+# intervalo (s) entre limpezas feitas pelo watcher
+CHANGE_EVENTS_RETENTION_HOURS = 24
+CHANGE_PRUNE_INTERVAL = 3600
+
+# Prefixo internacional ignorado na pesquisa por telefone
+PHONE_COUNTRY_PREFIX = '351'
+
+# Tentativas de envio de uma notificação antes de ficar 'failed'
+NOTIFICATION_MAX_ATTEMPTS = 5
+
+
+def _row_to_booking(row) -> Dict:
+    """Converte uma linha com BOOKING_COLUMNS num dicionário de reserva"""
+    return {
+        'id': row[0],
+        'locker_number': row[1],
+        'contact': row[2],
+        'name': row[3],
+        'email': row[4],
+        'phone': row[5],
+        'birth_date': row[6],
+        'status': row[7],
+        'booking_time': row[8],
+        'unlock_time': row[9],
+        'return_time': row[10],
+        'notes': row[11],
+        'pin': row[12]
+    }
+
+
+def normalize_phone(phone: str) -> str:
+    """Normaliza um telefone para pesquisa: sem espaços/separadores nem +351
     
-    def _get_connection(self):
+    Tem de corresponder à expressão SQL usada nos triggers de bookings_fts.
+    """
+    digits = re.sub(r'[ \-().]', '', phone or '')
+    if digits.startswith('+' + PHONE_COUNTRY_PREFIX):
+        return digits[len(PHONE_COUNTRY_PREFIX) + 1:]
+    if digits.startswith('00' + PHONE_COUNTRY_PREFIX):
+        return digits[len(PHONE_COUNTRY_PREFIX) + 2:]
+    return digits.replace('+', '')
+
+
+def encode_booking_cursor(booking_time: str, booking_id: int) -> str:
+    """Cursor opaco que aponta para a última reserva de uma página"""
+    raw = f'{booking_time or ""}|{booking_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_booking_cursor(cursor: str) -> tuple:
+    """Inverso de encode_booking_cursor - levanta ValueError se for inválido"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        booking_time, booking_id = base64.urlsafe_b64decode(padded).decode().rsplit('|', 1)
+        return booking_time, int(booking_id)
+    except Exception:
+        raise ValueError(f"Cursor inválido: {cursor!r}")
+
+
+def _escape_like(text: str) -> str:
+    """Escapa os caracteres especiais de LIKE (usar com ESCAPE '\\')"""
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class ConnectionPool:
+    """Pool de conexões SQLite reutilizáveis, partilhado entre threads
+
+    As conexões são criadas com check_same_thread=False, por isso podem ser
+    usadas por qualquer thread - o pool garante apenas que cada conexão está
+    emprestada a um único utilizador de cada vez. Os PRAGMAs são aplicados
+    uma única vez, quando a conexão é criada.
+    """
+
+    def __init__(self, db_path: str, max_size: int = 4, timeout: float = 10.0):
+        self.db_path = db_path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = []  # Conexões livres (LIFO - a mais recente fica "quente")
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._hits = 0
+        self._misses = 0
+        self._created = 0
+        self._discarded = 0
+
+    def _create_connection(self):
         """Cria conexão com timeout e configurações otimizadas"""
         conn = sqlite3.connect(
-            self.db_path, 
+            self.db_path,
             timeout=self.timeout,
             check_same_thread=False
         )
@@ -28,83 +125,153 @@ class LockerDatabase:
         conn.execute('PRAGMA temp_store=MEMORY')
         conn.execute('PRAGMA mmap_size=268435456')  # 256MB
         return conn
+
+    def acquire(self):
+        """Empresta uma conexão do pool (cria uma nova se não houver livres)"""
+        with self._lock:
+            self._in_use += 1
+            if self._idle:
+                self._hits += 1
+                return self._idle.pop()
+            self._misses += 1
+            self._created += 1
+        try:
+            return self._create_connection()
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+            raise
+
+    def release(self, conn):
+        """Devolve uma conexão ao pool (fecha-a se o pool já estiver cheio)"""
+        try:
+            # Nunca devolver uma transação pendente ao próximo utilizador
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Conexão num estado inválido - descartar
+            with self._lock:
+                self._in_use -= 1
+                self._discarded += 1
+            conn.close()
+            return
+
+        with self._lock:
+            self._in_use -= 1
+            if len(self._idle) < self.max_size:
+                self._idle.append(conn)
+                return
+            self._discarded += 1
+        conn.close()
+
+    def resize(self, max_size: int):
+        """Altera o número máximo de conexões livres guardadas"""
+        with self._lock:
+            self.max_size = max_size
+            extra = self._idle[max_size:]
+            del self._idle[max_size:]
+            self._discarded += len(extra)
+        for conn in extra:
+            conn.close()
+
+    def discard_after_fork(self):
+        """Esquece as conexões herdadas do processo pai (após os.fork)
+        
+        Uma conexão SQLite não pode ser usada em dois processos, por isso o
+        processo filho recomeça com o pool vazio.
+        """
+        self._lock = threading.Lock()
+        self._idle = []
+        self._in_use = 0
+
+    def close_all(self):
+        """Fecha todas as conexões livres (as emprestadas fecham ao ser devolvidas)"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self) -> Dict:
+        """Métricas do pool: tamanho, conexões em uso e taxa de reutilização"""
+        with self._lock:
+            requests = self._hits + self._misses
+            return {
+                'max_size': self.max_size,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'hits': self._hits,
+                'misses': self._misses,
+                'created': self._created,
+                'discarded': self._discarded,
+                'hit_rate': round(self._hits / requests, 3) if requests else 0.0
+            }
+
+
+class LockerDatabase:
+    def __init__(self, db_path="locker_system.db", pool_size=4):
+        """Inicializa a base de dados SQLite com melhor gestão de locks"""
+        self.db_path = db_path
+        self.lock = threading.Lock()  # Serializa apenas as escritas (leituras correm em paralelo com WAL)
+        self.timeout = 10.0  # 10 segundos de timeout
+        self.pool = ConnectionPool(db_path, max_size=pool_size, timeout=self.timeout)
+        self.fts_enabled = False
+        
+        # Notificação de alterações (ver add_change_listener)
+        self._change_listeners = []
+        self._change_listeners_lock = threading.Lock()
+        self._changes_pending = threading.Event()
+        self._watcher_stop = threading.Event()
+        self._watcher_thread = None
+        
+        self.init_database()
+    
+    def _get_connection(self):
+        """Obtém uma conexão do pool (devolver com _release_connection)"""
+        return self.pool.acquire()
+    
+    def _release_connection(self, conn):
+        """Devolve a conexão ao pool em vez de a fechar"""
+        self.pool.release(conn)
+    
+    def get_pool_stats(self) -> Dict:
+        """Métricas do pool de conexões (tamanho, hits/misses)"""
+        return self.pool.stats()
+    
+    def reset_after_fork(self):
+        """Prepara a instância para um processo filho (ex.: worker do gunicorn)
+        
+        Descarta as conexões herdadas e o watcher de alterações, que não
+        sobrevivem ao fork; voltam a ser criados quando forem precisos.
+        """
+        self.pool.discard_after_fork()
+        self.lock = threading.Lock()
+        self._change_listeners_lock = threading.Lock()
+        self._change_listeners = []
+        self._changes_pending = threading.Event()
+        self._watcher_stop = threading.Event()
+        self._watcher_thread = None
+    
+    def close(self):
+        """Pára o watcher de alterações e fecha todas as conexões do pool"""
+        self._watcher_stop.set()
+        self._changes_pending.set()
+        if self._watcher_thread is not None:
+            self._watcher_thread.join(timeout=2)
+            self._watcher_thread = None
+        self.pool.close_all()
     
     def init_database(self):
-        """Cria as tabelas se não existirem"""
+        """Cria/atualiza o schema (migrações pendentes) e os cacifos padrão"""
         with self.lock:
             try:
                 conn = self._get_connection()
-                cursor = conn.cursor()
-                
-                # Tabela para os cacifos
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS lockers (
-                        locker_number TEXT PRIMARY KEY,
-                        status TEXT NOT NULL DEFAULT 'available',
-                        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
-                    )
-                ''')
-                
-                # Tabela para reservas/utilizações (estrutura atualizada com dados de contacto separados)
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS bookings (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        locker_number TEXT NOT NULL,
-                        contact TEXT NOT NULL,
-                        name TEXT,
-                        email TEXT,
-                        phone TEXT,
-                        birth_date TEXT,
-                        pin_hash TEXT NOT NULL,
-                        pin_salt TEXT NOT NULL,
-                        status TEXT NOT NULL DEFAULT 'active',
-                        booking_time DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        unlock_time DATETIME,
-                        return_time DATETIME,
-                        notes TEXT,
-                        pin_display TEXT,
-                        FOREIGN KEY (locker_number) REFERENCES lockers (locker_number)
-                    )
-                ''')
+                self._apply_migrations(conn)
                 
-                # Migração: Adicionar colunas se não existirem (para bases de dados existentes)
-                try:
-                    cursor.execute("ALTER TABLE bookings ADD COLUMN name TEXT")
-                except sqlite3.OperationalError:
-                    pass  # Coluna já existe
+                cursor = conn.cursor()
                 
-                try:
-                    cursor.execute("ALTER TABLE bookings ADD COLUMN email TEXT")
-                except sqlite3.OperationalError:
-                    pass  # Coluna já existe
-                    
-                try:
-                    cursor.execute("ALTER TABLE bookings ADD COLUMN phone TEXT")
-                except sqlite3.OperationalError:
-                    pass  # Coluna já existe
-                    
-                try:
-                    cursor.execute("ALTER TABLE bookings ADD COLUMN birth_date TEXT")
-                except sqlite3.OperationalError:
-                    pass  # Coluna já existe
-                    
-                try:
-                    cursor.execute("ALTER TABLE bookings ADD COLUMN pin_display TEXT")
-                except sqlite3.OperationalError:
-                    pass  # Coluna já existe
-                
-                # Tabela para logs do sistema
-                cursor.execute('''
-                    CREATE TABLE IF NOT EXISTS system_logs (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        locker_number TEXT,
-                        action TEXT NOT NULL,
-                        details TEXT,
-                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                        gpio_state TEXT
-                    )
-                ''')
+                # Índice full-text disponível? (requer FTS5 com tokenizer trigram)
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'bookings_fts'")
+                self.fts_enabled = cursor.fetchone() is not None
                 
                 # Inserir cacifos padrão se não existirem
                 lockers = ['001', '002', '003', '004']
@@ -122,14 +289,95 @@ class LockerDatabase:
                 time.sleep(0.1)  # Pequena pausa antes de tentar novamente
             finally:
                 if 'conn' in locals():
-                    conn.close()
+                    self._release_connection(conn)
+    
+    def _apply_migrations(self, conn):
+        """Aplica por ordem as migrações de SCHEMA_MIGRATIONS ainda não aplicadas
+        
+        A versão atual fica em PRAGMA user_version (leitura instantânea no
+        arranque) e o histórico na tabela schema_version. Cada migração corre
+        numa transação própria, juntamente com a atualização da versão.
+        """
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        conn.commit()
+        
+        current_version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        if current_version >= SCHEMA_VERSION:
+            return
+        
+        for version, description, migration in SCHEMA_MIGRATIONS:
+            if version <= current_version:
+                continue
+            
+            try:
+                cursor.execute('BEGIN IMMEDIATE')
+                # Outro processo pode ter migrado enquanto esperávamos pelo lock
+                if cursor.execute('PRAGMA user_version').fetchone()[0] >= version:
+                    conn.rollback()
+                    continue
+                
+                migration(cursor)
+                cursor.execute('''
+                    INSERT OR REPLACE INTO schema_version (version, description)
+                    VALUES (?, ?)
+                ''', (version, description))
+                cursor.execute(f'PRAGMA user_version = {int(version)}')
+                conn.commit()
+                print(f"Database migration {version} applied: {description}")
+            except Exception:
+                conn.rollback()
+                raise
+    
+    def get_schema_version(self) -> int:
+        """Versão atual do schema (PRAGMA user_version)"""
+        def operation():
+            conn = self._get_connection()
+            try:
+                return conn.execute('PRAGMA user_version').fetchone()[0]
+            finally:
+                self._release_connection(conn)
+        
+        return self._execute_read(operation) or 0
     
-    def _execute_with_retry(self, operation_func, max_retries=3):
-        """Executa operação com retry em caso de lock"""
+    def get_data_version(self) -> tuple:
+        """Versão atual dos dados - devolve (version, updated_at)
+        
+        A versão muda a cada escrita em bookings/lockers (também de outros
+        processos), por isso pode ser usada para validar caches.
+        """
+        def operation():
+            conn = self._get_connection()
+            try:
+                row = conn.execute('SELECT version, updated_at FROM data_version WHERE id = 1').fetchone()
+                return (row[0], row[1]) if row else (0, None)
+            finally:
+                self._release_connection(conn)
+        
+        return self._execute_read(operation) or (0, None)
+    
+    def _execute_with_retry(self, operation_func, max_retries=3, read_only=False):
+        """Executa operação com retry em caso de lock
+        
+        Escritas são serializadas por self.lock. Leituras (read_only=True) não
+        esperam pelo lock: em modo WAL os leitores veem sempre o último commit
+        e nunca bloqueiam nem são bloqueados pelo escritor.
+        """
         for attempt in range(max_retries):
             try:
-                with self.lock:
+                if read_only:
                     return operation_func()
+                with self.lock:
+                    result = operation_func()
+                # Acordar o watcher de alterações sem esperar pelo próximo ciclo
+                self._changes_pending.set()
+                return result
             except sqlite3.OperationalError as e:
                 if "database is locked" in str(e) and attempt < max_retries - 1:
                     print(f"Database locked, retry {attempt + 1}/{max_retries}")
@@ -143,17 +391,27 @@ class LockerDatabase:
                 return None
         return None
     
+    def _execute_read(self, operation_func, max_retries=3):
+        """Executa uma operação só de leitura sem esperar pelo lock de escrita"""
+        return self._execute_with_retry(operation_func, max_retries, read_only=True)
+    
     def _hash_pin(self, pin: str) -> tuple:
-        """Gera hash seguro do PIN com salt"""
-        import secrets
-        salt = secrets.token_hex(16)
-        pin_hash = hashlib.pbkdf2_hmac('sha256', pin.encode(), salt.encode(), 100000)
-        return pin_hash.hex(), salt
+        """Gera hash seguro do PIN com a KDF configurada (chamar fora de self.lock)
+        
+        Devolve (pin_hash, salt, pin_kdf, pin_kdf_params)
+        """
+        return hash_pin(pin)
     
-    def _verify_pin(self, pin: str, pin_hash: str, salt: str) -> bool:
-        """Verifica se o PIN está correto"""
-        test_hash = hashlib.pbkdf2_hmac('sha256', pin.encode(), salt.encode(), 100000)
-        return test_hash.hex() == pin_hash
+    def _verify_pin(self, pin: str, pin_hash: str, salt: str, kdf: str = None, kdf_params: str = None) -> bool:
+        """Verifica se o PIN está correto (chamar fora de self.lock)
+        
+        Uma KDF desconhecida ou parâmetros inválidos contam como PIN errado.
+        """
+        try:
+            return verify_pin(pin, pin_hash, salt, kdf, kdf_params)
+        except (KeyError, ValueError, TypeError) as e:
+            print(f"Erro ao verificar PIN (kdf={kdf!r}): {e}")
+            return False
     
     def generate_new_pin(self) -> str:
         """Gera um novo PIN de 4 dígitos único"""
@@ -180,35 +438,44 @@ class LockerDatabase:
             user_data: Dicionário com dados completos do utilizador:
                       {'name': str, 'email': str, 'phone': str, 'birth_date': str}
         """
+        # Gerar novo PIN se não fornecido (antes da operação da database)
+        generated_pin = pin if pin is not None else self.generate_new_pin()
+        
+        # Processar dados do utilizador
+        final_contact = contact  # Cópia local para poder modificar
+        if user_data:
+            name = user_data.get('name', '')
+            email = user_data.get('email', '')
+            phone = user_data.get('phone', '')
+            birth_date = user_data.get('birth_date', '')
+            # Se contact não foi fornecido mas temos email, usar email como contact
+            if not final_contact and email:
+                final_contact = email
+            elif not final_contact and name:
+                final_contact = name
+            elif not final_contact and phone:
+                final_contact = phone
+        else:
+            name = email = phone = birth_date = ''
+        
+        # Garantir que contact tem um valor
+        if not final_contact:
+            final_contact = 'Unknown'
+        
+        # Gerar hash do PIN antes de entrar na secção crítica - o PBKDF2 é
+        # lento e não deve bloquear os outros utilizadores da base de dados
+        pin_hash, salt, pin_kdf, pin_kdf_params = self._hash_pin(generated_pin)
+        
         def operation():
-            # Gerar novo PIN se não fornecido (antes da operação da database)
-            generated_pin = pin if pin is not None else self.generate_new_pin()
-            
-            # Processar dados do utilizador
-            final_contact = contact  # Cópia local para poder modificar
-            if user_data:
-                name = user_data.get('name', '')
-                email = user_data.get('email', '')
-                phone = user_data.get('phone', '')
-                birth_date = user_data.get('birth_date', '')
-                # Se contact não foi fornecido mas temos email, usar email como contact
-                if not final_contact and email:
-                    final_contact = email
-                elif not final_contact and name:
-                    final_contact = name
-                elif not final_contact and phone:
-                    final_contact = phone
-            else:
-                name = email = phone = birth_date = ''
-            
-            # Garantir que contact tem um valor
-            if not final_contact:
-                final_contact = 'Unknown'
-            
             conn = self._get_connection()
             try:
                 cursor = conn.cursor()
                 
+                # Iniciar transação antes de verificar o estado: com o lock de
+                # escrita, outro processo (API, outro worker) não pode reservar
+                # o mesmo cacifo entre a verificação e o INSERT
+                cursor.execute('BEGIN IMMEDIATE')
+                
                 # Verificar se o cacifo está disponível
                 cursor.execute('''
                     SELECT status FROM lockers WHERE locker_number = ?
@@ -216,22 +483,21 @@ class LockerDatabase:
                 
                 result = cursor.fetchone()
                 if not result:
+                    conn.rollback()
                     return {"success": False, "message": "Cacifo não existe"}
 
                 if result[0] != 'available':
+                    conn.rollback()
                     return {"success": False, "message": "Cacifo não está disponível"}
 
-                # Gerar hash do PIN
-                pin_hash, salt = self._hash_pin(generated_pin)
-
-                # Iniciar transação
-                cursor.execute('BEGIN IMMEDIATE')
-
                 # Criar reserva com dados completos
                 cursor.execute('''
-                    INSERT INTO bookings (locker_number, contact, name, email, phone, birth_date, pin_hash, pin_salt, pin_display, status)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 'booked')
-                ''', (locker_number, final_contact, name, email, phone, birth_date, pin_hash, salt, generated_pin))                # Atualizar status do cacifo
+                    INSERT INTO bookings (locker_number, contact, name, email, phone, birth_date, pin_hash, pin_salt, pin_kdf, pin_kdf_params, pin_display, status)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'booked')
+                ''', (locker_number, final_contact, name, email, phone, birth_date, pin_hash, salt, pin_kdf, pin_kdf_params, generated_pin))
+                booking_id = cursor.lastrowid
+                
+                # Atualizar status do cacifo
                 cursor.execute('''
                     UPDATE lockers SET status = 'occupied', updated_at = CURRENT_TIMESTAMP
                     WHERE locker_number = ?
@@ -260,7 +526,7 @@ class LockerDatabase:
                     "locker_number": locker_number,
                     "contact": final_contact,
                     "pin": generated_pin,  # Retornar o PIN gerado
-                    "booking_id": cursor.lastrowid
+                    "booking_id": booking_id
                 }
                 
             except Exception as e:
@@ -268,7 +534,7 @@ class LockerDatabase:
                 conn.rollback()
                 return {"success": False, "message": f"Erro ao reservar: {str(e)}"}
             finally:
-                conn.close()
+                self._release_connection(conn)
         
         result = self._execute_with_retry(operation)
         if result is None:
@@ -276,36 +542,57 @@ class LockerDatabase:
         return result
     
     def unlock_locker(self, contact: str, pin: str) -> Optional[str]:
-        """Desbloqueia um cacifo usando contacto e PIN"""
-        def operation():
+        """Desbloqueia um cacifo usando contacto e PIN
+        
+        A reserva é lida e o PIN verificado sem o lock de escrita; só a
+        atualização final é serializada, e só tem efeito se a reserva ainda
+        estiver ativa nesse momento.
+        """
+        def find_booking():
             conn = self._get_connection()
             try:
                 cursor = conn.cursor()
                 
-                # Encontrar reserva ativa
+                # Encontrar reserva ativa (sem tocar no histórico de reservas)
                 cursor.execute('''
-                    SELECT locker_number, pin_hash, pin_salt, id
-                    FROM bookings 
-                    WHERE contact = ? AND status IN ('booked', 'active', 'unlocked')
-                    ORDER BY booking_time DESC
+                    SELECT b.locker_number, b.pin_hash, b.pin_salt, b.id, b.pin_kdf, b.pin_kdf_params
+                    FROM active_bookings a
+                    JOIN bookings b ON b.id = a.booking_id
+                    WHERE a.contact = ?
+                    ORDER BY a.booking_time DESC
                     LIMIT 1
                 ''', (contact,))
                 
-                result = cursor.fetchone()
-                if not result:
-                    return None
-                
-                locker_number, pin_hash, salt, booking_id = result
-                
-                # Verificar PIN
-                if not self._verify_pin(pin, pin_hash, salt):
-                    return None
+                return cursor.fetchone()
+            finally:
+                self._release_connection(conn)
+        
+        result = self._execute_read(find_booking)
+        if not result:
+            return None
+        
+        locker_number, pin_hash, salt, booking_id, pin_kdf, pin_kdf_params = result
+        
+        # Verificar PIN (fora do lock)
+        if not self._verify_pin(pin, pin_hash, salt, pin_kdf, pin_kdf_params):
+            return None
+        
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
                 
                 # Atualizar tempo de desbloqueio e status para returned
-                cursor.execute('''
+                placeholders = ', '.join('?' * len(ACTIVE_BOOKING_STATUSES))
+                cursor.execute(f'''
                     UPDATE bookings SET unlock_time = CURRENT_TIMESTAMP, status = 'returned'
-                    WHERE id = ?
-                ''', (booking_id,))
+                    WHERE id = ? AND status IN ({placeholders})
+                ''', (booking_id, *ACTIVE_BOOKING_STATUSES))
+                
+                if cursor.rowcount == 0:
+                    # Reserva terminada entretanto por outro pedido
+                    conn.rollback()
+                    return None
                 
                 # Actualizar status do cacifo para available
                 cursor.execute('''
@@ -327,10 +614,28 @@ class LockerDatabase:
                 conn.rollback()
                 return None
             finally:
-                conn.close()
+                self._release_connection(conn)
         
         return self._execute_with_retry(operation)
     
+    def book_locker_async(self, locker_number: str, contact: str = None, pin: str = None,
+                          user_data: dict = None, callback=None):
+        """Versão não bloqueante de book_locker, executada no pool de workers de PIN
+        
+        Devolve um Future; callback (opcional) recebe o dicionário de resultado
+        na thread do worker.
+        """
+        return submit_pin_task(self.book_locker, locker_number, contact, pin, user_data,
+                               callback=callback)
+    
+    def unlock_locker_async(self, contact: str, pin: str, callback=None):
+        """Versão não bloqueante de unlock_locker, executada no pool de workers de PIN
+        
+        Devolve um Future; callback (opcional) recebe o número do cacifo
+        desbloqueado (ou None) na thread do worker.
+        """
+        return submit_pin_task(self.unlock_locker, contact, pin, callback=callback)
+    
     def return_locker(self, locker_number: str) -> bool:
         """Marca um cacifo como devolvido"""
         def operation():
@@ -338,12 +643,15 @@ class LockerDatabase:
             try:
                 cursor = conn.cursor()
                 
-                # Encontrar reserva ativa
-                cursor.execute('''
+                # Terminar a reserva ativa (qualquer estado que ainda ocupa o
+                # cacifo - o trigger retira-a de active_bookings)
+                placeholders = ', '.join('?' * len(ACTIVE_BOOKING_STATUSES))
+                cursor.execute(f'''
                     UPDATE bookings 
                     SET status = 'completed', return_time = CURRENT_TIMESTAMP
-                    WHERE locker_number = ? AND status = 'active'
-                ''', (locker_number,))
+                    WHERE id IN (SELECT booking_id FROM active_bookings WHERE locker_number = ?)
+                      AND status IN ({placeholders})
+                ''', (locker_number, *ACTIVE_BOOKING_STATUSES))
                 
                 # Marcar cacifo como disponível
                 cursor.execute('''
@@ -365,7 +673,7 @@ class LockerDatabase:
                 conn.rollback()
                 return False
             finally:
-                conn.close()
+                self._release_connection(conn)
         
         result = self._execute_with_retry(operation)
         return result if result is not None else False
@@ -383,9 +691,9 @@ class LockerDatabase:
                 result = cursor.fetchone()
                 return result[0] if result else 'unknown'
             finally:
-                conn.close()
+                self._release_connection(conn)
         
-        result = self._execute_with_retry(operation)
+        result = self._execute_read(operation)
         return result if result is not None else 'unknown'
     
     def get_all_lockers_status(self) -> Dict[str, str]:
@@ -398,313 +706,1503 @@ class LockerDatabase:
                 results = cursor.fetchall()
                 return {locker: status for locker, status in results}
             finally:
-                conn.close()
+                self._release_connection(conn)
         
-        result = self._execute_with_retry(operation)
+        result = self._execute_read(operation)
         return result if result is not None else {}
     
     def get_active_booking(self, locker_number: str) -> Optional[Dict]:
         """Obtém informações da reserva ativa de um cacifo"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT contact, booking_time, unlock_time, notes
-            FROM bookings 
-            WHERE locker_number = ? AND status = 'active'
-            ORDER BY booking_time DESC
-            LIMIT 1
-        ''', (locker_number,))
-        
-        result = cursor.fetchone()
-        conn.close()
-        
-        if result:
-            return {
-                'contact': result[0],
-                'booking_time': result[1],
-                'unlock_time': result[2],
-                'notes': result[3]
-            }
-        return None
-    
-    def log_action(self, locker_number: str, action: str, details: str = "", gpio_state: str = ""):
-        """Adiciona entrada ao log do sistema"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO system_logs (locker_number, action, details, gpio_state)
-            VALUES (?, ?, ?, ?)
-        ''', (locker_number, action, details, gpio_state))
-        
-        conn.commit()
-        conn.close()
-    
-    def get_usage_stats(self) -> Dict:
-        """Obtém estatísticas de utilização"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Total de reservas
-        cursor.execute('SELECT COUNT(*) FROM bookings')
-        total_bookings = cursor.fetchone()[0]
-        
-        # Reservas ativas
-        cursor.execute('SELECT COUNT(*) FROM bookings WHERE status = "active"')
-        active_bookings = cursor.fetchone()[0]
-        
-        # Cacifos disponíveis
-        cursor.execute('SELECT COUNT(*) FROM lockers WHERE status = "available"')
-        available_lockers = cursor.fetchone()[0]
-        
-        conn.close()
-        
-        return {
-            'total_bookings': total_bookings,
-            'active_bookings': active_bookings,
-            'available_lockers': available_lockers,
-            'total_lockers': 4
-        }
-    
-    def cleanup_old_logs(self, days: int = 30):
-        """Remove logs antigos para manter a base de dados limpa"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            DELETE FROM system_logs 
-            WHERE timestamp < datetime('now', '-{} days')
-        '''.format(days))
-        
-        deleted_rows = cursor.rowcount
-        conn.commit()
-        conn.close()
-        
-        print(f"Deleted {deleted_rows} old log entries")
-        return deleted_rows
-    
-    # ============================================
-    # MÉTODOS DE CONSULTA DE RESERVAS ANTERIORES
-    # ============================================
-    
-    def get_all_bookings(self, limit: int = None) -> List[Dict]:
-        """Obtém todas as reservas ordenadas por data"""
         def operation():
             conn = self._get_connection()
             try:
                 cursor = conn.cursor()
-                query = '''
-                    SELECT 
-                        id, locker_number, contact, name, email, phone, birth_date, status, 
-                        booking_time, unlock_time, return_time, notes, pin_display
-                    FROM bookings 
-                    ORDER BY booking_time DESC
-                '''
-                if limit:
-                    query += f' LIMIT {limit}'
-                
-                cursor.execute(query)
-                results = cursor.fetchall()
+                cursor.execute('''
+                    SELECT b.contact, b.booking_time, b.unlock_time, b.notes, b.id, b.status
+                    FROM active_bookings a
+                    JOIN bookings b ON b.id = a.booking_id
+                    WHERE a.locker_number = ?
+                    ORDER BY a.booking_time DESC
+                    LIMIT 1
+                ''', (locker_number,))
                 
-                bookings = []
-                for row in results:
-                    bookings.append({
-                        'id': row[0],
-                        'locker_number': row[1],
-                        'contact': row[2],
-                        'name': row[3],
-                        'email': row[4],
-                        'phone': row[5],
-                        'birth_date': row[6],
-                        'status': row[7],
-                        'booking_time': row[8],
-                        'unlock_time': row[9],
-                        'return_time': row[10],
-                        'notes': row[11],
-                        'pin': row[12]
-                    })
-                return bookings
-            finally:
-                conn.close()
+                result = cursor.fetchone()
+                if result:
+                    return self._active_booking_row_to_dict(result)
+                return None
+            finally:
+                self._release_connection(conn)
         
-        return self._execute_with_retry(operation) or []
+        return self._execute_read(operation)
     
-    def get_bookings_by_locker(self, locker_number: str) -> List[Dict]:
-        """Obtém histórico de reservas de um locker específico"""
+    def get_active_bookings_by_locker(self) -> Dict[str, Dict]:
+        """Obtém a reserva ativa de cada cacifo numa única consulta"""
         def operation():
             conn = self._get_connection()
             try:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    SELECT 
-                        id, contact, name, email, phone, birth_date, status, booking_time, 
-                        unlock_time, return_time, notes, pin_display
-                    FROM bookings 
-                    WHERE locker_number = ?
-                    ORDER BY booking_time DESC
-                ''', (locker_number,))
+                    SELECT b.contact, b.booking_time, b.unlock_time, b.notes, b.id, b.status,
+                           a.locker_number
+                    FROM active_bookings a
+                    JOIN bookings b ON b.id = a.booking_id
+                    ORDER BY a.booking_time
+                ''')
                 
-                results = cursor.fetchall()
-                bookings = []
-                for row in results:
-                    bookings.append({
-                        'id': row[0],
-                        'contact': row[1],
-                        'name': row[2],
-                        'email': row[3],
-                        'phone': row[4],
-                        'birth_date': row[5],
-                        'status': row[6],
-                        'booking_time': row[7],
-                        'unlock_time': row[8],
-                        'return_time': row[9],
-                        'notes': row[10],
-                        'pin': row[11]
-                    })
-                return bookings
-            finally:
-                conn.close()
+                # Ordem crescente: a reserva mais recente de cada cacifo fica por último
+                return {row[6]: self._active_booking_row_to_dict(row) for row in cursor.fetchall()}
+            finally:
+                self._release_connection(conn)
         
-        return self._execute_with_retry(operation) or []
+        return self._execute_read(operation) or {}
+    
+    def get_active_bookings(self) -> List[Dict]:
+        """Obtém todas as reservas ativas (mais recentes primeiro)
+        
+        Lê de active_bookings, por isso o custo depende do número de cacifos
+        ocupados e não do tamanho do histórico.
+        """
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT {BOOKING_COLUMNS}
+                    FROM active_bookings a
+                    JOIN bookings b ON b.id = a.booking_id
+                    ORDER BY a.booking_time DESC, a.booking_id DESC
+                ''')
+                return [_row_to_booking(row) for row in cursor.fetchall()]
+            finally:
+                self._release_connection(conn)
+        
+        return self._execute_read(operation) or []
     
-    def get_bookings_by_contact(self, contact_search: str) -> List[Dict]:
-        """Obtém reservas por contacto (pesquisa parcial)"""
+    def count_active_bookings(self) -> int:
+        """Número de reservas ativas"""
         def operation():
             conn = self._get_connection()
             try:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT 
-                        id, locker_number, contact, name, email, phone, birth_date, status, 
-                        booking_time, unlock_time, return_time, notes, pin_display
-                    FROM bookings 
-                    WHERE contact LIKE ? OR name LIKE ? OR email LIKE ? OR phone LIKE ?
-                    ORDER BY booking_time DESC
-                ''', (f'%{contact_search}%', f'%{contact_search}%', f'%{contact_search}%', f'%{contact_search}%'))
-                
-                results = cursor.fetchall()
-                bookings = []
-                for row in results:
-                    bookings.append({
-                        'id': row[0],
-                        'locker_number': row[1],
-                        'contact': row[2],
-                        'name': row[3],
-                        'email': row[4],
-                        'phone': row[5],
-                        'birth_date': row[6],
-                        'status': row[7],
-                        'booking_time': row[8],
-                        'unlock_time': row[9],
-                        'return_time': row[10],
-                        'notes': row[11],
-                        'pin': row[12]
-                    })
-                return bookings
-            finally:
-                conn.close()
+                cursor.execute('SELECT COUNT(*) FROM active_bookings')
+                return cursor.fetchone()[0]
+            finally:
+                self._release_connection(conn)
         
-        return self._execute_with_retry(operation) or []
+        return self._execute_read(operation) or 0
     
-    def get_recent_bookings(self, days: int = 7) -> List[Dict]:
-        """Obtém reservas dos últimos X dias"""
+    @staticmethod
+    def _active_booking_row_to_dict(row) -> Dict:
+        return {
+            'contact': row[0],
+            'booking_time': row[1],
+            'unlock_time': row[2],
+            'notes': row[3],
+            'booking_id': row[4],
+            'status': row[5]
+        }
+    
+    def log_action(self, locker_number: str, action: str, details: str = "", gpio_state: str = ""):
+        """Adiciona entrada ao log do sistema"""
         def operation():
             conn = self._get_connection()
             try:
                 cursor = conn.cursor()
                 cursor.execute('''
-                    SELECT 
-                        id, locker_number, contact, name, email, phone, birth_date, status, 
-                        booking_time, unlock_time, return_time, notes, pin_display
-                    FROM bookings 
-                    WHERE booking_time >= datetime('now', '-{} days')
-                    ORDER BY booking_time DESC
-                '''.format(days), ())
+                    INSERT INTO system_logs (locker_number, action, details, gpio_state)
+                    VALUES (?, ?, ?, ?)
+                ''', (locker_number, action, details, gpio_state))
                 
-                results = cursor.fetchall()
-                bookings = []
-                for row in results:
-                    bookings.append({
-                        'id': row[0],
-                        'locker_number': row[1],
-                        'contact': row[2],
-                        'name': row[3],
-                        'email': row[4],
-                        'phone': row[5],
-                        'birth_date': row[6],
-                        'status': row[7],
-                        'booking_time': row[8],
-                        'unlock_time': row[9],
-                        'return_time': row[10],
-                        'notes': row[11],
-                        'pin': row[12]
-                    })
-                return bookings
-            finally:
-                conn.close()
+                conn.commit()
+                return True
+            finally:
+                self._release_connection(conn)
         
-        return self._execute_with_retry(operation) or []
+        self._execute_with_retry(operation)
     
-    def get_booking_statistics(self) -> Dict:
-        """Obtém estatísticas detalhadas das reservas"""
+    def log_actions(self, entries: List[tuple]):
+        """
+        Adiciona várias entradas ao log numa só transação
+        
+        Args:
+            entries: lista de (locker_number, action, details, gpio_state)
+        """
+        if not entries:
+            return True
+        
         def operation():
             conn = self._get_connection()
             try:
                 cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT INTO system_logs (locker_number, action, details, gpio_state)
+                    VALUES (?, ?, ?, ?)
+                ''', entries)
                 
-                # Total de reservas
-                cursor.execute('SELECT COUNT(*) FROM bookings')
-                total_bookings = cursor.fetchone()[0]
-                
-                # Reservas por status
-                cursor.execute('SELECT status, COUNT(*) FROM bookings GROUP BY status')
-                status_counts = dict(cursor.fetchall())
+                conn.commit()
+                return True
+            finally:
+                self._release_connection(conn)
+        
+        result = self._execute_with_retry(operation)
+        return result if result is not None else False
+    
+    def get_usage_stats(self) -> Dict:
+        """Obtém estatísticas de utilização"""
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
                 
-                # Locker mais utilizado
+                # Totais a partir dos agregados de booking_stats
                 cursor.execute('''
-                    SELECT locker_number, COUNT(*) as count 
-                    FROM bookings 
-                    GROUP BY locker_number 
-                    ORDER BY count DESC 
-                    LIMIT 1
+                    SELECT
+                        (SELECT count FROM booking_stats WHERE bucket = 'total' AND key = ''),
+                        (SELECT count FROM booking_stats WHERE bucket = 'status' AND key = 'active'),
+                        (SELECT COUNT(*) FROM lockers WHERE status = 'available')
                 ''')
-                most_used_result = cursor.fetchone()
-                most_used = {'locker': most_used_result[0], 'count': most_used_result[1]} if most_used_result else None
+                total_bookings, active_bookings, available_lockers = cursor.fetchone()
+
+                return {
+                    'total_bookings': total_bookings or 0,
+                    'active_bookings': active_bookings or 0,
+                    'available_lockers': available_lockers,
+                    'total_lockers': 4
+                }
+            finally:
+                self._release_connection(conn)
+        
+        return self._execute_read(operation) or {}
+    
+    def cleanup_old_logs(self, days: int = 30):
+        """Remove logs antigos para manter a base de dados limpa"""
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    DELETE FROM system_logs 
+                    WHERE timestamp < datetime('now', ?)
+                ''', (f'-{int(days)} days',))
+                deleted_rows = cursor.rowcount
+                
+                # O feed de alterações só precisa de cobrir reconexões recentes
+                cursor.execute('''
+                    DELETE FROM change_events WHERE created_at < datetime('now', ?)
+                ''', (f'-{CHANGE_EVENTS_RETENTION_HOURS} hours',))
+                
+                # Notificações já entregues (ou desistidas) não voltam a ser lidas
+                cursor.execute('''
+                    DELETE FROM notification_outbox
+                    WHERE status IN ('sent', 'failed') AND created_at < datetime('now', ?)
+                ''', (f'-{int(days)} days',))
+                
+                # Envios em massa já terminados e os respetivos resultados
+                cursor.execute('''
+                    DELETE FROM bulk_notification_results WHERE bulk_id IN (
+                        SELECT id FROM bulk_notifications
+                        WHERE status != 'running' AND created_at < datetime('now', ?)
+                    )
+                ''', (f'-{int(days)} days',))
+                cursor.execute('''
+                    DELETE FROM bulk_notifications
+                    WHERE status != 'running' AND created_at < datetime('now', ?)
+                ''', (f'-{int(days)} days',))
                 
-                # Reservas por dia (últimos 7 dias)
+                conn.commit()
+                return deleted_rows
+            finally:
+                self._release_connection(conn)
+        
+        deleted_rows = self._execute_with_retry(operation) or 0
+        print(f"Deleted {deleted_rows} old log entries")
+        return deleted_rows
+    
+    # ============================================
+    # FEED DE ALTERAÇÕES (change_events)
+    # ============================================
+    
+    def get_change_events(self, after_id: int = 0, limit: int = 200) -> List[Dict]:
+        """Eventos de alteração com id > after_id (por ordem)"""
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, event, locker_number, booking_id, status, details, created_at
+                    FROM change_events
+                    WHERE id > ?
+                    ORDER BY id
+                    LIMIT ?
+                ''', (after_id, limit))
+                return [{
+                    'id': row[0],
+                    'event': row[1],
+                    'locker_number': row[2],
+                    'booking_id': row[3],
+                    'status': row[4],
+                    'details': row[5],
+                    'created_at': row[6]
+                } for row in cursor.fetchall()]
+            finally:
+                self._release_connection(conn)
+        
+        return self._execute_read(operation) or []
+    
+    def get_last_change_event_id(self) -> int:
+        """Id do último evento de alteração (0 se não houver)"""
+        def operation():
+            conn = self._get_connection()
+            try:
+                return conn.execute('SELECT COALESCE(MAX(id), 0) FROM change_events').fetchone()[0]
+            finally:
+                self._release_connection(conn)
+        
+        return self._execute_read(operation) or 0
+    
+    def prune_change_events(self, max_age_hours: int = CHANGE_EVENTS_RETENTION_HOURS) -> int:
+        """Apaga eventos de alteração com mais de max_age_hours (devolve quantos)"""
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    DELETE FROM change_events WHERE created_at < datetime('now', ?)
+                ''', (f'-{int(max_age_hours)} hours',))
+                conn.commit()
+                return cursor.rowcount
+            finally:
+                self._release_connection(conn)
+        
+        return self._execute_with_retry(operation) or 0
+    
+    def add_change_listener(self, callback):
+        """Regista callback(events) chamado quando há novos eventos de alteração
+        
+        Os eventos vêm da tabela change_events (preenchida por triggers), por
+        isso incluem escritas feitas por outros processos, como o kiosk.
+        O callback corre na thread do watcher - não deve bloquear.
+        """
+        with self._change_listeners_lock:
+            self._change_listeners.append(callback)
+            if self._watcher_thread is None:
+                self._watcher_stop.clear()
+                self._watcher_thread = threading.Thread(
+                    target=self._watch_changes,
+                    args=(self.get_last_change_event_id(),),
+                    name='db-change-watcher',
+                    daemon=True
+                )
+                self._watcher_thread.start()
+    
+    def remove_change_listener(self, callback):
+        """Remove um callback registado com add_change_listener"""
+        with self._change_listeners_lock:
+            if callback in self._change_listeners:
+                self._change_listeners.remove(callback)
+    
+    def _watch_changes(self, last_id: int):
+        """Thread do watcher: entrega os novos eventos aos listeners"""
+        last_prune = time.monotonic()
+        while not self._watcher_stop.is_set():
+            # Escritas deste processo acordam o watcher de imediato; as de
+            # outros processos são vistas no máximo CHANGE_POLL_INTERVAL depois
+            self._changes_pending.wait(CHANGE_POLL_INTERVAL)
+            self._changes_pending.clear()
+            
+            events = self.get_change_events(after_id=last_id)
+            while events:
+                last_id = events[-1]['id']
+                with self._change_listeners_lock:
+                    listeners = list(self._change_listeners)
+                for callback in listeners:
+                    try:
+                        callback(events)
+                    except Exception as e:
+                        print(f"Erro no listener de alterações: {e}")
+                events = self.get_change_events(after_id=last_id)
+            
+            # Limpeza periódica (os triggers acrescentam um evento por escrita)
+            if time.monotonic() - last_prune >= CHANGE_PRUNE_INTERVAL:
+                last_prune = time.monotonic()
+                self.prune_change_events()
+
+    # ============================================
+    # FILA DE NOTIFICAÇÕES (notification_outbox)
+    # ============================================
+
+    def enqueue_notifications(self, messages: List[Dict]) -> List[int]:
+        """Guarda mensagens na fila de envio (uma transação) e devolve os ids
+
+        Cada mensagem: {'channel', 'recipient', 'subject', 'body'} e
+        opcionalmente 'booking_id' e 'max_attempts'.
+        """
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                ids = []
+                for message in messages:
+                    cursor.execute('''
+                        INSERT INTO notification_outbox
+                        (booking_id, channel, recipient, subject, body, max_attempts)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                    ''', (
+                        message.get('booking_id'),
+                        message['channel'],
+                        message['recipient'],
+                        message.get('subject', ''),
+                        message['body'],
+                        message.get('max_attempts', NOTIFICATION_MAX_ATTEMPTS)
+                    ))
+                    ids.append(cursor.lastrowid)
+                conn.commit()
+                return ids
+            finally:
+                self._release_connection(conn)
+
+        if not messages:
+            return []
+        return self._execute_with_retry(operation) or []
+
+    def claim_due_notifications(self, limit: int = 20, channel: str = None) -> List[Dict]:
+        """Marca como 'sending' e devolve as mensagens pendentes já vencidas
+
+        Com channel, só mensagens desse canal. Cada chamada conta uma
+        tentativa por mensagem devolvida.
+        """
+        channel_filter = 'AND channel = ?' if channel else ''
+        params = (channel, limit) if channel else (limit,)
+        
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(f'''
+                    SELECT id, booking_id, channel, recipient, subject, body, attempts, max_attempts
+                    FROM notification_outbox
+                    WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP {channel_filter}
+                    ORDER BY next_attempt_at, id
+                    LIMIT ?
+                ''', params)
+                messages = [{
+                    'id': row[0],
+                    'booking_id': row[1],
+                    'channel': row[2],
+                    'recipient': row[3],
+                    'subject': row[4],
+                    'body': row[5],
+                    'attempts': row[6] + 1,
+                    'max_attempts': row[7]
+                } for row in cursor.fetchall()]
+
+                cursor.executemany('''
+                    UPDATE notification_outbox
+                    SET status = 'sending', attempts = attempts + 1
+                    WHERE id = ?
+                ''', [(message['id'],) for message in messages])
+                conn.commit()
+                return messages
+            finally:
+                self._release_connection(conn)
+
+        return self._execute_with_retry(operation) or []
+
+    def complete_notification(self, notification_id: int, success: bool,
+                              error: str = None, retry_in: float = None):
+        """Regista o resultado de uma tentativa de envio
+
+        Sucesso -> 'sent'. Falha com retry_in (segundos) -> volta a 'pending'
+        para nova tentativa; sem retry_in -> 'failed'. O corpo (que contém o
+        PIN) é apagado assim que a mensagem deixa de precisar dele.
+        """
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                if success:
+                    cursor.execute('''
+                        UPDATE notification_outbox
+                        SET status = 'sent', body = '', last_error = NULL, sent_at = CURRENT_TIMESTAMP
+                        WHERE id = ?
+                    ''', (notification_id,))
+                elif retry_in is not None:
+                    cursor.execute('''
+                        UPDATE notification_outbox
+                        SET status = 'pending', last_error = ?,
+                            next_attempt_at = datetime('now', ?)
+                        WHERE id = ?
+                    ''', (error, f'+{int(retry_in)} seconds', notification_id))
+                else:
+                    cursor.execute('''
+                        UPDATE notification_outbox
+                        SET status = 'failed', body = '', last_error = ?
+                        WHERE id = ?
+                    ''', (error, notification_id))
+                conn.commit()
+                return True
+            finally:
+                self._release_connection(conn)
+
+        return bool(self._execute_with_retry(operation))
+
+    def requeue_stale_notifications(self) -> int:
+        """Devolve à fila mensagens deixadas em 'sending' (ex.: após um crash)"""
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
                 cursor.execute('''
-                    SELECT DATE(booking_time) as date, COUNT(*) as count
-                    FROM bookings 
-                    WHERE booking_time >= date('now', '-7 days')
-                    GROUP BY DATE(booking_time)
-                    ORDER BY date DESC
+                    UPDATE notification_outbox
+                    SET status = 'pending', next_attempt_at = CURRENT_TIMESTAMP
+                    WHERE status = 'sending'
                 ''')
-                daily_counts = dict(cursor.fetchall())
+                conn.commit()
+                return cursor.rowcount
+            finally:
+                self._release_connection(conn)
+
+        return self._execute_with_retry(operation) or 0
+
+    def get_notification_queue_depth(self) -> Dict:
+        """Mensagens na fila por estado ('due' = pendentes já vencidas)"""
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT status, COUNT(*) FROM notification_outbox
+                    WHERE status IN ('pending', 'sending')
+                    GROUP BY status
+                ''')
+                depth = {'pending': 0, 'sending': 0}
+                depth.update(dict(cursor.fetchall()))
+                cursor.execute('''
+                    SELECT COUNT(*) FROM notification_outbox
+                    WHERE status = 'pending' AND next_attempt_at <= CURRENT_TIMESTAMP
+                ''')
+                depth['due'] = cursor.fetchone()[0]
+                return depth
+            finally:
+                self._release_connection(conn)
+
+        return self._execute_read(operation) or {}
+
+    def save_metrics_snapshot(self, name: str, data: Dict) -> bool:
+        """Guarda o snapshot de métricas de um serviço (lido pela API noutro processo)"""
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT OR REPLACE INTO service_metrics (name, data, updated_at)
+                    VALUES (?, ?, CURRENT_TIMESTAMP)
+                ''', (name, json.dumps(data, ensure_ascii=False)))
+                conn.commit()
+                return True
+            finally:
+                self._release_connection(conn)
+
+        return bool(self._execute_with_retry(operation))
+
+    def get_metrics_snapshot(self, name: str) -> Optional[Dict]:
+        """Último snapshot de métricas gravado com save_metrics_snapshot"""
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('SELECT data FROM service_metrics WHERE name = ?', (name,))
+                row = cursor.fetchone()
+                return json.loads(row[0]) if row else None
+            finally:
+                self._release_connection(conn)
+
+        return self._execute_read(operation)
+
+    # ============================================
+    # NOTIFICAÇÕES EM MASSA (bulk_notifications)
+    # ============================================
+
+    def get_notification_recipients(self, older_than_hours: float = None) -> List[Dict]:
+        """Destinatários das reservas ativas (opcionalmente só as com mais de N horas)
+
+        Uma única consulta a active_bookings (índice por booking_time) com os
+        contactos de bookings.
+        """
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                query = '''
+                    SELECT b.id, b.locker_number, b.contact, b.name, b.email, b.phone, b.booking_time
+                    FROM active_bookings a
+                    JOIN bookings b ON b.id = a.booking_id
+                '''
+                params = []
+                if older_than_hours is not None:
+                    query += " WHERE a.booking_time <= datetime('now', ?)"
+                    params.append(f'-{int(older_than_hours * 3600)} seconds')
+                query += ' ORDER BY a.booking_time, a.booking_id'
+                cursor.execute(query, params)
+                return [{
+                    'booking_id': row[0],
+                    'locker_number': row[1],
+                    'contact': row[2],
+                    'name': row[3],
+                    'email': row[4],
+                    'phone': row[5],
+                    'booking_time': row[6]
+                } for row in cursor.fetchall()]
+            finally:
+                self._release_connection(conn)
+
+        return self._execute_read(operation) or []
+
+    def create_bulk_notification(self, kind: str, subject: str, body: str, sms_body: str,
+                                 messages: List[Dict]) -> Optional[Dict]:
+        """Regista um envio em massa e uma linha 'pending' por destinatário (uma transação)
+
+        Cada mensagem: {'booking_id', 'channel', 'recipient'}.
+        Returns:
+            dict {'bulk_id', 'result_ids'} (result_ids pela ordem de messages)
+        """
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO bulk_notifications (kind, subject, body, sms_body, total)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (kind, subject, body, sms_body, len(messages)))
+                bulk_id = cursor.lastrowid
+                result_ids = []
+                for message in messages:
+                    cursor.execute('''
+                        INSERT INTO bulk_notification_results (bulk_id, booking_id, channel, recipient)
+                        VALUES (?, ?, ?, ?)
+                    ''', (bulk_id, message.get('booking_id'), message['channel'], message['recipient']))
+                    result_ids.append(cursor.lastrowid)
+                conn.commit()
+                return {'bulk_id': bulk_id, 'result_ids': result_ids}
+            finally:
+                self._release_connection(conn)
+
+        return self._execute_with_retry(operation)
+
+    def record_bulk_results(self, results: List[tuple]) -> bool:
+        """Guarda de uma vez vários resultados: [(result_id, success, error), ...]"""
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    UPDATE bulk_notification_results
+                    SET status = ?, error = ?, completed_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', [('sent' if success else 'failed', None if success else error, result_id)
+                      for result_id, success, error in results])
+                conn.commit()
+                return True
+            finally:
+                self._release_connection(conn)
+
+        if not results:
+            return True
+        return bool(self._execute_with_retry(operation))
+
+    def finish_bulk_notification(self, bulk_id: int, status: str = 'completed') -> bool:
+        """Fecha um envio em massa; destinatários ainda 'pending' ficam 'failed'"""
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    UPDATE bulk_notification_results
+                    SET status = 'failed', error = 'não enviado', completed_at = CURRENT_TIMESTAMP
+                    WHERE bulk_id = ? AND status = 'pending'
+                ''', (bulk_id,))
+                cursor.execute('''
+                    UPDATE bulk_notifications
+                    SET status = ?, completed_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (status, bulk_id))
+                conn.commit()
+                return True
+            finally:
+                self._release_connection(conn)
+
+        return bool(self._execute_with_retry(operation))
+
+    def get_bulk_notification(self, bulk_id: int, include_results: bool = False) -> Optional[Dict]:
+        """Estado de um envio em massa com contagens por estado (e opcionalmente os resultados)"""
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT id, kind, status, total, created_at, completed_at
+                    FROM bulk_notifications WHERE id = ?
+                ''', (bulk_id,))
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                bulk = {
+                    'id': row[0],
+                    'kind': row[1],
+                    'status': row[2],
+                    'total': row[3],
+                    'created_at': row[4],
+                    'completed_at': row[5],
+                    'counts': {'pending': 0, 'sent': 0, 'failed': 0}
+                }
+                cursor.execute('''
+                    SELECT status, COUNT(*) FROM bulk_notification_results
+                    WHERE bulk_id = ? GROUP BY status
+                ''', (bulk_id,))
+                bulk['counts'].update(dict(cursor.fetchall()))
+                if include_results:
+                    cursor.execute('''
+                        SELECT booking_id, channel, recipient, status, error, completed_at
+                        FROM bulk_notification_results
+                        WHERE bulk_id = ? ORDER BY id
+                    ''', (bulk_id,))
+                    bulk['results'] = [{
+                        'booking_id': result[0],
+                        'channel': result[1],
+                        'recipient': result[2],
+                        'status': result[3],
+                        'error': result[4],
+                        'completed_at': result[5]
+                    } for result in cursor.fetchall()]
+                return bulk
+            finally:
+                self._release_connection(conn)
+
+        return self._execute_read(operation)
+
+    # ============================================
+    # MÉTODOS DE CONSULTA DE RESERVAS ANTERIORES
+    # ============================================
+    
+    def get_bookings_page(self, limit: int = BOOKING_PAGE_SIZE, cursor: str = None,
+                          locker_number: str = None, contact_search: str = None,
+                          days: int = None) -> Dict:
+        """Obtém uma página de reservas (mais recentes primeiro) com filtros opcionais
+        
+        Paginação por keyset em (booking_time, id): cada página começa logo a
+        seguir ao cursor da anterior, por isso o custo não cresce com o
+        histórico, ao contrário de OFFSET. Com limit=None devolve tudo.
+        
+        Returns:
+            {'bookings': [...], 'next_cursor': str ou None}
+        """
+        if limit is not None:
+            limit = max(1, min(int(limit), MAX_BOOKING_PAGE_SIZE))
+        after = decode_booking_cursor(cursor) if cursor else None
+        
+        conditions, params = [], []
+        if locker_number is not None:
+            conditions.append('b.locker_number = ?')
+            params.append(locker_number)
+        if contact_search is not None:
+            contact_sql, contact_params = self._contact_filter(contact_search)
+            conditions.append(contact_sql)
+            params.extend(contact_params)
+        if days is not None:
+            conditions.append("b.booking_time >= datetime('now', ?)")
+            params.append(f'-{int(days)} days')
+        if after:
+            conditions.append('(b.booking_time, b.id) < (?, ?)')
+            params.extend(after)
+        
+        query = f'SELECT {BOOKING_COLUMNS} FROM bookings b'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(f'({c})' for c in conditions)
+        query += ' ORDER BY b.booking_time DESC, b.id DESC'
+        if limit is not None:
+            # Uma linha a mais indica se existe página seguinte
+            query += ' LIMIT ?'
+            params.append(limit + 1)
+        
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor_db = conn.cursor()
+                cursor_db.execute(query, params)
+                return [_row_to_booking(row) for row in cursor_db.fetchall()]
+            finally:
+                self._release_connection(conn)
+        
+        bookings = self._execute_read(operation) or []
+        next_cursor = None
+        if limit is not None and len(bookings) > limit:
+            bookings = bookings[:limit]
+            last = bookings[-1]
+            next_cursor = encode_booking_cursor(last['booking_time'], last['id'])
+        
+        return {'bookings': bookings, 'next_cursor': next_cursor}
+    
+    def iter_bookings(self, start_date: str = None, end_date: str = None,
+                      locker_number: str = None, chunk_size: int = 500):
+        """Itera reservas por ordem cronológica, em blocos, sem as carregar todas
+        
+        Usa um único cursor SQLite (snapshot consistente em WAL) e fetchmany,
+        por isso a memória usada não depende do tamanho do histórico.
+        A conexão volta ao pool quando o gerador termina ou é fechado.
+        
+        Args:
+            start_date / end_date: datas 'YYYY-MM-DD' (inclusivas) de booking_time
+            locker_number: apenas reservas deste cacifo
+        """
+        conditions, params = [], []
+        if start_date:
+            conditions.append('b.booking_time >= date(?)')
+            params.append(start_date)
+        if end_date:
+            conditions.append("b.booking_time < date(?, '+1 day')")
+            params.append(end_date)
+        if locker_number:
+            conditions.append('b.locker_number = ?')
+            params.append(locker_number)
+        
+        query = f'SELECT {BOOKING_COLUMNS} FROM bookings b'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY b.booking_time, b.id'
+        
+        conn = self._get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield _row_to_booking(row)
+        finally:
+            self._release_connection(conn)
+    
+    def get_all_bookings(self, limit: int = None, cursor: str = None) -> List[Dict]:
+        """Obtém todas as reservas ordenadas por data"""
+        return self.get_bookings_page(limit=limit, cursor=cursor)['bookings']
+    
+    def get_bookings_by_ids(self, booking_ids: List[int]) -> Dict[int, Dict]:
+        """Obtém várias reservas pelo id - devolve {id: reserva}"""
+        booking_ids = list(set(booking_ids))
+        if not booking_ids:
+            return {}
+        
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                placeholders = ', '.join('?' for _ in booking_ids)
+                cursor.execute(f'SELECT {BOOKING_COLUMNS} FROM bookings b WHERE b.id IN ({placeholders})',
+                               booking_ids)
+                return {row[0]: _row_to_booking(row) for row in cursor.fetchall()}
+            finally:
+                self._release_connection(conn)
+        
+        return self._execute_read(operation) or {}
+    
+    def get_bookings_by_locker(self, locker_number: str, limit: int = None, cursor: str = None) -> List[Dict]:
+        """Obtém histórico de reservas de um locker específico"""
+        return self.get_bookings_page(limit=limit, cursor=cursor, locker_number=locker_number)['bookings']
+    
+    def get_bookings_by_contact(self, contact_search: str, limit: int = None, cursor: str = None) -> List[Dict]:
+        """Obtém reservas por contacto (pesquisa parcial em contacto, nome, email e telefone)"""
+        return self.get_bookings_page(limit=limit, cursor=cursor, contact_search=contact_search)['bookings']
+    
+    def _contact_filter(self, contact_search: str) -> tuple:
+        """Condição SQL (sobre bookings b) para a pesquisa parcial por contacto"""
+        match = self._fts_match_expression(contact_search)
+        if match:
+            return 'b.id IN (SELECT rowid FROM bookings_fts WHERE bookings_fts MATCH ?)', [match]
+        
+        # Pesquisa curta (< 3 caracteres) ou sem FTS5: LIKE tradicional
+        pattern = f'%{_escape_like(contact_search)}%'
+        return (
+            "b.contact LIKE ? ESCAPE '\\' OR b.name LIKE ? ESCAPE '\\' "
+            "OR b.email LIKE ? ESCAPE '\\' OR b.phone LIKE ? ESCAPE '\\'",
+            [pattern] * 4
+        )
+    
+    def _fts_match_expression(self, query: str) -> Optional[str]:
+        """Expressão MATCH do FTS5 para uma pesquisa (None se o FTS não servir)
+        
+        O tokenizer trigram encontra qualquer substring com 3+ caracteres
+        (e portanto também prefixos). Se a pesquisa parecer um telefone,
+        procura também os dígitos normalizados (sem espaços nem +351).
+        """
+        query = (query or '').strip()
+        if not self.fts_enabled or len(query) < 3:
+            return None
+        
+        terms = ['{contact name email phone} : "%s"' % query.replace('"', '""')]
+        digits = normalize_phone(query)
+        if len(digits) >= 3 and digits.isdigit():
+            terms.append('phone_digits : "%s"' % digits)
+        return ' OR '.join(terms)
+    
+    def search_bookings(self, query: str, limit: int = 20, offset: int = 0) -> Dict:
+        """Pesquisa reservas por contacto/nome/email/telefone com ranking e paginação
+        
+        Resultados que começam pelo termo pesquisado aparecem primeiro, depois
+        por relevância (bm25) e por data.
+        
+        Returns:
+            {'query', 'results', 'total', 'limit', 'offset'}
+        """
+        query = (query or '').strip()
+        limit = max(1, min(int(limit), 200))
+        offset = max(0, int(offset))
+        
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                prefix = f'{_escape_like(query)}%'
+                digits = normalize_phone(query)
+                digits_prefix = f'{_escape_like(digits)}%' if digits.isdigit() else None
+                match = self._fts_match_expression(query)
                 
-                # Tempo médio de utilização (para reservas completadas)
+                if match:
+                    cursor.execute('SELECT COUNT(*) FROM bookings_fts WHERE bookings_fts MATCH ?', (match,))
+                    total = cursor.fetchone()[0]
+                    cursor.execute(f'''
+                        SELECT {BOOKING_COLUMNS}
+                        FROM bookings_fts f
+                        JOIN bookings b ON b.id = f.rowid
+                        WHERE bookings_fts MATCH ?
+                        ORDER BY (b.contact LIKE ? ESCAPE '\\' OR b.name LIKE ? ESCAPE '\\'
+                                  OR b.email LIKE ? ESCAPE '\\'
+                                  OR f.phone_digits LIKE ? ESCAPE '\\') DESC,
+                                 bm25(bookings_fts), b.booking_time DESC
+                        LIMIT ? OFFSET ?
+                    ''', (match, prefix, prefix, prefix, digits_prefix, limit, offset))
+                else:
+                    pattern = f'%{_escape_like(query)}%'
+                    where = '''
+                        b.contact LIKE ? ESCAPE '\\' OR b.name LIKE ? ESCAPE '\\'
+                        OR b.email LIKE ? ESCAPE '\\' OR b.phone LIKE ? ESCAPE '\\'
+                    '''
+                    cursor.execute(f'SELECT COUNT(*) FROM bookings b WHERE {where}',
+                                   (pattern, pattern, pattern, pattern))
+                    total = cursor.fetchone()[0]
+                    cursor.execute(f'''
+                        SELECT {BOOKING_COLUMNS}
+                        FROM bookings b
+                        WHERE {where}
+                        ORDER BY (b.contact LIKE ? ESCAPE '\\' OR b.name LIKE ? ESCAPE '\\'
+                                  OR b.email LIKE ? ESCAPE '\\') DESC,
+                                 b.booking_time DESC
+                        LIMIT ? OFFSET ?
+                    ''', (pattern, pattern, pattern, pattern, prefix, prefix, prefix, limit, offset))
+                
+                return {
+                    'query': query,
+                    'results': [_row_to_booking(row) for row in cursor.fetchall()],
+                    'total': total,
+                    'limit': limit,
+                    'offset': offset
+                }
+            finally:
+                self._release_connection(conn)
+        
+        if not query:
+            return {'query': query, 'results': [], 'total': 0, 'limit': limit, 'offset': offset}
+        return self._execute_read(operation) or {
+            'query': query, 'results': [], 'total': 0, 'limit': limit, 'offset': offset
+        }
+    
+    def get_recent_bookings(self, days: int = 7, limit: int = None, cursor: str = None) -> List[Dict]:
+        """Obtém reservas dos últimos X dias"""
+        return self.get_bookings_page(limit=limit, cursor=cursor, days=days)['bookings']
+    
+    def get_booking_statistics(self) -> Dict:
+        """Obtém estatísticas detalhadas das reservas
+        
+        Lê os agregados de booking_stats (mantidos por triggers) numa única
+        consulta - o custo não depende do número de reservas.
+        """
+        def operation():
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
                 cursor.execute('''
-                    SELECT AVG(
-                        CASE 
-                            WHEN return_time IS NOT NULL AND booking_time IS NOT NULL 
-                            THEN (julianday(return_time) - julianday(booking_time)) * 24 
-                            ELSE NULL 
-                        END
-                    ) as avg_hours
-                    FROM bookings 
-                    WHERE status = 'completed'
+                    SELECT bucket, key, count, total
+                    FROM booking_stats
+                    WHERE count > 0
+                      AND (bucket IN ('total', 'status', 'locker', 'duration')
+                           OR (bucket = 'day' AND key >= date('now', '-7 days')))
                 ''')
-                avg_duration_result = cursor.fetchone()
-                avg_duration_hours = avg_duration_result[0] if avg_duration_result[0] else 0
+                
+                total_bookings = 0
+                status_counts = {}
+                locker_counts = {}
+                daily_counts = {}
+                durations = {}
+                for bucket, key, count, total in cursor.fetchall():
+                    if bucket == 'total':
+                        total_bookings = count
+                    elif bucket == 'status':
+                        status_counts[key] = count
+                    elif bucket == 'locker':
+                        locker_counts[key] = count
+                    elif bucket == 'day':
+                        daily_counts[key] = count
+                    elif bucket == 'duration':
+                        durations[key] = (count, total)
+                
+                # Locker mais utilizado
+                most_used = None
+                if locker_counts:
+                    locker = max(locker_counts, key=lambda number: (locker_counts[number], number))
+                    most_used = {'locker': locker, 'count': locker_counts[locker]}
+                
+                # Tempo médio de utilização (para reservas completadas)
+                count, total = durations.get('completed', (0, 0))
+                avg_duration_hours = total / count if count else 0
                 
                 return {
                     'total_bookings': total_bookings,
                     'status_counts': status_counts,
                     'most_used_locker': most_used,
-                    'daily_counts': daily_counts,
+                    'daily_counts': dict(sorted(daily_counts.items(), reverse=True)),
                     'average_duration_hours': round(avg_duration_hours, 2) if avg_duration_hours else 0
                 }
             finally:
-                conn.close()
+                self._release_connection(conn)
         
-        return self._execute_with_retry(operation) or {}
\ No newline at end of file
+        return self._execute_read(operation) or {}
+
+
+# ============================================
+# MIGRAÇÕES DO SCHEMA
+# ============================================
+# Cada migração recebe um cursor dentro de uma transação. Para alterar o
+# schema, acrescentar uma nova entrada no fim de SCHEMA_MIGRATIONS - nunca
+# editar uma migração já publicada.
+
+def _migration_base_tables(cursor):
+    """Tabelas base (já existentes em instalações anteriores ao versionamento)"""
+    # Tabela para os cacifos
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS lockers (
+            locker_number TEXT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'available',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Tabela para reservas/utilizações (estrutura atualizada com dados de contacto separados)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bookings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            locker_number TEXT NOT NULL,
+            contact TEXT NOT NULL,
+            name TEXT,
+            email TEXT,
+            phone TEXT,
+            birth_date TEXT,
+            pin_hash TEXT NOT NULL,
+            pin_salt TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'active',
+            booking_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+            unlock_time DATETIME,
+            return_time DATETIME,
+            notes TEXT,
+            pin_display TEXT,
+            FOREIGN KEY (locker_number) REFERENCES lockers (locker_number)
+        )
+    ''')
+    
+    # Tabela para logs do sistema
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS system_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            locker_number TEXT,
+            action TEXT NOT NULL,
+            details TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            gpio_state TEXT
+        )
+    ''')
+
+
+def _migration_contact_columns(cursor):
+    """Colunas de contacto separadas em bookings (bases de dados antigas)"""
+    cursor.execute('PRAGMA table_info(bookings)')
+    existing_columns = {row[1] for row in cursor.fetchall()}
+    for column in ('name', 'email', 'phone', 'birth_date', 'pin_display'):
+        if column not in existing_columns:
+            cursor.execute(f'ALTER TABLE bookings ADD COLUMN {column} TEXT')
+
+
+def _migration_access_path_indexes(cursor):
+    """Índices para desbloqueio, histórico por cacifo/data e limpeza de logs"""
+    # unlock_locker: contact = ? AND status IN (...) ORDER BY booking_time
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_bookings_contact_status_time
+        ON bookings (contact, status, booking_time)
+    ''')
+    # get_bookings_by_locker / return_locker: locker_number = ? ORDER BY booking_time
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_bookings_locker_time
+        ON bookings (locker_number, booking_time)
+    ''')
+    # get_recent_bookings / get_all_bookings: intervalo e ordenação por data
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_bookings_booking_time
+        ON bookings (booking_time)
+    ''')
+    # cleanup_old_logs: timestamp < ?
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_system_logs_timestamp
+        ON system_logs (timestamp)
+    ''')
+
+
+def _migration_pin_kdf_columns(cursor):
+    """Algoritmo e parâmetros da KDF de cada PIN (NULL = PBKDF2 legado)"""
+    cursor.execute('PRAGMA table_info(bookings)')
+    existing_columns = {row[1] for row in cursor.fetchall()}
+    for column in ('pin_kdf', 'pin_kdf_params'):
+        if column not in existing_columns:
+            cursor.execute(f'ALTER TABLE bookings ADD COLUMN {column} TEXT')
+
+
+def _migration_active_bookings(cursor):
+    """Tabela active_bookings: só as reservas que ainda ocupam um cacifo
+    
+    Mantida por triggers na mesma transação de cada escrita em bookings, por
+    isso fica consistente mesmo com scripts que alteram bookings diretamente.
+    """
+    statuses = ', '.join(f"'{status}'" for status in ACTIVE_BOOKING_STATUSES)
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS active_bookings (
+            booking_id INTEGER PRIMARY KEY,
+            locker_number TEXT NOT NULL,
+            contact TEXT NOT NULL,
+            booking_time DATETIME
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_active_bookings_contact
+        ON active_bookings (contact, booking_time)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_active_bookings_locker
+        ON active_bookings (locker_number, booking_time)
+    ''')
+    
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_active_insert
+        AFTER INSERT ON bookings
+        WHEN NEW.status IN ({statuses})
+        BEGIN
+            INSERT OR REPLACE INTO active_bookings (booking_id, locker_number, contact, booking_time)
+            VALUES (NEW.id, NEW.locker_number, NEW.contact, NEW.booking_time);
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_active_update
+        AFTER UPDATE OF status, locker_number, contact, booking_time ON bookings
+        BEGIN
+            DELETE FROM active_bookings WHERE booking_id = OLD.id;
+            INSERT OR REPLACE INTO active_bookings (booking_id, locker_number, contact, booking_time)
+            SELECT NEW.id, NEW.locker_number, NEW.contact, NEW.booking_time
+            WHERE NEW.status IN ({statuses});
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_active_delete
+        AFTER DELETE ON bookings
+        BEGIN
+            DELETE FROM active_bookings WHERE booking_id = OLD.id;
+        END
+    ''')
+    
+    # Preencher com as reservas ativas já existentes
+    cursor.execute(f'''
+        INSERT OR REPLACE INTO active_bookings (booking_id, locker_number, contact, booking_time)
+        SELECT id, locker_number, contact, booking_time
+        FROM bookings
+        WHERE status IN ({statuses})
+    ''')
+
+
+def _phone_digits_sql(column: str) -> str:
+    """Expressão SQL equivalente a normalize_phone() (usada nos triggers)"""
+    stripped = column
+    for char in (' ', '-', '(', ')', '.'):
+        stripped = f"replace({stripped}, '{char}', '')"
+    stripped = f"COALESCE({stripped}, '')"
+    prefix = PHONE_COUNTRY_PREFIX
+    return (
+        f"CASE WHEN {stripped} LIKE '+{prefix}%' THEN substr({stripped}, {len(prefix) + 2}) "
+        f"WHEN {stripped} LIKE '00{prefix}%' THEN substr({stripped}, {len(prefix) + 3}) "
+        f"ELSE replace({stripped}, '+', '') END"
+    )
+
+
+def _migration_bookings_fts(cursor):
+    """Índice full-text (FTS5 trigram) sobre contacto, nome, email e telefone
+    
+    Mantido por triggers. Se o SQLite não tiver FTS5/trigram (< 3.34), a
+    pesquisa continua a funcionar com LIKE.
+    """
+    try:
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS bookings_fts USING fts5(
+                contact, name, email, phone, phone_digits,
+                tokenize = 'trigram'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        print(f"FTS5 trigram indisponível - pesquisa de contactos usa LIKE: {e}")
+        return
+    
+    new_values = f"NEW.id, NEW.contact, NEW.name, NEW.email, NEW.phone, {_phone_digits_sql('NEW.phone')}"
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_fts_insert
+        AFTER INSERT ON bookings
+        BEGIN
+            INSERT INTO bookings_fts (rowid, contact, name, email, phone, phone_digits)
+            VALUES ({new_values});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_fts_update
+        AFTER UPDATE OF contact, name, email, phone ON bookings
+        BEGIN
+            DELETE FROM bookings_fts WHERE rowid = OLD.id;
+            INSERT INTO bookings_fts (rowid, contact, name, email, phone, phone_digits)
+            VALUES ({new_values});
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_fts_delete
+        AFTER DELETE ON bookings
+        BEGIN
+            DELETE FROM bookings_fts WHERE rowid = OLD.id;
+        END
+    ''')
+    
+    # Indexar as reservas existentes
+    cursor.execute(f'''
+        INSERT INTO bookings_fts (rowid, contact, name, email, phone, phone_digits)
+        SELECT id, contact, name, email, phone, {_phone_digits_sql('phone')}
+        FROM bookings
+    ''')
+
+
+def _booking_stats_changes(row: str, sign: int) -> List[str]:
+    """Instruções SQL que somam (sign=1) ou retiram (sign=-1) uma reserva dos agregados"""
+    upsert = '''
+            INSERT INTO booking_stats (bucket, key, count, total)
+            SELECT {bucket}, {key}, {sign}, {total}
+            WHERE {condition}
+            ON CONFLICT (bucket, key) DO UPDATE SET
+                count = count + excluded.count,
+                total = total + excluded.total;'''
+    duration = f"(julianday({row}.return_time) - julianday({row}.booking_time)) * 24"
+    aggregates = [
+        ("'total'", "''", '0', '1'),
+        ("'status'", f"COALESCE({row}.status, '')", '0', '1'),
+        ("'locker'", f"{row}.locker_number", '0', '1'),
+        ("'day'", f"DATE({row}.booking_time)", '0', f"{row}.booking_time IS NOT NULL"),
+        # Duração (horas) por status, para reservas com hora de devolução
+        ("'duration'", f"COALESCE({row}.status, '')", duration,
+         f"{row}.return_time IS NOT NULL AND {row}.booking_time IS NOT NULL"),
+    ]
+    return [
+        upsert.format(bucket=bucket, key=key, sign=sign,
+                      total=total if sign > 0 else f'-({total})', condition=condition)
+        for bucket, key, total, condition in aggregates
+    ]
+
+
+def _migration_booking_stats(cursor):
+    """Agregados de estatísticas (booking_stats) mantidos por triggers
+    
+    Cada linha é um contador (bucket, key) com count e total (soma de horas
+    no bucket 'duration'). Os triggers atualizam-nos na mesma transação de
+    book_locker/unlock_locker/return_locker, por isso get_booking_statistics
+    lê um número fixo de linhas independentemente do histórico.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS booking_stats (
+            bucket TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (bucket, key)
+        ) WITHOUT ROWID
+    ''')
+    
+    add_new = ''.join(_booking_stats_changes('NEW', 1))
+    remove_old = ''.join(_booking_stats_changes('OLD', -1))
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_stats_insert
+        AFTER INSERT ON bookings
+        BEGIN{add_new}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_stats_update
+        AFTER UPDATE OF status, locker_number, booking_time, return_time ON bookings
+        BEGIN{remove_old}{add_new}
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_bookings_stats_delete
+        AFTER DELETE ON bookings
+        BEGIN{remove_old}
+        END
+    ''')
+    
+    # Calcular os agregados do histórico existente
+    cursor.execute('DELETE FROM booking_stats')
+    cursor.execute('''
+        INSERT INTO booking_stats (bucket, key, count, total)
+        SELECT 'total', '', COUNT(*), 0 FROM bookings
+    ''')
+    cursor.execute('''
+        INSERT INTO booking_stats (bucket, key, count, total)
+        SELECT 'status', COALESCE(status, ''), COUNT(*), 0 FROM bookings GROUP BY 2
+    ''')
+    cursor.execute('''
+        INSERT INTO booking_stats (bucket, key, count, total)
+        SELECT 'locker', locker_number, COUNT(*), 0 FROM bookings GROUP BY 2
+    ''')
+    cursor.execute('''
+        INSERT INTO booking_stats (bucket, key, count, total)
+        SELECT 'day', DATE(booking_time), COUNT(*), 0 FROM bookings
+        WHERE booking_time IS NOT NULL GROUP BY 2
+    ''')
+    cursor.execute('''
+        INSERT INTO booking_stats (bucket, key, count, total)
+        SELECT 'duration', COALESCE(status, ''), COUNT(*),
+               SUM((julianday(return_time) - julianday(booking_time)) * 24)
+        FROM bookings
+        WHERE return_time IS NOT NULL AND booking_time IS NOT NULL
+        GROUP BY 2
+    ''')
+
+
+def _migration_data_version(cursor):
+    """Contador de versão dos dados, incrementado por triggers em cada escrita
+    
+    Partilhado entre processos (kiosk e API) por estar na própria base de
+    dados. Serve para ETags/caches: se a versão não mudou, as consultas
+    devolvem o mesmo resultado.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR IGNORE INTO data_version (id, version, updated_at)
+        VALUES (1, 0, CURRENT_TIMESTAMP)
+    ''')
+    
+    for table in ('bookings', 'lockers'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_data_version_{event.lower()}
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE data_version
+                    SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = 1;
+                END
+            ''')
+
+
+def _migration_change_events(cursor):
+    """Feed de alterações (change_events) para notificações em tempo real
+    
+    Triggers registam reservas criadas/alteradas, mudanças de estado dos
+    cacifos e entradas de log. Os ids são crescentes, por isso um cliente
+    pode retomar o feed a partir do último evento que recebeu.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            event TEXT NOT NULL,
+            locker_number TEXT,
+            booking_id INTEGER,
+            status TEXT,
+            details TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_change_events_created_at
+        ON change_events (created_at)
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_change_booking_created
+        AFTER INSERT ON bookings
+        BEGIN
+            INSERT INTO change_events (event, locker_number, booking_id, status)
+            VALUES ('booking_created', NEW.locker_number, NEW.id, NEW.status);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_change_booking_updated
+        AFTER UPDATE OF status ON bookings
+        WHEN OLD.status IS NOT NEW.status
+        BEGIN
+            INSERT INTO change_events (event, locker_number, booking_id, status, details)
+            VALUES ('booking_updated', NEW.locker_number, NEW.id, NEW.status, OLD.status);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_change_locker_status
+        AFTER UPDATE OF status ON lockers
+        WHEN OLD.status IS NOT NEW.status
+        BEGIN
+            INSERT INTO change_events (event, locker_number, status, details)
+            VALUES ('locker_status', NEW.locker_number, NEW.status, OLD.status);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_change_log
+        AFTER INSERT ON system_logs
+        BEGIN
+            INSERT INTO change_events (event, locker_number, status, details)
+            VALUES ('log', NEW.locker_number, NEW.action, NEW.details);
+        END
+    ''')
+
+
+def _migration_notification_outbox(cursor):
+    """Fila persistente de notificações (email/SMS) enviadas em segundo plano
+    
+    O dispatcher (notification_queue.py) lê as mensagens 'pending' cuja
+    next_attempt_at já passou; as falhas voltam a 'pending' com backoff até
+    max_attempts. Sobrevive a reinícios do kiosk.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            booking_id INTEGER,
+            channel TEXT NOT NULL,
+            recipient TEXT NOT NULL,
+            subject TEXT DEFAULT '',
+            body TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL DEFAULT 5,
+            next_attempt_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            last_error TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            sent_at DATETIME,
+            FOREIGN KEY (booking_id) REFERENCES bookings (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_notification_outbox_due
+        ON notification_outbox (status, next_attempt_at)
+    ''')
+
+
+def _migration_bulk_notifications(cursor):
+    """Envios em massa (alertas de permanência, encerramento do local)
+
+    bulk_notifications guarda cada envio e bulk_notification_results o
+    resultado por destinatário. O índice em active_bookings (booking_time)
+    serve a seleção das reservas com mais de N horas.
+    """
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bulk_notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            subject TEXT DEFAULT '',
+            body TEXT DEFAULT '',
+            sms_body TEXT DEFAULT '',
+            status TEXT NOT NULL DEFAULT 'running',
+            total INTEGER NOT NULL DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            completed_at DATETIME
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bulk_notification_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            bulk_id INTEGER NOT NULL,
+            booking_id INTEGER,
+            channel TEXT NOT NULL,
+            recipient TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            error TEXT,
+            completed_at DATETIME,
+            FOREIGN KEY (bulk_id) REFERENCES bulk_notifications (id),
+            FOREIGN KEY (booking_id) REFERENCES bookings (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_bulk_notification_results_bulk
+        ON bulk_notification_results (bulk_id, status)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_active_bookings_time
+        ON active_bookings (booking_time)
+    ''')
+
+
+def _migration_service_metrics(cursor):
+    """Snapshots de métricas (ex.: notificações) gravados pelo kiosk para a API"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS service_metrics (
+            name TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _migration_close_returned_bookings(cursor):
+    """Termina reservas que ficaram ativas em cacifos já devolvidos
+    
+    return_locker só terminava reservas 'active', por isso reservas
+    'booked' de cacifos devolvidos ficavam em active_bookings (e o PIN
+    continuava a desbloquear o cacifo).
+    """
+    cursor.execute('''
+        UPDATE bookings
+        SET status = 'completed', return_time = COALESCE(return_time, CURRENT_TIMESTAMP)
+        WHERE id IN (
+            SELECT a.booking_id FROM active_bookings a
+            JOIN lockers l ON l.locker_number = a.locker_number
+            WHERE l.status = 'available'
+        )
+    ''')
+
+
+SCHEMA_MIGRATIONS = [
+    (1, 'Tabelas base: lockers, bookings, system_logs', _migration_base_tables),
+    (2, 'Colunas de contacto em bookings', _migration_contact_columns),
+    (3, 'Índices de acesso para bookings e system_logs', _migration_access_path_indexes),
+    (4, 'Versionamento da KDF dos PINs', _migration_pin_kdf_columns),
+    (5, 'Tabela active_bookings mantida por triggers', _migration_active_bookings),
+    (6, 'Índice full-text de contactos (FTS5 trigram)', _migration_bookings_fts),
+    (7, 'Agregados de estatísticas (booking_stats) mantidos por triggers', _migration_booking_stats),
+    (8, 'Contador data_version para caches e ETags', _migration_data_version),
+    (9, 'Feed de alterações (change_events) mantido por triggers', _migration_change_events),
+    (10, 'Fila de notificações (notification_outbox)', _migration_notification_outbox),
+    (11, 'Envios em massa (bulk_notifications) e índice por booking_time', _migration_bulk_notifications),
+    (12, 'Snapshots de métricas dos serviços (service_metrics)', _migration_service_metrics),
+    (13, 'Termina reservas ativas de cacifos já devolvidos', _migration_close_returned_bookings),
+]
+
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
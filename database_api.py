@@ -6,10 +6,20 @@ Database API - Acesso Remoto ao SQLite
 API REST simples para consultar a base de dados remotamente
 """
 
-from flask import Flask, jsonify, request, render_template_string
+from flask import Flask, jsonify, request, render_template_string, stream_with_context
 from flask_cors import CORS
 import json
-from database import LockerDatabase
+from database import LockerDatabase, BOOKING_PAGE_SIZE
+from pin_hashing import configure_pin_kdf_from_env
+import booking_export
+from api_cache import ResponseCache, make_etag, parse_db_timestamp
+from api_shared import (HTML_TEMPLATE, SSE_HEARTBEAT_SECONDS, SSE_CLIENT_QUEUE_SIZE, cache_version,
+                        format_sse, enrich_change_events, notification_metrics, parse_export_filters,
+                        gzip_stream)
+import functools
+import queue
+import argparse
+import signal
 from datetime import datetime
 import os
 import webbrowser
@@ -22,438 +32,308 @@ CORS(app)  # Permite acesso de outros computadores
 # Inicializar database
 db = LockerDatabase()
 
-# Template HTML simples para interface web
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html>
-<head>
-    <title>Locker System - Database Viewer</title>
-    <meta charset="utf-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1">
-    <style>
-        body { font-family: 'Segoe UI', Arial, sans-serif; margin: 0; padding: 20px; background: #f5f7fa; }
-        .container { max-width: 1200px; margin: 0 auto; }
-        .header { background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; border-radius: 12px; margin-bottom: 30px; box-shadow: 0 4px 15px rgba(0,0,0,0.1); }
-        .header h1 { margin: 0; font-size: 2.5em; text-align: center; }
-        .header p { margin: 10px 0 0 0; text-align: center; opacity: 0.9; }
-        .section { background: white; padding: 25px; margin-bottom: 25px; border-radius: 12px; box-shadow: 0 2px 10px rgba(0,0,0,0.08); }
-        .booking { border: 1px solid #e1e8ed; padding: 15px; margin: 10px 0; border-radius: 8px; transition: all 0.3s ease; }
-        .booking:hover { box-shadow: 0 2px 8px rgba(0,0,0,0.1); }
-        .booking.booked { border-left: 4px solid #f39c12; background: #fef9e7; }
-        .booking.unlocked { border-left: 4px solid #e74c3c; background: #fdedec; }
-        .booking.completed { border-left: 4px solid #27ae60; background: #eafaf1; }
-        .booking.available { border-left: 4px solid #95a5a6; background: #f8f9fa; }
-        .stats { display: grid; grid-template-columns: repeat(auto-fit, minmax(250px, 1fr)); gap: 20px; margin-bottom: 20px; }
-        .stat-box { background: white; padding: 20px; border-radius: 10px; border-left: 4px solid #3498db; text-align: center; box-shadow: 0 2px 8px rgba(0,0,0,0.05); }
-        .stat-box h3 { margin: 0 0 10px 0; color: #2c3e50; font-size: 1.1em; }
-        .stat-box p { margin: 0; font-size: 2em; font-weight: bold; color: #3498db; }
-        .controls { display: flex; flex-wrap: wrap; gap: 10px; margin-bottom: 20px; }
-        .btn { padding: 12px 20px; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; border: none; border-radius: 6px; cursor: pointer; font-size: 14px; transition: all 0.3s ease; }
-        .btn:hover { transform: translateY(-2px); box-shadow: 0 4px 15px rgba(102, 126, 234, 0.4); }
-        .btn.secondary { background: linear-gradient(135deg, #74b9ff 0%, #0984e3 100%); }
-        .btn.success { background: linear-gradient(135deg, #55efc4 0%, #00b894 100%); }
-        .btn.warning { background: linear-gradient(135deg, #fdcb6e 0%, #e17055 100%); }
-        .search-box { padding: 12px; border: 2px solid #ddd; border-radius: 6px; font-size: 14px; width: 200px; transition: border-color 0.3s ease; }
-        .search-box:focus { outline: none; border-color: #667eea; }
-        .loading { text-align: center; padding: 40px; color: #74b9ff; font-size: 1.2em; }
-        .error { text-align: center; padding: 40px; color: #e74c3c; font-size: 1.2em; }
-        .no-data { text-align: center; padding: 40px; color: #95a5a6; font-size: 1.2em; }
-        .status-badge { display: inline-block; padding: 4px 8px; border-radius: 12px; font-size: 0.8em; font-weight: bold; text-transform: uppercase; }
-        .status-booked { background: #fff3cd; color: #856404; }
-        .status-unlocked { background: #f8d7da; color: #721c24; }
-        .status-completed { background: #d1ecf1; color: #0c5460; }
-        .status-available { background: #e2e3e5; color: #383d41; }
-        .refresh-info { text-align: center; margin-top: 20px; color: #6c757d; font-size: 0.9em; }
-        .booking-id { font-weight: bold; color: #495057; }
-        .booking-locker { font-weight: bold; color: #667eea; }
-        .booking-contact { color: #28a745; }
-        .booking-time { color: #6c757d; font-size: 0.9em; }
-        .contact-details { line-height: 1.4; }
-        .contact-details strong { margin-right: 5px; }
-        
-        @media (max-width: 768px) {
-            .container { padding: 10px; }
-            .stats { grid-template-columns: 1fr; }
-            .controls { flex-direction: column; }
-            .search-box { width: 100%; }
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>🔒 Locker System Database</h1>
-            <p>Remote Database Access - Last Updated: <span id="lastUpdate">Loading...</span></p>
-        </div>
-
-        <div class="section">
-            <h2>📊 System Overview</h2>
-            <div class="stats" id="statsContainer">
-                <div class="stat-box">
-                    <h3>Total Bookings</h3>
-                    <p id="totalBookings">-</p>
-                </div>
-                <div class="stat-box">
-                    <h3>Active Bookings</h3>
-                    <p id="activeBookings">-</p>
-                </div>
-                <div class="stat-box">
-                    <h3>Completed Today</h3>
-                    <p id="completedToday">-</p>
-                </div>
-                <div class="stat-box">
-                    <h3>Most Used Locker</h3>
-                    <p id="mostUsed">-</p>
-                </div>
-            </div>
-        </div>
-
-        <div class="section">
-            <h2>🔍 Query Options</h2>
-            <div class="controls">
-                <button class="btn" onclick="loadAllBookings()">📋 All Bookings</button>
-                <button class="btn secondary" onclick="loadActiveBookings()">🔴 Active Only</button>
-                <button class="btn success" onclick="loadRecentBookings()">📅 Recent (7 days)</button>
-                <button class="btn warning" onclick="loadStats()">📊 Detailed Stats</button>
-                <input type="text" class="search-box" id="searchContact" placeholder="Search by name, email, phone..." onkeypress="handleSearchKeyPress(event)">
-                <button class="btn" onclick="searchByContact()">🔍 Search</button>
-                <button class="btn secondary" onclick="exportData()">📄 Export CSV</button>
-            </div>
-        </div>
-
-        <div class="section">
-            <h2 id="dataTitle">📋 Booking Data</h2>
-            <div id="dataContainer">
-                <div class="no-data">Click a button above to load data...</div>
-            </div>
-            <div class="refresh-info">
-                <small>Data refreshes automatically every 30 seconds</small>
-            </div>
-        </div>
-    </div>
-
-    <script>
-        const API_BASE = window.location.origin;
-        let currentEndpoint = null;
-        let refreshInterval = null;
-        
-        function updateLastUpdate() {
-            document.getElementById('lastUpdate').textContent = new Date().toLocaleString();
-        }
-        
-        function handleSearchKeyPress(event) {
-            if (event.key === 'Enter') {
-                searchByContact();
-            }
-        }
-        
-        async function loadStats() {
-            try {
-                const response = await fetch(`${API_BASE}/api/stats`);
-                const stats = await response.json();
-                
-                document.getElementById('totalBookings').textContent = stats.total_bookings || 0;
-                
-                // Calculate active bookings
-                const activeCount = Object.entries(stats.status_counts || {})
-                    .filter(([status]) => ['booked', 'unlocked'].includes(status))
-                    .reduce((sum, [_, count]) => sum + count, 0);
-                document.getElementById('activeBookings').textContent = activeCount;
-                
-                // Get today's completed (mock for now)
-                document.getElementById('completedToday').textContent = stats.status_counts?.completed || 0;
-                
-                document.getElementById('mostUsed').textContent = 
-                    stats.most_used_locker ? stats.most_used_locker.locker : 'N/A';
-                
-                document.getElementById('dataTitle').textContent = '📊 Detailed Statistics';
-                document.getElementById('dataContainer').innerHTML = `
-                    <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(300px, 1fr)); gap: 20px;">
-                        <div style="background: #f8f9fa; padding: 20px; border-radius: 8px;">
-                            <h3 style="margin-top: 0; color: #495057;">Status Distribution</h3>
-                            <ul style="list-style: none; padding: 0;">
-                                ${Object.entries(stats.status_counts || {}).map(([status, count]) => `
-                                    <li style="margin: 10px 0; display: flex; justify-content: space-between;">
-                                        <span class="status-badge status-${status}">${status}</span>
-                                        <strong>${count}</strong>
-                                    </li>
-                                `).join('')}
-                            </ul>
-                        </div>
-                        
-                        ${stats.most_used_locker ? `
-                            <div style="background: #f8f9fa; padding: 20px; border-radius: 8px;">
-                                <h3 style="margin-top: 0; color: #495057;">Most Popular</h3>
-                                <p style="font-size: 1.5em; margin: 10px 0;">
-                                    <span class="booking-locker">Locker ${stats.most_used_locker.locker}</span>
-                                </p>
-                                <p style="color: #6c757d;">${stats.most_used_locker.count} total bookings</p>
-                            </div>
-                        ` : ''}
-                        
-                        ${stats.average_duration_hours > 0 ? `
-                            <div style="background: #f8f9fa; padding: 20px; border-radius: 8px;">
-                                <h3 style="margin-top: 0; color: #495057;">Average Usage</h3>
-                                <p style="font-size: 1.5em; margin: 10px 0; color: #28a745;">
-                                    ${stats.average_duration_hours.toFixed(1)} hours
-                                </p>
-                                <p style="color: #6c757d;">Per completed booking</p>
-                            </div>
-                        ` : ''}
-                    </div>
-                `;
-                updateLastUpdate();
-            } catch (error) {
-                console.error('Error loading stats:', error);
-                document.getElementById('dataContainer').innerHTML = '<div class="error">❌ Error loading statistics</div>';
-            }
-        }
-        
-        async function loadAllBookings() {
-            currentEndpoint = '/api/bookings?limit=50';
-            await loadBookings(currentEndpoint, 'All Bookings (Last 50)');
-        }
-        
-        async function loadActiveBookings() {
-            currentEndpoint = '/api/bookings/active';
-            await loadBookings(currentEndpoint, 'Active Bookings');
-        }
-        
-        async function loadRecentBookings() {
-            currentEndpoint = '/api/bookings/recent?days=7';
-            await loadBookings(currentEndpoint, 'Recent Bookings (7 days)');
-        }
-        
-        async function searchByContact() {
-            const contact = document.getElementById('searchContact').value.trim();
-            if (!contact) {
-                alert('Please enter a name, email, or phone number to search for');
-                return;
-            }
-            currentEndpoint = `/api/bookings/contact/${encodeURIComponent(contact)}`;
-            await loadBookings(currentEndpoint, `Bookings for "${contact}"`);
-        }
-        
-        async function loadBookings(endpoint, title) {
-            try {
-                document.getElementById('dataContainer').innerHTML = '<div class="loading">⏳ Loading data...</div>';
-                const response = await fetch(`${API_BASE}${endpoint}`);
-                
-                if (!response.ok) {
-                    throw new Error(`HTTP ${response.status}`);
-                }
-                
-                const bookings = await response.json();
-                
-                document.getElementById('dataTitle').textContent = `📋 ${title} (${bookings.length})`;
-                
-                if (bookings.length === 0) {
-                    document.getElementById('dataContainer').innerHTML = '<div class="no-data">📭 No bookings found.</div>';
-                    return;
-                }
-                
-                const bookingsHtml = bookings.map(booking => `
-                    <div class="booking ${booking.status}">
-                        <div style="display: flex; justify-content: space-between; align-items: center; margin-bottom: 10px;">
-                            <span class="booking-id">ID: ${booking.id}</span>
-                            <span class="status-badge status-${booking.status}">${booking.status}</span>
-                        </div>
-                        <div style="display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 10px;">
-                            <div class="contact-details">
-                                <strong>🔒 Locker:</strong> <span class="booking-locker">${booking.locker_number}</span><br>
-                                ${booking.name ? `<strong>👤 Name:</strong> <span class="booking-contact">${booking.name}</span><br>` : ''}
-                                ${booking.email ? `<strong>📧 Email:</strong> <span class="booking-contact">${booking.email}</span><br>` : ''}
-                                ${booking.phone ? `<strong>📱 Phone:</strong> <span class="booking-contact">${booking.phone}</span><br>` : ''}
-                                ${booking.birth_date ? `<strong>🎂 Birth Date:</strong> <span class="booking-contact">${booking.birth_date}</span><br>` : ''}
-                                ${booking.contact && !booking.email ? `<strong>👤 Contact:</strong> <span class="booking-contact">${booking.contact}</span><br>` : ''}
-                                <strong>🔑 PIN:</strong> <span style="color: #e74c3c; font-weight: bold;">${booking.pin || 'N/A'}</span>
-                            </div>
-                            <div>
-                                <div class="booking-time"><strong>📅 Booked:</strong> ${formatDateTime(booking.booking_time)}</div>
-                                ${booking.unlock_time ? `<div class="booking-time"><strong>🔓 Unlocked:</strong> ${formatDateTime(booking.unlock_time)}</div>` : ''}
-                                ${booking.return_time ? `<div class="booking-time"><strong>🔄 Returned:</strong> ${formatDateTime(booking.return_time)}</div>` : ''}
-                            </div>
-                        </div>
-                        ${booking.notes ? `<div style="margin-top: 10px; padding-top: 10px; border-top: 1px solid #eee;"><strong>📝 Notes:</strong> ${booking.notes}</div>` : ''}
-                    </div>
-                `).join('');
-                
-                document.getElementById('dataContainer').innerHTML = bookingsHtml;
-                updateLastUpdate();
-            } catch (error) {
-                console.error('Error loading bookings:', error);
-                document.getElementById('dataContainer').innerHTML = '<div class="error">❌ Error loading data. Please check your connection.</div>';
-            }
-        }
-        
-        function formatDateTime(dateTimeString) {
-            if (!dateTimeString) return 'N/A';
-            try {
-                const date = new Date(dateTimeString);
-                return date.toLocaleString();
-            } catch (e) {
-                return dateTimeString;
-            }
-        }
-        
-        async function exportData() {
-            try {
-                const response = await fetch(`${API_BASE}/api/export`);
-                const blob = await response.blob();
-                const url = window.URL.createObjectURL(blob);
-                const a = document.createElement('a');
-                a.style.display = 'none';
-                a.href = url;
-                a.download = `locker_bookings_${new Date().toISOString().split('T')[0]}.csv`;
-                document.body.appendChild(a);
-                a.click();
-                window.URL.revokeObjectURL(url);
-                alert('📄 Data exported successfully!');
-            } catch (error) {
-                console.error('Export error:', error);
-                alert('❌ Export failed. Please try again.');
-            }
-        }
-        
-        // Auto-refresh current data
-        function startAutoRefresh() {
-            if (refreshInterval) clearInterval(refreshInterval);
-            refreshInterval = setInterval(() => {
-                if (currentEndpoint) {
-                    const titleMatch = document.getElementById('dataTitle').textContent.match(/📋 (.+) \\(\\d+\\)/);
-                    const title = titleMatch ? titleMatch[1] : 'Data';
-                    loadBookings(currentEndpoint, title);
-                }
-                loadStats(); // Always refresh stats
-            }, 30000); // 30 seconds
-        }
-        
-        // Initialize
-        document.addEventListener('DOMContentLoaded', function() {
-            loadStats();
-            startAutoRefresh();
-            updateLastUpdate();
-        });
+# Cache de respostas, invalidada quando data_version muda
+response_cache = ResponseCache()
+
+# Streams SSE abertos por processo. Cada stream ocupa uma thread do servidor
+# enquanto está aberto, por isso o limite fica abaixo do número de threads
+# (ver --sse-clients); acima do limite o dashboard usa polling
+SSE_MAX_CLIENTS = 4
+
+class ChangeBroadcaster:
+    """Distribui os eventos de alteração da base de dados pelos clientes SSE
+    
+    Regista um único listener em LockerDatabase (quando o primeiro cliente se
+    liga) e copia cada evento para a fila de cada cliente. As reservas
+    afetadas são lidas uma vez por lote, não uma vez por cliente.
+    """
+    
+    def __init__(self, database, max_clients: int = SSE_MAX_CLIENTS):
+        self.db = database
+        self.max_clients = max_clients
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._listening = False
+    
+    def subscribe(self):
+        """Fila do novo cliente, ou None se já há max_clients streams abertos"""
+        client = queue.Queue(maxsize=SSE_CLIENT_QUEUE_SIZE)
+        with self._lock:
+            if len(self._clients) >= self.max_clients:
+                return None
+            self._clients.add(client)
+            if not self._listening:
+                self.db.add_change_listener(self._on_changes)
+                self._listening = True
+        return client
+    
+    def unsubscribe(self, client: queue.Queue):
+        with self._lock:
+            self._clients.discard(client)
+    
+    def client_count(self) -> int:
+        with self._lock:
+            return len(self._clients)
+    
+    def close(self):
+        """Termina todos os streams abertos (usado no encerramento do servidor)"""
+        with self._lock:
+            clients = list(self._clients)
+            self._clients.clear()
+        for client in clients:
+            with client.mutex:
+                client.queue.clear()
+            client.put_nowait(None)
+    
+    def _on_changes(self, events: list):
+        with self._lock:
+            clients = list(self._clients)
+        if not clients:
+            return
         
-        // Stop refresh when page is hidden
-        document.addEventListener('visibilitychange', function() {
-            if (document.hidden) {
-                if (refreshInterval) clearInterval(refreshInterval);
-            } else {
-                startAutoRefresh();
-            }
-        });
-    </script>
-</body>
-</html>
-"""
+        for event in enrich_change_events(self.db, events):
+            for client in clients:
+                try:
+                    client.put_nowait(event)
+                except queue.Full:
+                    # Cliente demasiado lento: descartar e pedir-lhe que recarregue
+                    with client.mutex:
+                        client.queue.clear()
+                    client.put_nowait({'id': event['id'], 'event': 'resync'})
+
+
+broadcaster = ChangeBroadcaster(db)
+
 
 @app.route('/')
 def index():
     """Interface web principal"""
     return render_template_string(HTML_TEMPLATE)
 
+def cached_endpoint(view):
+    """Respostas com ETag/Last-Modified e cache validada pela versão dos dados
+    
+    Se a versão (data_version) não mudou desde o último pedido, responde 304
+    ao If-None-Match do browser ou devolve a resposta guardada em cache, sem
+    voltar a consultar a base de dados.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        version, updated_at = db.get_data_version()
+        current_version = cache_version(version)
+        etag = make_etag(*current_version)
+        
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            entry = response_cache.get(request.full_path, current_version)
+            if entry:
+                body, status, mimetype = entry
+                response = app.response_class(body, status=status, mimetype=mimetype)
+            else:
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response_cache.put(request.full_path, current_version, response.get_data(),
+                                   response.status_code, response.mimetype)
+        
+        response.set_etag(etag)
+        last_modified = parse_db_timestamp(updated_at)
+        if last_modified:
+            response.last_modified = last_modified
+        # O browser guarda a resposta mas revalida sempre (304 se não mudou)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+    
+    return wrapper
+
+def booking_page_response(**filters):
+    """Resposta paginada: {'bookings', 'next_cursor'} (?limit=&cursor=)"""
+    limit = request.args.get('limit', BOOKING_PAGE_SIZE, type=int)
+    cursor = request.args.get('cursor') or None
+    try:
+        page = db.get_bookings_page(limit=limit, cursor=cursor, **filters)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(page)
+
 @app.route('/api/bookings')
+@cached_endpoint
 def get_all_bookings():
-    """API: Todas as reservas"""
+    """API: Todas as reservas (paginadas)"""
     try:
-        limit = request.args.get('limit', type=int)
-        bookings = db.get_all_bookings(limit=limit)
-        
-        # Debug: imprimir primeira reserva
-        if bookings:
-            print(f"DEBUG: First booking keys: {list(bookings[0].keys())}")
-            print(f"DEBUG: First booking PIN: {bookings[0].get('pin', 'NOT FOUND')}")
-        
-        return jsonify(bookings)
+        return booking_page_response()
     except Exception as e:
         print(f"ERROR in get_all_bookings: {e}")
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/bookings/active')
+@cached_endpoint
 def get_active_bookings():
     """API: Reservas ativas"""
     try:
-        all_bookings = db.get_all_bookings()
-        active_bookings = [b for b in all_bookings if b['status'] in ['booked', 'unlocked']]
-        return jsonify(active_bookings)
+        return jsonify({'bookings': db.get_active_bookings(), 'next_cursor': None})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/bookings/recent')
+@cached_endpoint
 def get_recent_bookings():
-    """API: Reservas recentes"""
+    """API: Reservas recentes (paginadas)"""
     try:
         days = request.args.get('days', 7, type=int)
-        bookings = db.get_recent_bookings(days=days)
-        return jsonify(bookings)
+        return booking_page_response(days=days)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/bookings/contact/<contact>')
+@cached_endpoint
 def get_bookings_by_contact(contact):
-    """API: Reservas por contacto"""
+    """API: Reservas por contacto (paginadas)"""
+    try:
+        return booking_page_response(contact_search=contact)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/bookings/search')
+@cached_endpoint
+def search_bookings():
+    """API: Pesquisa de reservas (contacto, nome, email ou telefone) com ranking"""
     try:
-        bookings = db.get_bookings_by_contact(contact)
-        return jsonify(bookings)
+        query = request.args.get('q', '')
+        limit = request.args.get('limit', 20, type=int)
+        offset = request.args.get('offset', 0, type=int)
+        return jsonify(db.search_bookings(query, limit=limit, offset=offset))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/bookings/locker/<locker_number>')
+@cached_endpoint
 def get_bookings_by_locker(locker_number):
-    """API: Reservas por locker"""
+    """API: Reservas por locker (paginadas)"""
     try:
-        bookings = db.get_bookings_by_locker(locker_number)
-        return jsonify(bookings)
+        return booking_page_response(locker_number=locker_number)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/stats')
+@cached_endpoint
 def get_statistics():
     """API: Estatísticas"""
     try:
         stats = db.get_booking_statistics()
-        # Add some additional stats
-        all_bookings = db.get_all_bookings()
-        active_count = len([b for b in all_bookings if b['status'] in ['booked', 'unlocked']])
-        stats['active_bookings'] = active_count
+        stats['active_bookings'] = db.count_active_bookings()
         return jsonify(stats)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def columnar_stream(bookings, fmt, chunk_size=64 * 1024):
+    """Escreve Arrow/Parquet num ficheiro temporário e envia-o em blocos
+    
+    Os dois formatos têm um rodapé no fim, por isso são gerados primeiro em
+    disco (não em memória) e só depois enviados.
+    """
+    import tempfile
+    
+    with tempfile.TemporaryFile() as tmp:
+        booking_export.write_columnar(bookings, tmp, fmt)
+        tmp.seek(0)
+        while True:
+            data = tmp.read(chunk_size)
+            if not data:
+                break
+            yield data
+
 @app.route('/api/export')
 def export_csv():
-    """API: Exportar dados em CSV"""
+    """API: Exportar reservas (em streaming)
+    
+    Parâmetros opcionais: format (csv, ndjson, arrow, parquet), start, end
+    (YYYY-MM-DD), locker e gzip=1 (formatos de texto). CSV e NDJSON são
+    enviados à medida que são lidos da base de dados (chunked transfer
+    encoding), com memória constante.
+    """
+    fmt = request.args.get('format', 'csv').lower()
     try:
-        import csv
-        from io import StringIO
-        
-        bookings = db.get_all_bookings()
-        
-        # Criar CSV em memória
-        output = StringIO()
-        fieldnames = ['id', 'locker_number', 'contact', 'pin', 'status', 
-                     'booking_time', 'unlock_time', 'return_time', 'notes']
-        writer = csv.DictWriter(output, fieldnames=fieldnames)
-        
-        writer.writeheader()
-        for booking in bookings:
-            writer.writerow(booking)
+        booking_export.check_format(fmt)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'formats': booking_export.available_formats()}), 400
+    
+    try:
+        filters = parse_export_filters(request.args)
+    except ValueError:
+        return jsonify({'error': 'Invalid date - use YYYY-MM-DD'}), 400
+    
+    try:
+        bookings = db.iter_bookings(**filters)
+        filename = booking_export.export_filename(fmt)
+        mimetype = booking_export.EXPORT_FORMATS[fmt][1]
         
-        # Preparar response
-        csv_data = output.getvalue()
-        output.close()
+        if fmt in booking_export.COLUMNAR_FORMATS:
+            chunks = columnar_stream(bookings, fmt)
+        else:
+            chunks = booking_export.iter_csv(bookings) if fmt == 'csv' else booking_export.iter_ndjson(bookings)
+            if request.args.get('gzip', '').lower() in ('1', 'true', 'yes'):
+                chunks = gzip_stream(chunks)
+                filename += '.gz'
+                mimetype = 'application/gzip'
         
-        response = app.response_class(
-            csv_data,
-            mimetype='text/csv',
-            headers={'Content-Disposition': f'attachment; filename=locker_bookings_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'}
-        )
-        return response
+        headers = {'Content-Disposition': f'attachment; filename={filename}'}
+        return app.response_class(stream_with_context(chunks), mimetype=mimetype, headers=headers)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/events')
+def events_stream():
+    """API: Feed de alterações em tempo real (Server-Sent Events)
+    
+    Eventos: booking_created, booking_updated (com a reserva completa),
+    locker_status, log e resync. Ao reconectar, o browser envia
+    Last-Event-ID e os eventos perdidos são reenviados.
+    """
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is None:
+        last_event_id = request.args.get('last_event_id', type=int)
+    
+    client = broadcaster.subscribe()
+    if client is None:
+        # Todas as vagas SSE ocupadas - o dashboard passa a usar polling
+        response = jsonify({'error': 'Too many live connections, use polling or the asyncio server'})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+    
+    def generate():
+        try:
+            yield 'retry: 3000\n\n'
+            
+            # Eventos perdidos durante a desconexão
+            sent_id = last_event_id or 0
+            if last_event_id is not None:
+                for event in enrich_change_events(db, db.get_change_events(after_id=last_event_id, limit=SSE_CLIENT_QUEUE_SIZE)):
+                    sent_id = event['id']
+                    yield format_sse(event)
+            
+            while True:
+                try:
+                    event = client.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                if event is None:
+                    return  # servidor a encerrar
+                if event['event'] != 'resync' and event['id'] <= sent_id:
+                    continue  # já enviado no replay
+                yield format_sse(event)
+        finally:
+            broadcaster.unsubscribe(client)
+    
+    return app.response_class(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/status')
 def get_system_status():
     """API: Status do sistema"""
@@ -465,6 +345,9 @@ def get_system_status():
             'timestamp': datetime.now().isoformat(),
             'database': 'connected',
             'total_bookings': stats.get('total_bookings', 0),
+            'data_version': db.get_data_version()[0],
+            'cache': response_cache.stats(),
+            'event_clients': broadcaster.client_count(),
             'version': '1.0.0'
         })
     except Exception as e:
@@ -475,27 +358,159 @@ def get_system_status():
             'error': str(e)
         }), 500
 
+@app.route('/api/metrics')
+def get_metrics():
+    """API: Métricas de envio das notificações (por fornecedor) e fila de envio"""
+    return jsonify(notification_metrics(db))
+
 @app.route('/api/health')
 def health_check():
     """Health check endpoint"""
     return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
 
+def env_flag(name: str) -> bool:
+    """Variável de ambiente booleana (1/true/yes)"""
+    return os.environ.get(name, '').lower() in ('1', 'true', 'yes')
+
+def parse_args(argv=None):
+    """Opções do servidor - cada uma pode vir também de uma variável de ambiente"""
+    parser = argparse.ArgumentParser(description='Locker System Database API')
+    parser.add_argument('--host', default=os.environ.get('API_HOST', '0.0.0.0'),
+                        help='Endereço de escuta (API_HOST, padrão 0.0.0.0)')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('API_PORT', 5000)),
+                        help='Porta (API_PORT, padrão 5000)')
+    parser.add_argument('--production', action='store_true', default=env_flag('API_PRODUCTION'),
+                        help='Servidor de produção multi-thread/multi-processo (API_PRODUCTION)')
+    parser.add_argument('--server', choices=['auto', 'waitress', 'gunicorn'],
+                        default=os.environ.get('API_SERVER', 'auto'),
+                        help='Servidor de produção (API_SERVER, padrão: gunicorn se existir, senão waitress)')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('API_WORKERS', 2)),
+                        help='Processos do gunicorn (API_WORKERS, padrão 2)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('API_THREADS', 8)),
+                        help='Threads por processo (API_THREADS, padrão 8)')
+    parser.add_argument('--pool-size', type=int, default=int(os.environ.get('API_DB_POOL_SIZE', 0)) or None,
+                        help='Conexões SQLite por processo (API_DB_POOL_SIZE, padrão = threads)')
+    parser.add_argument('--sse-clients', type=int, default=int(os.environ.get('API_SSE_MAX_CLIENTS', 0)) or None,
+                        help='Streams /api/events por processo (API_SSE_MAX_CLIENTS, padrão = metade das threads)')
+    parser.add_argument('--no-browser', action='store_true', default=env_flag('API_NO_BROWSER'),
+                        help='Não abrir o navegador ao iniciar (API_NO_BROWSER)')
+    return parser.parse_args(argv)
+
+def shutdown_api():
+    """Encerramento ordenado: fecha os streams SSE e o pool da base de dados"""
+    broadcaster.close()
+    db.close()
+    print("👋 Database API stopped")
+
+def run_waitress(args):
+    """Servidor de produção multi-thread (waitress - funciona também no Windows)"""
+    from waitress import create_server
+    
+    server = create_server(app, host=args.host, port=args.port, threads=args.threads)
+    
+    def on_sigterm(signum, frame):
+        # Fecha os streams SSE para libertar as threads; o waitress sai do loop
+        # e espera até 5 s pelas threads, mas respostas ainda por enviar
+        # perdem-se (para um encerramento gracioso usar o gunicorn)
+        broadcaster.close()
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, on_sigterm)
+    
+    print(f"🏭 waitress: {args.threads} threads, {db.pool.max_size} DB connections, "
+          f"{broadcaster.max_clients} SSE streams")
+    try:
+        server.run()
+    finally:
+        shutdown_api()
+
+def run_gunicorn(args):
+    """Servidor de produção multi-processo (gunicorn - Linux/Raspberry Pi)
+    
+    Cada worker tem o seu próprio pool de conexões: as conexões herdadas do
+    processo principal são descartadas após o fork.
+    """
+    from gunicorn.app.base import BaseApplication
+    
+    class LockerAPIApplication(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+        
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+        
+        def load(self):
+            return self.application
+    
+    def post_fork(server, worker):
+        db.reset_after_fork()
+    
+    def worker_int(worker):
+        broadcaster.close()
+    
+    def worker_exit(server, worker):
+        shutdown_api()
+    
+    options = {
+        'bind': f'{args.host}:{args.port}',
+        'workers': args.workers,
+        'threads': args.threads,
+        # gthread: os streams SSE não bloqueiam o worker inteiro
+        'worker_class': 'gthread',
+        'graceful_timeout': 10,
+        'post_fork': post_fork,
+        'worker_int': worker_int,
+        'worker_exit': worker_exit,
+    }
+    print(f"🏭 gunicorn: {args.workers} workers x {args.threads} threads, "
+          f"{db.pool.max_size} DB connections and {broadcaster.max_clients} SSE streams per worker")
+    LockerAPIApplication(app, options).run()
+
+def run_production(args):
+    """Escolhe e inicia o servidor de produção"""
+    server = args.server
+    if server == 'auto':
+        try:
+            import gunicorn  # noqa: F401 - só para verificar se existe
+            server = 'gunicorn' if os.name == 'posix' else 'waitress'
+        except ImportError:
+            server = 'waitress'
+    
+    try:
+        if server == 'gunicorn':
+            run_gunicorn(args)
+        else:
+            run_waitress(args)
+    except ImportError:
+        print(f"❌ {server} is not installed - pip install {server}")
+        raise SystemExit(1)
+
 if __name__ == '__main__':
+    args = parse_args()
+    db.pool.resize(args.pool_size or args.threads)
+    broadcaster.max_clients = args.sse_clients or max(1, args.threads // 2)
+    configure_pin_kdf_from_env()
+    
     print("\n" + "="*60)
     print("🚀 LOCKER SYSTEM DATABASE API")
     print("="*60)
     print("📊 Starting Database API Server...")
-    print("📱 Web Interface: http://localhost:5000")
-    print("🌐 Network Access: http://YOUR_IP:5000")
+    print(f"📱 Web Interface: http://localhost:{args.port}")
+    print(f"🌐 Network Access: http://YOUR_IP:{args.port}")
     print()
     print("🔗 Available API Endpoints:")
-    print("   • GET /api/bookings - All bookings")
+    print("   • GET /api/bookings?limit=&cursor= - Bookings (paginated, follow next_cursor)")
     print("   • GET /api/bookings/active - Active bookings") 
     print("   • GET /api/bookings/recent - Recent bookings")
     print("   • GET /api/bookings/contact/<contact> - Search by name, email, or phone")
+    print("   • GET /api/bookings/search?q=&limit=&offset= - Ranked search")
     print("   • GET /api/stats - System statistics")
-    print("   • GET /api/export - Export CSV")
+    print("   • GET /api/export?format=&start=&end=&locker=&gzip=1 - Export csv/ndjson/arrow/parquet")
+    print("   • GET /api/events - Live change feed (Server-Sent Events)")
     print("   • GET /api/status - System status")
+    print("   • GET /api/metrics - Notification delivery metrics")
     print()
     print("🛑 Press Ctrl+C to stop the server")
     print("="*60)
@@ -506,22 +521,32 @@ if __name__ == '__main__':
         print("   The API will start but may not return data.")
         print()
     
+    # Modo de produção: servidor multi-thread/multi-processo, sem navegador
+    if args.production:
+        run_production(args)
+        raise SystemExit(0)
+    
     # Função para abrir navegador automaticamente
     def open_browser():
         """Abre o navegador após 2 segundos para dar tempo ao servidor iniciar"""
+        url = f'http://localhost:{args.port}'
         time.sleep(2)  # Aguardar servidor iniciar
         try:
             print("🌐 Opening web browser automatically...")
-            webbrowser.open('http://localhost:5000')
-            print("✅ Browser opened! If it didn't open, go to: http://localhost:5000")
+            webbrowser.open(url)
+            print(f"✅ Browser opened! If it didn't open, go to: {url}")
         except Exception as e:
             print(f"❌ Could not open browser automatically: {e}")
-            print("🔗 Please open manually: http://localhost:5000")
+            print(f"🔗 Please open manually: {url}")
     
     # Iniciar thread para abrir navegador
-    browser_thread = threading.Thread(target=open_browser)
-    browser_thread.daemon = True
-    browser_thread.start()
+    if not args.no_browser:
+        browser_thread = threading.Thread(target=open_browser)
+        browser_thread.daemon = True
+        browser_thread.start()
     
-    # Executar servidor (acessível de qualquer IP na rede)
-    app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
+    # Executar servidor de desenvolvimento (acessível de qualquer IP na rede)
+    try:
+        app.run(host=args.host, port=args.port, debug=False, threaded=True)
+    finally:
+        shutdown_api()
\ No newline at end of file
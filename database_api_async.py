@@ -0,0 +1,486 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Database API Async - Acesso Remoto ao SQLite (asyncio)
+======================================================
+Mesmas rotas /api/* que database_api.py, servidas com aiohttp. As consultas
+correm no executor de AsyncLockerDatabase, por isso os streams SSE e as
+exportações em curso não ocupam uma thread cada - um Raspberry Pi aguenta
+muitos dashboards abertos ao mesmo tempo.
+
+Uso: python database_api_async.py [--host 0.0.0.0] [--port 5000] [--pool-size 4]
+"""
+
+import argparse
+import asyncio
+import functools
+import json
+import os
+import tempfile
+from datetime import datetime
+
+from aiohttp import web
+
+import booking_export
+from api_cache import ResponseCache, make_etag, parse_db_timestamp
+from api_shared import (HTML_TEMPLATE, SSE_HEARTBEAT_SECONDS, SSE_CLIENT_QUEUE_SIZE, cache_version,
+                        format_sse, enrich_change_events, notification_metrics, parse_export_filters,
+                        gzip_stream)
+from database import BOOKING_PAGE_SIZE
+from database_async import AsyncLockerDatabase
+from pin_hashing import configure_pin_kdf_from_env
+
+# Chaves da aplicação aiohttp
+DB_KEY = web.AppKey('db', AsyncLockerDatabase)
+CACHE_KEY = web.AppKey('response_cache', ResponseCache)
+BROADCASTER_KEY = web.AppKey('broadcaster', object)
+
+# Tamanho dos blocos enviados nas exportações Arrow/Parquet
+COLUMNAR_CHUNK_SIZE = 64 * 1024
+
+
+class AsyncChangeBroadcaster:
+    """Distribui os eventos de alteração pelos clientes SSE (asyncio.Queue)
+
+    O listener corre na thread watcher de LockerDatabase: junta as reservas
+    aos eventos (uma leitura por lote) e só depois passa para o event loop
+    com call_soon_threadsafe.
+    """
+
+    def __init__(self, database: AsyncLockerDatabase, loop: asyncio.AbstractEventLoop):
+        self.db = database
+        self.loop = loop
+        self._clients = set()
+        self._listening = False
+
+    def subscribe(self) -> asyncio.Queue:
+        client = asyncio.Queue(maxsize=SSE_CLIENT_QUEUE_SIZE)
+        self._clients.add(client)
+        if not self._listening:
+            self.db.add_change_listener(self._on_changes)
+            self._listening = True
+        return client
+
+    def unsubscribe(self, client: asyncio.Queue):
+        self._clients.discard(client)
+
+    def client_count(self) -> int:
+        return len(self._clients)
+
+    def close(self):
+        """Termina todos os streams abertos (usado no encerramento do servidor)"""
+        if self._listening:
+            self.db.remove_change_listener(self._on_changes)
+            self._listening = False
+        clients = list(self._clients)
+        self._clients.clear()
+        for client in clients:
+            self._reset(client, None)
+
+    @staticmethod
+    def _reset(client: asyncio.Queue, item):
+        """Esvazia a fila de um cliente e deixa só o item dado"""
+        while not client.empty():
+            client.get_nowait()
+        client.put_nowait(item)
+
+    def _on_changes(self, events: list):
+        # Thread watcher: nada de tocar nas filas aqui
+        if not self._clients:
+            return
+        events = enrich_change_events(self.db.db, events)
+        try:
+            self.loop.call_soon_threadsafe(self._dispatch, events)
+        except RuntimeError:
+            pass  # event loop já fechado
+
+    def _dispatch(self, events: list):
+        for event in events:
+            for client in list(self._clients):
+                try:
+                    client.put_nowait(event)
+                except asyncio.QueueFull:
+                    # Cliente demasiado lento: descartar e pedir-lhe que recarregue
+                    self._reset(client, {'id': event['id'], 'event': 'resync'})
+
+
+def json_response(data, status: int = 200) -> web.Response:
+    """Resposta JSON com o mesmo formato do Flask (jsonify)"""
+    return web.json_response(data, status=status, dumps=functools.partial(json.dumps, ensure_ascii=False))
+
+
+async def index(request):
+    """Interface web principal"""
+    return web.Response(text=HTML_TEMPLATE, content_type='text/html')
+
+
+def cached_endpoint(handler):
+    """Respostas com ETag/Last-Modified e cache validada pela versão dos dados
+
+    Igual a database_api.cached_endpoint: 304 ao If-None-Match do browser
+    ou resposta guardada em cache enquanto data_version não mudar.
+    """
+    @functools.wraps(handler)
+    async def wrapper(request):
+        adb = request.app[DB_KEY]
+        response_cache = request.app[CACHE_KEY]
+        version, updated_at = await adb.get_data_version()
+        current_version = cache_version(version)
+        etag = make_etag(*current_version)
+        key = request.path_qs
+
+        if any(tag.value in (etag, '*') for tag in request.if_none_match or ()):
+            response = web.Response(status=304)
+        else:
+            entry = response_cache.get(key, current_version)
+            if entry:
+                body, status, mimetype = entry
+                response = web.Response(body=body, status=status, content_type=mimetype)
+            else:
+                response = await handler(request)
+                if response.status != 200:
+                    return response
+                response_cache.put(key, current_version, response.body, response.status,
+                                   response.content_type)
+
+        response.etag = etag
+        last_modified = parse_db_timestamp(updated_at)
+        if last_modified:
+            response.last_modified = last_modified
+        # O browser guarda a resposta mas revalida sempre (304 se não mudou)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    return wrapper
+
+
+def query_int(request, name: str, default: int) -> int:
+    """Parâmetro inteiro da query string (default se faltar ou for inválido)"""
+    try:
+        return int(request.query.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+async def booking_page_response(request, **filters):
+    """Resposta paginada: {'bookings', 'next_cursor'} (?limit=&cursor=)"""
+    limit = query_int(request, 'limit', BOOKING_PAGE_SIZE)
+    cursor = request.query.get('cursor') or None
+    try:
+        page = await request.app[DB_KEY].get_bookings_page(limit=limit, cursor=cursor, **filters)
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+    return json_response(page)
+
+
+@cached_endpoint
+async def get_all_bookings(request):
+    """API: Todas as reservas (paginadas)"""
+    try:
+        return await booking_page_response(request)
+    except Exception as e:
+        print(f"ERROR in get_all_bookings: {e}")
+        return json_response({'error': str(e)}, 500)
+
+
+@cached_endpoint
+async def get_active_bookings(request):
+    """API: Reservas ativas"""
+    try:
+        bookings = await request.app[DB_KEY].get_active_bookings()
+        return json_response({'bookings': bookings, 'next_cursor': None})
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+@cached_endpoint
+async def get_recent_bookings(request):
+    """API: Reservas recentes (paginadas)"""
+    try:
+        return await booking_page_response(request, days=query_int(request, 'days', 7))
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+@cached_endpoint
+async def get_bookings_by_contact(request):
+    """API: Reservas por contacto (paginadas)"""
+    try:
+        return await booking_page_response(request, contact_search=request.match_info['contact'])
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+@cached_endpoint
+async def search_bookings(request):
+    """API: Pesquisa de reservas (contacto, nome, email ou telefone) com ranking"""
+    try:
+        result = await request.app[DB_KEY].search_bookings(
+            request.query.get('q', ''),
+            limit=query_int(request, 'limit', 20),
+            offset=query_int(request, 'offset', 0)
+        )
+        return json_response(result)
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+@cached_endpoint
+async def get_bookings_by_locker(request):
+    """API: Reservas por locker (paginadas)"""
+    try:
+        return await booking_page_response(request, locker_number=request.match_info['locker_number'])
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+@cached_endpoint
+async def get_statistics(request):
+    """API: Estatísticas"""
+    adb = request.app[DB_KEY]
+    try:
+        stats = await adb.get_booking_statistics()
+        stats['active_bookings'] = await adb.count_active_bookings()
+        return json_response(stats)
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+
+def write_columnar_file(database, fmt: str, filters: dict):
+    """Gera Arrow/Parquet num ficheiro temporário (corre no executor)
+
+    Os dois formatos têm um rodapé no fim, por isso são gerados primeiro em
+    disco (não em memória) e só depois enviados.
+    """
+    tmp = tempfile.TemporaryFile()
+    try:
+        booking_export.write_columnar(database.iter_bookings(**filters), tmp, fmt)
+        tmp.seek(0)
+    except Exception:
+        tmp.close()
+        raise
+    return tmp
+
+
+async def export_bookings(request):
+    """API: Exportar reservas (em streaming)
+
+    Parâmetros opcionais: format (csv, ndjson, arrow, parquet), start, end
+    (YYYY-MM-DD), locker e gzip=1 (formatos de texto).
+    """
+    adb = request.app[DB_KEY]
+    fmt = request.query.get('format', 'csv').lower()
+    try:
+        booking_export.check_format(fmt)
+    except ValueError as e:
+        return json_response({'error': str(e), 'formats': booking_export.available_formats()}, 400)
+
+    try:
+        filters = parse_export_filters(request.query)
+    except ValueError:
+        return json_response({'error': 'Invalid date - use YYYY-MM-DD'}, 400)
+
+    filename = booking_export.export_filename(fmt)
+    mimetype = booking_export.EXPORT_FORMATS[fmt][1]
+
+    if fmt in booking_export.COLUMNAR_FORMATS:
+        try:
+            tmp = await adb.run(write_columnar_file, adb.db, fmt, filters)
+        except Exception as e:
+            return json_response({'error': str(e)}, 500)
+        chunks = adb.iterate(iter(functools.partial(tmp.read, COLUMNAR_CHUNK_SIZE), b''))
+    else:
+        tmp = None
+        bookings = adb.db.iter_bookings(**filters)
+        # O gerador síncrono (leitura + formatação) corre no executor, bloco a bloco
+        text_chunks = booking_export.iter_csv(bookings) if fmt == 'csv' else booking_export.iter_ndjson(bookings)
+        if request.query.get('gzip', '').lower() in ('1', 'true', 'yes'):
+            text_chunks = gzip_stream(text_chunks)
+            filename += '.gz'
+            mimetype = 'application/gzip'
+        chunks = adb.iterate(text_chunks)
+
+    response = web.StreamResponse(headers={
+        'Content-Type': mimetype,
+        'Content-Disposition': f'attachment; filename={filename}'
+    })
+    response.enable_chunked_encoding()
+    try:
+        await response.prepare(request)
+        async for chunk in chunks:
+            await response.write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        await response.write_eof()
+    finally:
+        await chunks.aclose()
+        if tmp:
+            tmp.close()
+    return response
+
+
+async def events_stream(request):
+    """API: Feed de alterações em tempo real (Server-Sent Events)
+
+    Eventos: booking_created, booking_updated (com a reserva completa),
+    locker_status, log e resync. Ao reconectar, o browser envia
+    Last-Event-ID e os eventos perdidos são reenviados.
+    """
+    adb = request.app[DB_KEY]
+    broadcaster = request.app[BROADCASTER_KEY]
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.query.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    client = broadcaster.subscribe()
+    try:
+        await response.prepare(request)
+        await response.write(b'retry: 3000\n\n')
+
+        # Eventos perdidos durante a desconexão
+        sent_id = last_event_id or 0
+        if last_event_id is not None:
+            missed = await adb.get_change_events(after_id=last_event_id, limit=SSE_CLIENT_QUEUE_SIZE)
+            for event in await adb.run(enrich_change_events, adb.db, missed):
+                sent_id = event['id']
+                await response.write(format_sse(event).encode('utf-8'))
+
+        while True:
+            try:
+                event = await asyncio.wait_for(client.get(), timeout=SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                await response.write(b': keep-alive\n\n')
+                continue
+            if event is None:
+                break  # servidor a encerrar
+            if event['event'] != 'resync' and event['id'] <= sent_id:
+                continue  # já enviado no replay
+            await response.write(format_sse(event).encode('utf-8'))
+    except ConnectionError:
+        pass  # cliente desligou (CancelledError propaga para o aiohttp)
+    finally:
+        broadcaster.unsubscribe(client)
+    return response
+
+
+async def get_system_status(request):
+    """API: Status do sistema"""
+    adb = request.app[DB_KEY]
+    try:
+        # Test database connection
+        stats = await adb.get_booking_statistics()
+        return json_response({
+            'status': 'online',
+            'timestamp': datetime.now().isoformat(),
+            'database': 'connected',
+            'total_bookings': stats.get('total_bookings', 0),
+            'data_version': (await adb.get_data_version())[0],
+            'cache': request.app[CACHE_KEY].stats(),
+            'event_clients': request.app[BROADCASTER_KEY].client_count(),
+            'server': 'aiohttp',
+            'version': '1.0.0'
+        })
+    except Exception as e:
+        return json_response({
+            'status': 'error',
+            'timestamp': datetime.now().isoformat(),
+            'database': 'disconnected',
+            'error': str(e)
+        }, 500)
+
+
+async def get_metrics(request):
+    """API: Métricas de envio das notificações (por fornecedor) e fila de envio"""
+    adb = request.app[DB_KEY]
+    return json_response(await adb.run(notification_metrics, adb.db))
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    return json_response({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    """Permite acesso de outros computadores (equivalente ao flask_cors)"""
+    response = await handler(request)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+def create_app(db_path: str = "locker_system.db", pool_size: int = 4) -> web.Application:
+    """Cria a aplicação aiohttp com a base de dados, a cache e o feed SSE"""
+    app = web.Application(middlewares=[cors_middleware])
+
+    async def on_startup(app):
+        app[DB_KEY] = AsyncLockerDatabase(db_path, pool_size=pool_size)
+        app[CACHE_KEY] = ResponseCache()
+        app[BROADCASTER_KEY] = AsyncChangeBroadcaster(app[DB_KEY], asyncio.get_running_loop())
+
+    async def on_shutdown(app):
+        # Termina os streams SSE para o servidor não esperar por eles
+        app[BROADCASTER_KEY].close()
+
+    async def on_cleanup(app):
+        await app[DB_KEY].close()
+        print("👋 Database API stopped")
+
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    app.on_cleanup.append(on_cleanup)
+
+    app.router.add_get('/', index)
+    app.router.add_get('/api/bookings', get_all_bookings)
+    app.router.add_get('/api/bookings/active', get_active_bookings)
+    app.router.add_get('/api/bookings/recent', get_recent_bookings)
+    app.router.add_get('/api/bookings/contact/{contact}', get_bookings_by_contact)
+    app.router.add_get('/api/bookings/search', search_bookings)
+    app.router.add_get('/api/bookings/locker/{locker_number}', get_bookings_by_locker)
+    app.router.add_get('/api/stats', get_statistics)
+    app.router.add_get('/api/export', export_bookings)
+    app.router.add_get('/api/events', events_stream)
+    app.router.add_get('/api/status', get_system_status)
+    app.router.add_get('/api/metrics', get_metrics)
+    app.router.add_get('/api/health', health_check)
+    return app
+
+
+def parse_args(argv=None):
+    """Opções do servidor - cada uma pode vir também de uma variável de ambiente"""
+    parser = argparse.ArgumentParser(description='Locker System Database API (asyncio)')
+    parser.add_argument('--host', default=os.environ.get('API_HOST', '0.0.0.0'),
+                        help='Endereço de escuta (API_HOST, padrão 0.0.0.0)')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('API_PORT', 5000)),
+                        help='Porta (API_PORT, padrão 5000)')
+    parser.add_argument('--pool-size', type=int, default=int(os.environ.get('API_DB_POOL_SIZE', 4)),
+                        help='Conexões SQLite e threads do executor (API_DB_POOL_SIZE, padrão 4)')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    configure_pin_kdf_from_env()
+
+    print("\n" + "="*60)
+    print("🚀 LOCKER SYSTEM DATABASE API (asyncio)")
+    print("="*60)
+    print(f"📱 Web Interface: http://localhost:{args.port}")
+    print(f"🌐 Network Access: http://YOUR_IP:{args.port}")
+    print(f"🗃️  {args.pool_size} DB connections (executor threads)")
+    print("🛑 Press Ctrl+C to stop the server")
+    print("="*60)
+
+    if not os.path.exists('locker_system.db'):
+        print("⚠️  WARNING: Database file 'locker_system.db' not found!")
+        print("   The API will start but may not return data.")
+        print()
+
+    # SIGINT/SIGTERM: aiohttp fecha os streams (on_shutdown) e a base de dados (on_cleanup)
+    web.run_app(create_app(pool_size=args.pool_size), host=args.host, port=args.port,
+                shutdown_timeout=10, print=None)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Database Async - Acesso Assíncrono (asyncio) à Base de Dados
+============================================================
+
+Camada asyncio sobre LockerDatabase: cada consulta corre num executor de
+threads dedicado, por isso o event loop nunca bloqueia no SQLite. As
+migrações, o pool de conexões e os triggers continuam a ser os de
+database.py - esta classe só muda a forma de esperar pelos resultados.
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from itertools import islice
+from typing import Dict, List, Optional
+
+from database import LockerDatabase, BOOKING_PAGE_SIZE
+
+# Marca o fim de um gerador em iterate() (next() não pode levantar StopIteration no executor)
+_END = object()
+
+
+class AsyncLockerDatabase:
+    """Versão asyncio de LockerDatabase (executor de threads dedicado)"""
+
+    def __init__(self, db_path: str = "locker_system.db", pool_size: int = 4,
+                 database: Optional[LockerDatabase] = None):
+        """
+        Args:
+            db_path: caminho da base de dados SQLite
+            pool_size: conexões do pool e threads do executor
+            database: LockerDatabase já existente (ignora db_path/pool_size)
+        """
+        self.db = database or LockerDatabase(db_path, pool_size=pool_size)
+        # Uma thread por conexão do pool: as consultas nunca esperam por conexões
+        self._executor = ThreadPoolExecutor(max_workers=self.db.pool.max_size,
+                                            thread_name_prefix='db-async')
+
+    async def run(self, func, *args, **kwargs):
+        """Executa uma chamada síncrona (ex.: de booking_export) no executor"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    async def iterate(self, items):
+        """Percorre um gerador síncrono no executor, um item de cada vez
+
+        Para geradores que já devolvem blocos (ex.: booking_export.iter_csv),
+        onde cada item vale uma ida ao executor.
+        """
+        items = iter(items)
+        # Se o cliente desligar a meio, close() espera que o next() em curso termine
+        lock = threading.Lock()
+
+        def step():
+            with lock:
+                return next(items, _END)
+
+        def close():
+            with lock:
+                if hasattr(items, 'close'):
+                    items.close()
+
+        try:
+            while True:
+                item = await self.run(step)
+                if item is _END:
+                    break
+                yield item
+        finally:
+            await self.run(close)
+
+    # ============================================
+    # CONSULTAS
+    # ============================================
+
+    async def get_bookings_page(self, limit: int = BOOKING_PAGE_SIZE, cursor: str = None, **filters) -> Dict:
+        return await self.run(self.db.get_bookings_page, limit=limit, cursor=cursor, **filters)
+
+    async def get_active_bookings(self) -> List[Dict]:
+        return await self.run(self.db.get_active_bookings)
+
+    async def count_active_bookings(self) -> int:
+        return await self.run(self.db.count_active_bookings)
+
+    async def search_bookings(self, query: str, limit: int = 20, offset: int = 0) -> Dict:
+        return await self.run(self.db.search_bookings, query, limit=limit, offset=offset)
+
+    async def get_booking_statistics(self) -> Dict:
+        return await self.run(self.db.get_booking_statistics)
+
+    async def get_data_version(self) -> tuple:
+        return await self.run(self.db.get_data_version)
+
+    async def get_change_events(self, after_id: int = 0, limit: int = 200) -> List[Dict]:
+        return await self.run(self.db.get_change_events, after_id=after_id, limit=limit)
+
+    async def get_bookings_by_ids(self, booking_ids: List[int]) -> Dict[int, Dict]:
+        return await self.run(self.db.get_bookings_by_ids, booking_ids)
+
+    async def iter_bookings(self, chunk_size: int = 500, **filters):
+        """Versão assíncrona de iter_bookings - lê um bloco de cada vez no executor"""
+        bookings = self.db.iter_bookings(chunk_size=chunk_size, **filters)
+
+        def chunks():
+            with closing(bookings):
+                while True:
+                    chunk = list(islice(bookings, chunk_size))
+                    if not chunk:
+                        return
+                    yield chunk
+
+        async for chunk in self.iterate(chunks()):
+            for booking in chunk:
+                yield booking
+
+    # ============================================
+    # NOTIFICAÇÕES E ENCERRAMENTO
+    # ============================================
+
+    def add_change_listener(self, callback):
+        """Ver LockerDatabase.add_change_listener (callback corre no watcher)"""
+        self.db.add_change_listener(callback)
+
+    def remove_change_listener(self, callback):
+        self.db.remove_change_listener(callback)
+
+    def get_pool_stats(self) -> Dict:
+        return self.db.get_pool_stats()
+
+    async def close(self):
+        """Espera pelas consultas em curso e fecha o pool"""
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        self.db.close()
@@ -0,0 +1,202 @@
+# door_events.py
+# Eventos de abertura/fecho das portas dos cacifos e reconciliação com a
+# base de dados
+#
+# Não depende do Kivy: o módulo GPIO (RPi.GPIO ou o MockGPIO do main.py) é
+# passado ao construtor, o que permite testar o debounce e a reconciliação
+# sem hardware.
+
+import threading
+import time
+
+# Tempo (s) que o sensor da porta tem de ficar estável para o evento contar
+DOOR_DEBOUNCE_SECONDS = 0.05
+
+# Reconciliação sensores/base de dados: periódica e, após um evento de
+# porta, no máximo uma vez por RECONCILE_MIN_INTERVAL
+RECONCILE_INTERVAL = 30
+RECONCILE_MIN_INTERVAL = 2
+
+
+class DoorEventMonitor:
+    """Eventos de abertura/fecho das portas a partir das interrupções GPIO
+    
+    Usa GPIO.add_event_detect nos pins de entrada em vez de ler os pins
+    periodicamente. Cada transição só é publicada depois de o sinal ficar
+    estável durante DOOR_DEBOUNCE_SECONDS (ignora o ressalto do contacto).
+    Os subscritores recebem callback(locker_number, is_open) na thread do
+    GPIO - não devem bloquear (na UI, usar Clock.schedule_once).
+    """
+    
+    def __init__(self, gpio, locker_pins, debounce=DOOR_DEBOUNCE_SECONDS):
+        # RPi.GPIO ou MockGPIO (main.py)
+        self.gpio = gpio
+        # locker_number -> pin de entrada (HIGH = porta aberta)
+        self.input_pins = {locker: pins['input'] for locker, pins in locker_pins.items()}
+        self.pin_lockers = {pin: locker for locker, pin in self.input_pins.items()}
+        self.debounce = debounce
+        
+        self._states = {}
+        self._timers = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._running = False
+    
+    def start(self):
+        """Lê o estado inicial das portas e ativa a deteção de flancos"""
+        if self._running:
+            return
+        for locker_number, pin in self.input_pins.items():
+            self._states[locker_number] = self.gpio.input(pin) == self.gpio.HIGH
+            self.gpio.add_event_detect(pin, self.gpio.BOTH, callback=self._on_edge)
+        self._running = True
+        print(f"Door event monitor started for lockers {', '.join(self.input_pins)}")
+    
+    def stop(self):
+        """Desativa a deteção de flancos"""
+        if not self._running:
+            return
+        self._running = False
+        for pin in self.pin_lockers:
+            try:
+                self.gpio.remove_event_detect(pin)
+            except Exception as e:
+                print(f"Erro ao remover deteção do pin {pin}: {e}")
+        with self._lock:
+            timers, self._timers = self._timers, {}
+        for timer in timers.values():
+            timer.cancel()
+    
+    def subscribe(self, callback, locker_number=None):
+        """Regista callback(locker_number, is_open) - só de um cacifo se indicado"""
+        with self._lock:
+            self._subscribers.append((callback, locker_number))
+    
+    def unsubscribe(self, callback):
+        """Remove um callback registado com subscribe"""
+        with self._lock:
+            self._subscribers = [(cb, locker) for cb, locker in self._subscribers if cb != callback]
+    
+    def is_open(self, locker_number):
+        """Último estado conhecido da porta (sem ler o GPIO nem a base de dados)"""
+        return self._states.get(locker_number, False)
+    
+    def _on_edge(self, pin):
+        """Callback do GPIO: (re)inicia a espera de estabilização do pin"""
+        if pin not in self.pin_lockers:
+            return
+        timer = threading.Timer(self.debounce, self._settle, args=(pin,))
+        timer.daemon = True
+        with self._lock:
+            previous = self._timers.get(pin)
+            self._timers[pin] = timer
+        if previous:
+            previous.cancel()
+        timer.start()
+    
+    def _settle(self, pin):
+        """Sinal estável: publica a transição se o estado mudou"""
+        locker_number = self.pin_lockers[pin]
+        is_open = self.gpio.input(pin) == self.gpio.HIGH
+        with self._lock:
+            self._timers.pop(pin, None)
+            if self._states.get(locker_number) == is_open:
+                return  # ressalto que voltou ao estado anterior
+            self._states[locker_number] = is_open
+            subscribers = [cb for cb, locker in self._subscribers if locker in (None, locker_number)]
+        
+        print(f"Door event: locker {locker_number} {'OPENED' if is_open else 'CLOSED'}")
+        for callback in subscribers:
+            try:
+                callback(locker_number, is_open)
+            except Exception as e:
+                print(f"Erro num subscritor de eventos das portas: {e}")
+
+
+class LockerStateReconciler:
+    """Compara o estado físico das portas com a base de dados em segundo plano
+    
+    Corre numa thread própria, a cada RECONCILE_INTERVAL segundos ou pouco
+    depois de um evento de porta (no máximo uma vez por
+    RECONCILE_MIN_INTERVAL). Cada ronda faz uma só consulta aos estados e
+    grava as divergências novas num único INSERT em lote; uma divergência
+    (porta aberta num cacifo 'available') só é registada quando começa.
+    """
+    
+    def __init__(self, gpio, gpio_controller, interval=RECONCILE_INTERVAL,
+                 min_interval=RECONCILE_MIN_INTERVAL):
+        # RPi.GPIO ou MockGPIO (main.py)
+        self.gpio = gpio
+        # GPIOController: leitura dos pins (is_locker_occupied) e base de dados (db)
+        self.controller = gpio_controller
+        self.interval = interval
+        self.min_interval = min_interval
+        
+        self._mismatches = set()
+        self._last_run = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self, door_monitor=None):
+        """Inicia a thread (e acorda-a nos eventos de door_monitor)"""
+        if self._thread and self._thread.is_alive():
+            return
+        if door_monitor:
+            door_monitor.subscribe(self._on_door_event)
+        self._stop.clear()
+        self._wake.set()  # primeira ronda logo no arranque
+        self._thread = threading.Thread(target=self._run, name='locker-reconciler', daemon=True)
+        self._thread.start()
+    
+    def stop(self, door_monitor=None):
+        if door_monitor:
+            door_monitor.unsubscribe(self._on_door_event)
+        self._stop.set()
+        self._wake.set()
+    
+    def _on_door_event(self, locker_number, is_open):
+        self._wake.set()
+    
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            
+            # Limitar o ritmo quando há muitos eventos seguidos
+            wait = self._last_run + self.min_interval - time.monotonic()
+            if wait > 0 and self._stop.wait(wait):
+                break
+            try:
+                self.reconcile()
+            except Exception as e:
+                print(f"Erro na reconciliação dos cacifos: {e}")
+    
+    def reconcile(self):
+        """Uma ronda de reconciliação - devolve as divergências registadas"""
+        self._last_run = time.monotonic()
+        db_statuses = self.controller.db.get_all_lockers_status()
+        
+        entries = []
+        for locker_number, pins in self.controller.locker_pins.items():
+            is_occupied = self.controller.is_locker_occupied(locker_number)
+            db_status = db_statuses.get(locker_number, 'unknown')
+            
+            # Porta fisicamente aberta/ocupada num cacifo marcado como disponível.
+            # Fechado mas 'occupied' não é divergência: fica ocupado até ao
+            # desbloqueio manual na secção "unlock locker"
+            if is_occupied and db_status == 'available':
+                if locker_number not in self._mismatches:
+                    self._mismatches.add(locker_number)
+                    entries.append((locker_number, 'GPIO_SYNC',
+                                    'Physical state: occupied, DB state: available',
+                                    f"Pin {pins['input']}: {self.gpio.HIGH}"))
+            else:
+                self._mismatches.discard(locker_number)
+        
+        if entries:
+            self.controller.db.log_actions(entries)
+            print(f"GPIO sync: {', '.join(entry[0] for entry in entries)} occupied but available in DB")
+        return entries
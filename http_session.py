@@ -0,0 +1,130 @@
+# http_session.py
+# Sessão HTTP partilhada pelos fornecedores de SMS (Twilio, TextBelt)
+#
+# Uma única requests.Session com um pool de ligações keep-alive: cada SMS
+# reutiliza a ligação TLS já aberta ao fornecedor em vez de repetir o
+# handshake. Todos os pedidos têm timeouts de ligação e de leitura, por
+# isso um fornecedor pendurado nunca bloqueia um envio para sempre.
+
+import random
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Timeouts (s): estabelecer a ligação / esperar pela resposta
+HTTP_CONNECT_TIMEOUT = 5.0
+HTTP_READ_TIMEOUT = 15.0
+
+# Ligações keep-alive por fornecedor (uma por worker de notificações)
+HTTP_POOL_SIZE = 4
+
+# Novas tentativas automáticas e fator do backoff exponencial (s)
+HTTP_MAX_RETRIES = 2
+HTTP_BACKOFF_FACTOR = 0.5
+
+# Respostas em que o fornecedor não processou o pedido (seguro repetir um POST)
+HTTP_RETRY_STATUSES = (429, 503)
+
+
+class JitteredRetry(Retry):
+    """Retry com jitter no backoff (também no urllib3 1.x, sem backoff_jitter)
+
+    Acrescenta entre 0 e backoff_factor segundos a cada espera, para que
+    vários envios a falhar ao mesmo tempo não repitam todos em simultâneo.
+    """
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        if not self.history:
+            return backoff
+        return backoff + random.uniform(0, self.backoff_factor)
+
+
+def build_retry(max_retries: int = HTTP_MAX_RETRIES, backoff_factor: float = HTTP_BACKOFF_FACTOR) -> Retry:
+    """Política de novas tentativas para os POST aos fornecedores
+
+    Só repete o que é seguro para um envio de SMS: falhas de ligação (o
+    pedido nunca chegou) e respostas 429/503. Timeouts de leitura não são
+    repetidos - o SMS pode já ter sido enviado.
+    """
+    return JitteredRetry(
+        total=max_retries,
+        connect=max_retries,
+        read=0,
+        status=max_retries,
+        other=0,
+        status_forcelist=HTTP_RETRY_STATUSES,
+        allowed_methods=frozenset({'GET', 'POST'}),
+        backoff_factor=backoff_factor,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+
+
+class HTTPSessionPool:
+    """requests.Session partilhada (thread-safe para pedidos simples) com timeouts"""
+
+    def __init__(self, connect_timeout: float = HTTP_CONNECT_TIMEOUT, read_timeout: float = HTTP_READ_TIMEOUT,
+                 pool_size: int = HTTP_POOL_SIZE, max_retries: int = HTTP_MAX_RETRIES,
+                 backoff_factor: float = HTTP_BACKOFF_FACTOR):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+        self._session = None
+        self._lock = threading.Lock()
+
+    def configure(self, connect_timeout: float = None, read_timeout: float = None, pool_size: int = None,
+                  max_retries: int = None, backoff_factor: float = None):
+        """Altera timeouts/pool/retries - a sessão é recriada no próximo pedido"""
+        if connect_timeout is not None:
+            self.connect_timeout = connect_timeout
+        if read_timeout is not None:
+            self.read_timeout = read_timeout
+        if pool_size is not None:
+            self.pool_size = pool_size
+        if max_retries is not None:
+            self.max_retries = max_retries
+        if backoff_factor is not None:
+            self.backoff_factor = backoff_factor
+        self.close()
+
+    @property
+    def timeout(self) -> tuple:
+        return (self.connect_timeout, self.read_timeout)
+
+    def _create_session(self) -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_size,
+            pool_maxsize=self.pool_size,
+            max_retries=build_retry(self.max_retries, self.backoff_factor),
+            pool_block=False
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        """Sessão atual (criada no primeiro uso)"""
+        with self._lock:
+            if self._session is None:
+                self._session = self._create_session()
+            return self._session
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        """POST com o timeout configurado (se não for indicado outro)"""
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.post(url, **kwargs)
+
+    def close(self):
+        """Fecha as ligações abertas"""
+        with self._lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
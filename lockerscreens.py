@@ -376,8 +376,9 @@ class FindLockersScreen(BaseScreen):
         final_spacer = BoxLayout()
         self.content_area.add_widget(final_spacer)
         
-        # Schedule automatic update every 2 seconds
-        Clock.schedule_interval(self.auto_refresh_status, 2.0)
+        # Atualização automática: por eventos das portas (watch_door_events),
+        # por alterações na base de dados (watch_database_changes) e ao entrar
+        # no ecrã - sem polling
     
     def update_translations(self):
         """Update all translatable text elements"""
@@ -421,17 +422,24 @@ class FindLockersScreen(BaseScreen):
             
             parent_grid.add_widget(locker)
 
-    def get_locker_status(self, locker_number):
-        """Get complete locker status considering GPIO and database"""
+    def get_locker_status(self, locker_number, locker_state=None):
+        """Get complete locker status considering GPIO and database
+        
+        locker_state: entrada de gpio_controller.get_all_locker_states() já
+        obtida (evita ler todos os cacifos e a base de dados por cacifo)
+        """
         if not self.gpio_controller or not self.db:
             return 'available'  # Default
         
-        # Get physical state (door open/closed)
-        gpio_state = self.gpio_controller.get_all_locker_states().get(locker_number, {})
-        is_physically_occupied = gpio_state.get('occupied', False)  # True means door is closed/occupied
-        
-        # Get database state (booked/available)
-        db_status = self.db.get_locker_status(locker_number)
+        if locker_state is not None:
+            is_physically_occupied = locker_state.get('occupied', False)
+            db_status = locker_state.get('db_status', 'unknown')
+        else:
+            # Get physical state (door open/closed) - leitura direta do pin
+            is_physically_occupied = self.gpio_controller.is_locker_occupied(locker_number)
+            
+            # Get database state (booked/available)
+            db_status = self.db.get_locker_status(locker_number)
         
         # Determine complete status based on both physical and database state
         if is_physically_occupied:
@@ -454,9 +462,12 @@ class FindLockersScreen(BaseScreen):
             print("GPIO Controller not available")
             return
             
+        # Estado de todos os cacifos de uma vez (duas consultas à base de dados)
+        states = self.gpio_controller.get_all_locker_states()
+        
         # Update each locker with new status
         for locker_number, locker_widget in self.locker_widgets.items():
-            new_status = self.get_locker_status(locker_number)
+            new_status = self.get_locker_status(locker_number, states.get(locker_number))
             
             # Only update if status changed
             if locker_widget.locker_status != new_status:
@@ -471,6 +482,27 @@ class FindLockersScreen(BaseScreen):
     def auto_refresh_status(self, dt):
         """Automatic status update (called by Clock)"""
         self.refresh_locker_status()
+    
+    def watch_door_events(self, door_monitor):
+        """Atualiza os cacifos quando uma porta abre ou fecha (DoorEventMonitor)"""
+        def on_door_event(locker_number, is_open):
+            # Evento chega na thread do GPIO - atualizar na thread da UI
+            Clock.schedule_once(self.auto_refresh_status, 0)
+        
+        door_monitor.subscribe(on_door_event)
+    
+    def watch_database_changes(self, database):
+        """Atualiza os cacifos quando reservas ou estados mudam na base de dados
+        
+        Cobre as alterações que não passam por uma porta: reservas e
+        devoluções feitas pela API ou por outro processo (feed change_events).
+        """
+        def on_changes(events):
+            # Eventos chegam na thread do watcher; os 'log' não mudam o estado
+            if any(event['event'] != 'log' for event in events):
+                Clock.schedule_once(self.auto_refresh_status, 0)
+        
+        database.add_change_listener(on_changes)
 
     def on_locker_selected(self, instance, locker_number):
         """Callback when a locker is selected"""
@@ -487,9 +519,7 @@ class FindLockersScreen(BaseScreen):
         
         # Check if locker is still physically available
         if self.gpio_controller:
-            current_states = self.gpio_controller.get_all_locker_states()
-            locker_state = current_states.get(locker_number, {})
-            is_available = locker_state.get('available', False)
+            is_available = not self.gpio_controller.is_locker_occupied(locker_number)
             print(f"DEBUG: Locker {locker_number} physical availability: {is_available}")
             if not is_available:
                 print(f"Locker {locker_number} is no longer physically available!")
@@ -972,30 +1002,40 @@ class UnlockLockerScreen(BaseScreen):
             return
         
         if self.db:
-            # Try to unlock using database
-            locker_number = self.db.unlock_locker(contact, pin)
+            # Verificar o PIN no pool de workers para não congelar o ecrã;
+            # o resultado volta à thread da UI via Clock
+            self.unlock_button.disabled = True
             
-            if locker_number:
-                print(f"Success: Locker {locker_number} unlocked for {contact}")
-                # Use GPIO controller to physically unlock
-                if self.gpio_controller:
-                    success = self.gpio_controller.pulse_locker_unlock(locker_number)
-                    if success:
-                        self.show_success_message(f"Locker {locker_number} is now open!")
-                    else:
-                        self.show_error_message("Locker unlocked in system but physical unlock failed")
-                else:
-                    self.show_success_message(f"Locker {locker_number} unlocked successfully!")
-                
-                # Clear form after successful unlock
-                self.reset_form(None)
-            else:
-                print(f"Error: No booking found for {contact} with PIN {pin}")
-                self.show_error_message("Invalid contact information or PIN. Please check your booking details.")
+            def on_unlock_done(locker_number):
+                Clock.schedule_once(lambda dt: self.on_unlock_result(contact, pin, locker_number), 0)
+            
+            self.db.unlock_locker_async(contact, pin, callback=on_unlock_done)
         else:
             print("Error: Database not available")
             self.show_error_message("System temporarily unavailable. Please try again later.")
     
+    def on_unlock_result(self, contact, pin, locker_number):
+        """Called on the UI thread when the background unlock finishes"""
+        self.unlock_button.disabled = False
+        
+        if locker_number:
+            print(f"Success: Locker {locker_number} unlocked for {contact}")
+            # Use GPIO controller to physically unlock
+            if self.gpio_controller:
+                success = self.gpio_controller.pulse_locker_unlock(locker_number)
+                if success:
+                    self.show_success_message(f"Locker {locker_number} is now open!")
+                else:
+                    self.show_error_message("Locker unlocked in system but physical unlock failed")
+            else:
+                self.show_success_message(f"Locker {locker_number} unlocked successfully!")
+            
+            # Clear form after successful unlock
+            self.reset_form(None)
+        else:
+            print(f"Error: No booking found for {contact} with PIN {pin}")
+            self.show_error_message("Invalid contact information or PIN. Please check your booking details.")
+    
     def show_error_message(self, message):
         """Show error message to user"""
         print(f"Error message: {message}")
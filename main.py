@@ -1,5 +1,6 @@
 import kivy
 from kivy.app import App
+from kivy.clock import Clock
 from kivy.uix.screenmanager import ScreenManager, Screen
 from kivy.core.window import Window
 from kivy.metrics import dp
@@ -11,6 +12,7 @@ from kivy.uix.gridlayout import GridLayout
 from kivy.uix.button import Button
 from kivy.uix.textinput import TextInput
 import time
+import threading
 
 # Import your screen definitions
 from homescreen import KioskHomeScreen, OptionCard
@@ -19,7 +21,10 @@ from contact_pin_screen import ContactPinScreen
 from pricing_screen import PricingScreen
 from how_it_works_screen import HowItWorksScreen
 from database import LockerDatabase
+from pin_hashing import configure_pin_kdf_from_env, shutdown_pin_workers
+from door_events import DoorEventMonitor, LockerStateReconciler
 from config_notifications import initialize_notifications
+from notification_queue import get_notification_dispatcher, shutdown_notification_dispatcher
 from demo_mode import enable_demo_mode
 
 # GPIO imports - only import if running on Raspberry Pi
@@ -38,6 +43,9 @@ except ImportError:
         OUT = 'out'
         PUD_DOWN = 'pud_down'
         PUD_UP = 'pud_up'
+        RISING = 'rising'
+        FALLING = 'falling'
+        BOTH = 'both'
         
         def __init__(self):
             # Simulate pin states (can be changed for testing)
@@ -49,6 +57,8 @@ except ImportError:
             }
             # To simulate automatic locker closing after time
             self.locker_auto_close_timers = {}
+            # Callbacks registados com add_event_detect: pin -> (edge, callback)
+            self.event_callbacks = {}
         
         @staticmethod
         def setmode(mode):
@@ -68,13 +78,31 @@ except ImportError:
             print(f"Mock GPIO: reading pin {pin} = {state}")
             return state
         
-        @staticmethod
-        def cleanup():
+        def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+            print(f"Mock GPIO: add_event_detect pin {pin}, edge {edge}")
+            self.event_callbacks[pin] = (edge, callback)
+        
+        def remove_event_detect(self, pin):
+            self.event_callbacks.pop(pin, None)
+        
+        def cleanup(self):
+            self.event_callbacks.clear()
             print("Mock GPIO: cleanup")
         
+        def _set_pin(self, pin, new_state):
+            """Altera o estado do pin e chama o callback de add_event_detect (como no RPi.GPIO)"""
+            old_state = self.pin_states.get(pin, 0)
+            self.pin_states[pin] = new_state
+            if old_state == new_state or pin not in self.event_callbacks:
+                return
+            edge, callback = self.event_callbacks[pin]
+            rising = new_state == self.HIGH
+            if callback and (edge == self.BOTH or (edge == self.RISING) == rising):
+                callback(pin)
+        
         def simulate_pin_change(self, pin, new_state):
             """Método para simular mudanças nos pinos durante teste"""
-            self.pin_states[pin] = new_state
+            self._set_pin(pin, new_state)
             print(f"Mock GPIO: Pin {pin} simulado como {new_state}")
         
         def simulate_pulse(self, pin, duration=0.02):
@@ -102,7 +130,7 @@ except ImportError:
                 input_pin = locker_to_input_pin[locker_number]
                 
                 # Simulate locker open (pin HIGH = occupied/open)
-                self.pin_states[input_pin] = 1
+                self._set_pin(input_pin, 1)
                 print(f"Mock GPIO: Locker {locker_number} simulated as OPEN")
                 
                 # Cancel previous timer if exists
@@ -111,7 +139,7 @@ except ImportError:
                 
                 # Schedule automatic closing
                 def auto_close():
-                    self.pin_states[input_pin] = 0
+                    self._set_pin(input_pin, 0)
                     print(f"Mock GPIO: Locker {locker_number} simulated as CLOSED automatically")
                     if locker_number in self.locker_auto_close_timers:
                         del self.locker_auto_close_timers[locker_number]
@@ -130,7 +158,7 @@ except ImportError:
             
             if locker_number in locker_to_input_pin:
                 input_pin = locker_to_input_pin[locker_number]
-                self.pin_states[input_pin] = 0
+                self._set_pin(input_pin, 0)
                 print(f"Mock GPIO: Locker {locker_number} simulated as CLOSED manually")
                 
                 # Cancel automatic closing timer
@@ -152,6 +180,10 @@ PIN_OUTPUT_BOX3 = 22
 PIN_INPUT_BOX4 = 10
 PIN_OUTPUT_BOX4 = 9
 
+# Limpeza da base de dados (logs, change_events, notificações enviadas):
+# no arranque e depois a cada DB_MAINTENANCE_INTERVAL segundos
+DB_MAINTENANCE_INTERVAL = 24 * 3600
+
 # GPIO Initialization
 def initialize_gpio():
     """Initialize GPIO pins for locker control"""
@@ -188,33 +220,21 @@ class GPIOController:
         
         # Integrar com a base de dados
         self.db = LockerDatabase()
+        
+        # Eventos de abertura/fecho das portas (iniciado depois de initialize_gpio)
+        self.door_monitor = DoorEventMonitor(GPIO, self.locker_pins)
+        
+        # Divergências sensor/base de dados (fora das leituras do pin)
+        self.reconciler = LockerStateReconciler(GPIO, self)
     
     def is_locker_occupied(self, locker_number):
-        """Check if a locker is occupied using input pin"""
+        """Check if a locker is occupied using input pin
+        
+        Só lê o pin - a comparação com a base de dados é feita pelo
+        LockerStateReconciler.
+        """
         if locker_number in self.locker_pins:
-            input_pin = self.locker_pins[locker_number]['input']
-            pin_state = GPIO.input(input_pin)
-            is_occupied = pin_state == GPIO.HIGH
-            
-            # Log do estado GPIO
-            gpio_state = f"Pin {input_pin}: {pin_state}"
-            
-            # Sincronizar com a base de dados
-            db_status = self.db.get_locker_status(locker_number)
-            
-            # If physical state doesn't match database, correct it
-            if is_occupied and db_status == 'available':
-                # Locker physically occupied but marked as available
-                self.db.log_action(locker_number, 'GPIO_SYNC', 
-                                 'Physical state: occupied, DB state: available', gpio_state)
-                
-            elif not is_occupied and db_status == 'occupied':
-                # Locker physically closed but still marked as occupied in DB
-                # Keep it occupied until manually unlocked via "unlock locker" section
-                pass  # Don't auto-return, wait for manual unlock
-            
-            print(f"Locker {locker_number} - Pin {input_pin}: {pin_state} ({'OCCUPIED' if is_occupied else 'AVAILABLE'}) - DB: {db_status}")
-            return is_occupied
+            return GPIO.input(self.locker_pins[locker_number]['input']) == GPIO.HIGH
         return False
     
     def unlock_locker(self, locker_number):
@@ -317,16 +337,19 @@ class GPIOController:
     
     def get_all_locker_states(self):
         """Get the state of all lockers with database sync"""
+        # Two queries for all lockers: status table + indexed active bookings
+        db_statuses = self.db.get_all_lockers_status()
+        active_bookings = self.db.get_active_bookings_by_locker()
+        
         states = {}
         for locker_number in self.locker_pins:
             is_physically_occupied = self.is_locker_occupied(locker_number)
-            db_status = self.db.get_locker_status(locker_number)
             
             states[locker_number] = {
                 'occupied': is_physically_occupied,
                 'available': not is_physically_occupied,
-                'db_status': db_status,
-                'booking_info': self.db.get_active_booking(locker_number)
+                'db_status': db_statuses.get(locker_number, 'unknown'),
+                'booking_info': active_bookings.get(locker_number)
             }
         return states
     
@@ -367,6 +390,9 @@ class MainScreenManager(ScreenManager):
         find_lockers_widget = FindLockersScreen(manager=self)
         find_lockers_widget.gpio_controller = self.gpio_controller
         find_lockers_widget.db = self.db
+        find_lockers_widget.watch_door_events(self.gpio_controller.door_monitor)
+        find_lockers_widget.watch_database_changes(self.db)
+        find_lockers_screen.bind(on_enter=lambda *args: find_lockers_widget.refresh_locker_status())
         find_lockers_screen.add_widget(find_lockers_widget)
         self.add_widget(find_lockers_screen)
 
@@ -522,6 +548,9 @@ class LuggageKioskApp(App):
         # Initialize GPIO when app starts
         initialize_gpio()
         
+        # Custo do hash dos PINs neste dispositivo (PIN_KDF*, ver pin_hashing.py)
+        configure_pin_kdf_from_env()
+        
         # Initialize notification system
         print("🔧 Inicializando sistema de notificações...")
         initialize_notifications()
@@ -532,10 +561,34 @@ class LuggageKioskApp(App):
         print("✅ Notificações aparecerão como enviadas com sucesso")
         
         self.screen_manager = MainScreenManager()
+        
+        # Deteção das portas por interrupção (os ecrãs subscrevem os eventos)
+        gpio_controller = self.screen_manager.gpio_controller
+        gpio_controller.door_monitor.start()
+        gpio_controller.reconciler.start(gpio_controller.door_monitor)
+        
+        # Envio de notificações em segundo plano (retoma a fila pendente)
+        get_notification_dispatcher(self.screen_manager.db)
+        
+        # Limpeza periódica - os triggers acrescentam um change_event por escrita
+        self.run_db_maintenance()
+        Clock.schedule_interval(self.run_db_maintenance, DB_MAINTENANCE_INTERVAL)
+        
         return self.screen_manager
     
+    def run_db_maintenance(self, dt=None):
+        """Limpa a base de dados numa thread (sem bloquear a UI)"""
+        threading.Thread(target=self.screen_manager.db.cleanup_old_logs,
+                         name='db-maintenance', daemon=True).start()
+    
     def on_stop(self):
         """Clean up GPIO when app closes"""
+        shutdown_pin_workers(wait=False)
+        shutdown_notification_dispatcher(wait=False)
+        gpio_controller = self.screen_manager.gpio_controller
+        gpio_controller.reconciler.stop(gpio_controller.door_monitor)
+        gpio_controller.door_monitor.stop()
+        
         if GPIO_AVAILABLE:
            
             print("GPIO cleanup completed")
@@ -0,0 +1,132 @@
+# notification_metrics.py
+# Métricas de envio das notificações (por fornecedor)
+#
+# Contadores de envios, falhas e canais não configurados, histogramas de
+# latência (p50/p95/p99) e novas tentativas da fila. O kiosk grava
+# periodicamente um snapshot na base de dados (service_metrics) e a API
+# expõe-o em /api/metrics - a API corre noutro processo.
+
+import threading
+import time
+from datetime import datetime
+
+# Limites (ms) dos intervalos do histograma de latência; o último é aberto
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+# Percentis calculados no snapshot
+LATENCY_PERCENTILES = (50, 95, 99)
+
+
+class LatencyHistogram:
+    """Histograma de latências com intervalos fixos (memória constante)"""
+
+    def __init__(self, buckets: tuple = LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def observe(self, latency_ms: float):
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if latency_ms <= bound:
+                index = i
+                break
+        self.counts[index] += 1
+        self.count += 1
+        self.total_ms += latency_ms
+        self.max_ms = max(self.max_ms, latency_ms)
+
+    def percentile(self, percent: float) -> float:
+        """Estimativa do percentil (interpolação linear dentro do intervalo)"""
+        if not self.count:
+            return None
+        target = self.count * percent / 100
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= target:
+                lower = self.buckets[i - 1] if i > 0 else 0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max_ms
+                upper = min(upper, self.max_ms)
+                return round(lower + (upper - lower) * (target - cumulative) / count, 1)
+            cumulative += count
+        return round(self.max_ms, 1)
+
+    def snapshot(self) -> dict:
+        data = {f'p{p}': self.percentile(p) for p in LATENCY_PERCENTILES}
+        data.update({
+            'count': self.count,
+            'avg': round(self.total_ms / self.count, 1) if self.count else None,
+            'max': round(self.max_ms, 1) if self.count else None,
+            'buckets': {('+Inf' if i == len(self.buckets) else str(self.buckets[i])): count
+                        for i, count in enumerate(self.counts)}
+        })
+        return data
+
+
+class NotificationMetrics:
+    """Métricas do NotificationService (thread-safe)"""
+
+    def __init__(self):
+        self.started_at = datetime.now().isoformat()
+        self.version = 0
+        self._providers = {}
+        self._retries = {}
+        self._lock = threading.Lock()
+
+    def _provider(self, provider: str) -> dict:
+        stats = self._providers.get(provider)
+        if stats is None:
+            stats = {'sent': 0, 'failed': 0, 'not_configured': 0, 'latency': LatencyHistogram()}
+            self._providers[provider] = stats
+        return stats
+
+    def record(self, provider: str, success: bool, latency: float):
+        """Regista uma tentativa de envio (latency em segundos)"""
+        with self._lock:
+            stats = self._provider(provider)
+            stats['sent' if success else 'failed'] += 1
+            stats['latency'].observe(latency * 1000)
+            self.version += 1
+
+    def record_not_configured(self, provider: str):
+        """Envio recusado por falta de credenciais (não conta para a latência)"""
+        with self._lock:
+            self._provider(provider)['not_configured'] += 1
+            self.version += 1
+
+    def record_retry(self, channel: str):
+        """Mensagem da fila reagendada para nova tentativa"""
+        with self._lock:
+            self._retries[channel] = self._retries.get(channel, 0) + 1
+            self.version += 1
+
+    def timed(self, provider: str, send, *args) -> bool:
+        """Chama send(*args) e regista o resultado e a latência"""
+        start = time.monotonic()
+        success = False
+        try:
+            success = bool(send(*args))
+            return success
+        finally:
+            self.record(provider, success, time.monotonic() - start)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            providers = {}
+            for name, stats in self._providers.items():
+                attempts = stats['sent'] + stats['failed']
+                providers[name] = {
+                    'sent': stats['sent'],
+                    'failed': stats['failed'],
+                    'not_configured': stats['not_configured'],
+                    'success_rate': round(stats['sent'] / attempts, 3) if attempts else None,
+                    'latency_ms': stats['latency'].snapshot()
+                }
+            return {
+                'started_at': self.started_at,
+                'updated_at': datetime.now().isoformat(),
+                'providers': providers,
+                'retries': dict(self._retries)
+            }
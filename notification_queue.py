@@ -0,0 +1,296 @@
+# notification_queue.py
+# Fila persistente de notificações com envio em segundo plano
+#
+# A UI guarda as mensagens em notification_outbox (database.py) e volta
+# logo ao utilizador. Uma thread do dispatcher vai buscando as mensagens
+# vencidas e entrega-as num pool de workers - email e SMS da mesma reserva
+# são enviados em paralelo. Falhas voltam à fila com backoff exponencial
+# (com jitter) até NOTIFICATION_MAX_ATTEMPTS; mensagens deixadas a meio por
+# um reinício são retomadas no arranque seguinte.
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database import LockerDatabase
+from notification_service import notification_service
+
+# Envios em simultâneo (cada um espera sobretudo pela rede)
+NOTIFICATION_WORKERS = 4
+
+# Emails enviados de seguida pela mesma sessão SMTP (um worker por lote)
+EMAIL_BATCH_SIZE = 10
+
+# Intervalo máximo (s) entre verificações da fila (novas mensagens acordam logo o dispatcher)
+POLL_INTERVAL = 5.0
+
+# Intervalo mínimo (s) entre gravações das métricas de envio na base de dados
+METRICS_PUBLISH_INTERVAL = 10.0
+
+# Backoff entre tentativas: 30 s, 60 s, 120 s, ... até 30 minutos
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 30 * 60
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def retry_delay(attempt: int, base: float = RETRY_BASE_DELAY, maximum: float = RETRY_MAX_DELAY) -> float:
+    """Espera (s) antes da tentativa seguinte: exponencial com jitter
+
+    O jitter (entre metade e o valor total) evita que mensagens que falharam
+    juntas - ex.: durante uma falha do fornecedor - voltem todas ao mesmo tempo.
+    """
+    delay = min(maximum, base * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class NotificationDispatcher:
+    """Envia as mensagens de notification_outbox em segundo plano"""
+
+    def __init__(self, database, service=None, workers: int = NOTIFICATION_WORKERS,
+                 poll_interval: float = POLL_INTERVAL):
+        self.db = database
+        self.service = service or notification_service
+        self.workers = workers
+        self.poll_interval = poll_interval
+
+        self._executor = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._in_flight = set()
+        self._metrics_version = None
+        self._metrics_published_at = 0.0
+        # id da mensagem -> grupo {'pending', 'results', 'callback'} à espera da 1.ª tentativa
+        self._groups = {}
+
+    def start(self):
+        """Retoma mensagens interrompidas e inicia a thread do dispatcher"""
+        if self._thread is not None:
+            return
+
+        requeued = self.db.requeue_stale_notifications()
+        if requeued:
+            print(f"📬 {requeued} notificações retomadas após reinício")
+
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='notify-worker')
+        self._thread = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+        self._thread.start()
+
+    def stop(self, wait: bool = True):
+        """Para o dispatcher - mensagens por enviar ficam na fila para o próximo arranque"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval)
+            self._thread = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+        self._publish_metrics(force=True)
+
+    def enqueue(self, messages: list, callback=None) -> list:
+        """Guarda mensagens na fila e acorda o dispatcher
+
+        Se callback for fornecido, é chamado uma vez, na thread de um worker,
+        com {'email': bool, 'sms': bool, 'retrying': [canais],
+        'unconfigured': [canais]} depois da primeira tentativa de cada
+        mensagem. Canais sem mensagem ficam False.
+        """
+        results = {'email': False, 'sms': False, 'retrying': [], 'unconfigured': []}
+        if not messages:
+            if callback:
+                callback(results)
+            return []
+
+        # A escrita na base de dados (até 10 s com retries) fica fora do lock,
+        # que os workers e o dispatcher usam. O grupo é registado logo a seguir:
+        # as mensagens ficam 'pending' até serem reclamadas e enviadas, o que
+        # demora muito mais do que este intervalo.
+        ids = self.db.enqueue_notifications(messages)
+        direct = not ids
+        if direct:
+            # Sem base de dados: enviar na mesma, só sem persistência nem retry
+            print("⚠️ Fila de notificações indisponível - envio direto")
+            messages = [dict(message, id=None, attempts=1, max_attempts=1) for message in messages]
+            keys = [id(message) for message in messages]
+        else:
+            keys = ids
+        if callback:
+            group = {'pending': set(keys), 'results': results, 'callback': callback}
+            with self._lock:
+                for key in keys:
+                    self._groups[key] = group
+
+        if direct:
+            for message in messages:
+                self._submit([message])
+        else:
+            self._wake.set()
+        return ids
+
+    def queue_pin_notification(self, user_data, locker_number, pin, notification_methods=['email', 'sms'],
+                               callback=None, booking_id=None) -> list:
+        """Versão não bloqueante de NotificationService.send_pin_notification"""
+        messages = self.service.build_pin_messages(user_data, locker_number, pin, notification_methods)
+        for message in messages:
+            message['booking_id'] = booking_id
+        return self.enqueue(messages, callback=callback)
+
+    # ============================================
+    # THREAD DO DISPATCHER E WORKERS
+    # ============================================
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            self._publish_metrics()
+
+            # Só reclama o que os workers livres podem enviar já (uma tarefa
+            # por worker) - o resto continua 'pending' na base de dados
+            with self._lock:
+                free = self.workers - len(self._in_flight)
+            if free <= 0:
+                continue
+
+            # Cada SMS é uma tarefa; os workers que sobram levam um lote de
+            # emails cada (uma sessão SMTP por lote)
+            sms = self._claim(limit=free, channel='sms')
+            for message in sms:
+                self._submit([message])
+
+            free -= len(sms)
+            emails = self._claim(limit=free * EMAIL_BATCH_SIZE, channel='email') if free > 0 else []
+            for start in range(0, len(emails), EMAIL_BATCH_SIZE):
+                self._submit(emails[start:start + EMAIL_BATCH_SIZE])
+
+            if not sms and not emails:
+                self.service.close_idle_connections()
+
+    def _claim(self, limit: int, channel: str) -> list:
+        try:
+            return self.db.claim_due_notifications(limit=limit, channel=channel)
+        except Exception as e:
+            print(f"Erro ao ler a fila de notificações: {e}")
+            return []
+
+    def _submit(self, messages: list):
+        task = object()
+        with self._lock:
+            self._in_flight.add(task)
+        try:
+            self._executor.submit(self._deliver_batch, messages, task)
+        except RuntimeError:
+            # Executor já encerrado (aplicação a fechar) - fica para o próximo arranque
+            with self._lock:
+                self._in_flight.discard(task)
+
+    def _deliver_batch(self, messages: list, task):
+        """Worker: envia um lote de mensagens do mesmo canal"""
+        try:
+            if messages[0]['channel'] == 'email' and len(messages) > 1:
+                with self.service.batch():
+                    for message in messages:
+                        self._deliver(message)
+            else:
+                for message in messages:
+                    self._deliver(message)
+        finally:
+            with self._lock:
+                self._in_flight.discard(task)
+            self._wake.set()
+
+    def _deliver(self, message: dict):
+        """Worker: envia uma mensagem e regista o resultado na fila"""
+        error = None
+        try:
+            success = bool(self.service.deliver(message))
+            if not success:
+                error = f"envio por {message['channel']} falhou"
+        except Exception as e:
+            success = False
+            error = str(e)
+
+        retrying = False
+        configured = success or self.service.is_configured(message['channel'])
+        try:
+            if message['id'] is not None:
+                if success:
+                    self.db.complete_notification(message['id'], True)
+                elif message['attempts'] < message['max_attempts'] and configured:
+                    delay = retry_delay(message['attempts'])
+                    self.db.complete_notification(message['id'], False, error, retry_in=delay)
+                    self.service.metrics.record_retry(message['channel'])
+                    retrying = True
+                    print(f"🔁 {message['channel']} para {message['recipient']}: "
+                          f"tentativa {message['attempts']} falhou, nova tentativa em {delay:.0f}s")
+                else:
+                    # Tentativas esgotadas, ou canal sem credenciais (não adianta repetir)
+                    self.db.complete_notification(message['id'], False, error)
+        finally:
+            self._report(message, success, retrying, configured)
+
+    def _report(self, message: dict, success: bool, retrying: bool, configured: bool = True):
+        """Primeira tentativa de uma mensagem com callback: atualizar o grupo"""
+        key = message['id'] if message['id'] is not None else id(message)
+        with self._lock:
+            group = self._groups.pop(key, None)
+            if group is None:
+                return
+            group['results'][message['channel']] = success
+            if retrying:
+                group['results']['retrying'].append(message['channel'])
+            if not configured:
+                group['results']['unconfigured'].append(message['channel'])
+            group['pending'].discard(key)
+            done = not group['pending']
+        if done:
+            self._call(group)
+
+    def _publish_metrics(self, force: bool = False):
+        """Grava as métricas do serviço (para /api/metrics) se mudaram desde a última vez"""
+        version = self.service.metrics.version
+        now = time.monotonic()
+        if version == self._metrics_version:
+            return
+        if not force and now - self._metrics_published_at < METRICS_PUBLISH_INTERVAL:
+            return
+        try:
+            if self.db.save_metrics_snapshot('notifications', self.service.get_metrics()):
+                self._metrics_version = version
+                self._metrics_published_at = now
+        except Exception as e:
+            print(f"Erro ao gravar métricas de notificações: {e}")
+
+    @staticmethod
+    def _call(group: dict):
+        try:
+            group['callback'](group['results'])
+        except Exception as e:
+            print(f"Erro no callback de notificações: {e}")
+
+
+def get_notification_dispatcher(database=None) -> NotificationDispatcher:
+    """Dispatcher partilhado pela aplicação (criado e iniciado na primeira chamada)"""
+    global _dispatcher
+    with _dispatcher_lock:
+        if _dispatcher is None:
+            _dispatcher = NotificationDispatcher(database or LockerDatabase())
+            _dispatcher.start()
+        return _dispatcher
+
+
+def shutdown_notification_dispatcher(wait: bool = True):
+    """Para o dispatcher (ex.: ao fechar a aplicação)"""
+    global _dispatcher
+    with _dispatcher_lock:
+        dispatcher, _dispatcher = _dispatcher, None
+    if dispatcher is not None:
+        dispatcher.stop(wait=wait)
@@ -1,14 +1,15 @@
 # notification_service.py
 # Sistema de notificações por SMS e Email para envio de PINs
 
-import smtplib
-import ssl
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import requests
 import json
-from datetime import datetime
-from translations import translator
+import time
+from notification_templates import notification_templates
+from smtp_pool import SMTPSessionPool
+from http_session import HTTPSessionPool
+from sms_router import SMSRouter, SMSProvider
+from notification_metrics import NotificationMetrics
 
 class NotificationService:
     """Serviço para envio de notificações por SMS e Email"""
@@ -34,8 +35,26 @@ class NotificationService:
         # Configurações alternativas SMS (TextBelt - gratuito para teste)
         self.textbelt_config = {
             'api_url': 'https://textbelt.com/text',
-            'api_key': 'textbelt'  # 'textbelt' para 1 SMS gratuito por dia, ou comprar créditos
+            'api_key': 'textbelt',  # 'textbelt' para 1 SMS gratuito por dia, ou comprar créditos
+            'configured': False     # só é usado depois de configure_sms_textbelt
         }
+        
+        # Sessões SMTP reutilizadas entre emails (sem STARTTLS + login por mensagem)
+        self.smtp_pool = SMTPSessionPool()
+        
+        # Ligações HTTP keep-alive (com timeouts e retry) para os fornecedores de SMS
+        self.http = HTTPSessionPool()
+        
+        # Contadores e latências por fornecedor (expostos em /api/metrics)
+        self.metrics = NotificationMetrics()
+        
+        # Escolha do fornecedor de SMS (circuit breakers, health score, hedging)
+        self.sms_router = SMSRouter([
+            SMSProvider('twilio', lambda phone, body: self.metrics.timed('twilio', self.send_sms_twilio, phone, body),
+                        self._twilio_configured),
+            SMSProvider('textbelt', lambda phone, body: self.metrics.timed('textbelt', self.send_sms_textbelt, phone, body),
+                        self._textbelt_configured)
+        ])
     
     def configure_email(self, smtp_server, smtp_port, sender_email, sender_password, sender_name="Cacifo System"):
         """Configurar credenciais de email"""
@@ -61,14 +80,40 @@ class NotificationService:
     def configure_sms_textbelt(self, api_key):
         """Configurar TextBelt para SMS (alternativa gratuita)"""
         self.textbelt_config['api_key'] = api_key
+        self.textbelt_config['configured'] = bool(api_key)
         print("SMS TextBelt configurado")
     
+    def configure_http(self, connect_timeout=None, read_timeout=None, pool_size=None,
+                       max_retries=None, backoff_factor=None):
+        """Configurar timeouts, pool de ligações e retry dos pedidos HTTP de SMS"""
+        self.http.configure(
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            pool_size=pool_size,
+            max_retries=max_retries,
+            backoff_factor=backoff_factor
+        )
+        print(f"HTTP SMS configurado: timeout {self.http.connect_timeout}s/{self.http.read_timeout}s, "
+              f"{self.http.pool_size} ligações, {self.http.max_retries} retries")
+    
+    def configure_sms_routing(self, hedged=None, hedge_delay=None, failure_threshold=None, reset_timeout=None):
+        """Configurar a escolha do fornecedor de SMS (hedging e circuit breakers)"""
+        self.sms_router.configure(
+            hedged=hedged,
+            hedge_delay=hedge_delay,
+            failure_threshold=failure_threshold,
+            reset_timeout=reset_timeout
+        )
+        mode = f"hedged ({self.sms_router.hedge_delay}s)" if self.sms_router.hedged else "fallback sequencial"
+        print(f"Encaminhamento SMS configurado: {mode}")
+    
     def send_email(self, recipient_email, subject, message_body):
         """Enviar email"""
         try:
             # Verificar se email está configurado
             if not self.email_config['sender_email'] or not self.email_config['sender_password']:
                 print("⚠️ Email não configurado - configurações necessárias em notification_service.py")
+                self.metrics.record_not_configured('smtp')
                 return False
             
             # Criar mensagem
@@ -80,15 +125,15 @@ class NotificationService:
             # Adicionar corpo da mensagem
             msg.attach(MIMEText(message_body, 'plain', 'utf-8'))
             
-            # Conectar ao servidor SMTP
-            context = ssl.create_default_context()
-            with smtplib.SMTP(self.email_config['smtp_server'], self.email_config['smtp_port']) as server:
-                server.starttls(context=context)
-                server.login(self.email_config['sender_email'], self.email_config['sender_password'])
-                
-                # Enviar email
-                text = msg.as_string()
-                server.sendmail(self.email_config['sender_email'], recipient_email, text)
+            # Enviar por uma sessão SMTP do pool (reutilizada entre mensagens)
+            self._configure_smtp_pool()
+            start = time.monotonic()
+            try:
+                self.smtp_pool.send(self.email_config['sender_email'], recipient_email, msg.as_string())
+            except Exception:
+                self.metrics.record('smtp', False, time.monotonic() - start)
+                raise
+            self.metrics.record('smtp', True, time.monotonic() - start)
             
             print(f"✅ Email enviado com sucesso para {recipient_email}")
             return True
@@ -101,7 +146,7 @@ class NotificationService:
         """Enviar SMS via Twilio"""
         try:
             # Verificar se Twilio está configurado
-            if not self.sms_config['account_sid'] or not self.sms_config['auth_token']:
+            if not self._twilio_configured():
                 print("⚠️ Twilio não configurado - configurações necessárias em notification_service.py")
                 return False
             
@@ -126,7 +171,7 @@ class NotificationService:
             }
             
             # Enviar SMS
-            response = requests.post(
+            response = self.http.post(
                 self.sms_config['api_url'],
                 data=data,
                 headers=headers
@@ -152,7 +197,7 @@ class NotificationService:
                 'key': self.textbelt_config['api_key']
             }
             
-            response = requests.post(self.textbelt_config['api_url'], data=data)
+            response = self.http.post(self.textbelt_config['api_url'], data=data)
             result = response.json()
             
             if result.get('success'):
@@ -167,9 +212,110 @@ class NotificationService:
             print(f"❌ Erro ao enviar SMS via TextBelt: {e}")
             return False
     
+    def _configure_smtp_pool(self):
+        """Passa ao pool SMTP o servidor/credenciais atuais de email_config"""
+        self.smtp_pool.configure(
+            self.email_config['smtp_server'],
+            self.email_config['smtp_port'],
+            self.email_config['sender_email'],
+            self.email_config['sender_password']
+        )
+    
+    def batch(self):
+        """Contexto em que os emails enviados pela thread atual partilham uma sessão SMTP
+        
+        Usado pelo dispatcher para enviar um lote da fila de seguida.
+        """
+        if self.is_configured('email'):
+            self._configure_smtp_pool()
+        return self.smtp_pool.batch()
+    
+    def close_idle_connections(self):
+        """Fecha sessões SMTP paradas (chamado quando a fila está vazia)"""
+        self.smtp_pool.close_idle()
+    
+    def send_sms(self, recipient_phone, message_body):
+        """Enviar SMS pelo fornecedor mais saudável (Twilio, TextBelt), com fallback
+        
+        Fornecedores com o circuito aberto (falhas seguidas) são saltados; no
+        modo hedged o seguinte é lançado se o primeiro demorar demasiado.
+        """
+        if not self.sms_router.ranked_providers():
+            self.metrics.record_not_configured('sms')
+        return self.sms_router.send(recipient_phone, message_body)
+    
+    def get_metrics(self):
+        """Métricas de envio: por fornecedor, retries, pool SMTP e estado dos fornecedores de SMS"""
+        metrics = self.metrics.snapshot()
+        metrics['smtp_pool'] = self.smtp_pool.stats()
+        metrics['sms_providers'] = self.sms_router.stats()
+        return metrics
+    
+    def is_configured(self, channel):
+        """Indica se o canal ('email' ou 'sms') tem credenciais configuradas"""
+        if channel == 'email':
+            return bool(self.email_config['sender_email'] and self.email_config['sender_password'])
+        if channel == 'sms':
+            return self._twilio_configured() or self._textbelt_configured()
+        return False
+    
+    def _twilio_configured(self):
+        """Twilio precisa das credenciais e do número de origem"""
+        return bool(self.sms_config['account_sid'] and self.sms_config['auth_token'] and
+                    self.sms_config['from_number'])
+    
+    def _textbelt_configured(self):
+        """TextBelt só conta depois de configure_sms_textbelt (a chave padrão não basta)"""
+        return bool(self.textbelt_config['configured'] and self.textbelt_config['api_key'])
+    
+    def deliver(self, message):
+        """Enviar uma mensagem da fila (dict com channel, recipient, subject, body)"""
+        if message['channel'] == 'email':
+            return self.send_email(message['recipient'], message['subject'], message['body'])
+        if message['channel'] == 'sms':
+            return self.send_sms(message['recipient'], message['body'])
+        print(f"❌ Canal de notificação desconhecido: {message['channel']}")
+        return False
+    
+    @staticmethod
+    def format_phone(phone):
+        """Formato do número: garantir que tem código do país"""
+        if not phone.startswith('+'):
+            phone = '+351' + phone  # Número português
+        return phone
+    
+    def build_pin_messages(self, user_data, locker_number, pin, notification_methods=['email', 'sms']):
+        """
+        Preparar as mensagens com PIN para o utilizador (sem enviar)
+        
+        Returns:
+            list: mensagens {'channel', 'recipient', 'subject', 'body'} - só
+            para os canais pedidos para os quais o utilizador tem contacto
+        """
+        # Textos no idioma atual (templates compilados uma vez por idioma)
+        texts = notification_templates.render_pin(user_data, locker_number, pin)
+        
+        messages = []
+        if 'email' in notification_methods and user_data.get('email'):
+            messages.append({
+                'channel': 'email',
+                'recipient': user_data['email'],
+                'subject': texts['email_subject'],
+                'body': texts['email_body']
+            })
+        if 'sms' in notification_methods and user_data.get('phone'):
+            messages.append({
+                'channel': 'sms',
+                'recipient': self.format_phone(user_data['phone']),
+                'subject': '',
+                'body': texts['sms_body']
+            })
+        return messages
+    
     def send_pin_notification(self, user_data, locker_number, pin, notification_methods=['email', 'sms']):
         """
-        Enviar notificação com PIN para o utilizador
+        Enviar notificação com PIN para o utilizador (síncrono - a UI deve
+        usar notification_queue para não bloquear)
         
         Args:
             user_data (dict): Dados do utilizador {'name', 'email', 'phone', 'birth_date'}
@@ -182,164 +328,8 @@ class NotificationService:
         """
         results = {'email': False, 'sms': False}
         
-        # Obter textos traduzidos
-        current_lang = translator.get_current_language()
-        
-        # Preparar dados da mensagem
-        timestamp = datetime.now().strftime("%d/%m/%Y às %H:%M")
-        
-        # Criar mensagens personalizadas para cada idioma
-        if current_lang == 'pt':
-            email_subject = f"🔐 PIN do Cacifo {locker_number} - Sistema de Cacifos"
-            email_body = f"""Olá {user_data.get('name', 'Cliente')},
-
-✅ A sua reserva foi confirmada com sucesso!
-
-📋 DETALHES DA RESERVA:
-• Cacifo: #{locker_number}
-• PIN de Acesso: {pin}
-• Data/Hora: {timestamp}
-• Nome: {user_data.get('name', 'N/A')}
-• Email: {user_data.get('email', 'N/A')}
-• Telemóvel: {user_data.get('phone', 'N/A')}
-
-🔓 COMO USAR:
-1. Para abrir o cacifo, dirija-se ao terminal
-2. Selecione "Unlock Locker"
-3. Introduza o seu contacto e o PIN: {pin}
-4. O cacifo será aberto automaticamente
-
-⚠️ IMPORTANTE:
-• Guarde este PIN em segurança
-• Utilize apenas o contacto registado para acesso
-• O cacifo fechará automaticamente após retirar os items
-
-Obrigado por utilizar o nosso sistema!
-
----
-Sistema de Cacifos Automático
-Suporte: support@cacifo.com"""
-            
-            sms_body = f"Cacifo {locker_number} PIN: {pin}. Terminal > Unlock Locker"
-        
-        elif current_lang == 'en':
-            email_subject = f"🔐 Locker {locker_number} PIN - Locker System"
-            email_body = f"""Hello {user_data.get('name', 'Customer')},
-
-✅ Your booking has been confirmed successfully!
-
-📋 BOOKING DETAILS:
-• Locker: #{locker_number}
-• Access PIN: {pin}
-• Date/Time: {timestamp}
-• Name: {user_data.get('name', 'N/A')}
-• Email: {user_data.get('email', 'N/A')}
-• Phone: {user_data.get('phone', 'N/A')}
-
-🔓 HOW TO USE:
-1. Go to the terminal to open your locker
-2. Select "Unlock Locker"
-3. Enter your contact and PIN: {pin}
-4. The locker will open automatically
-
-⚠️ IMPORTANT:
-• Keep this PIN secure
-• Use only the registered contact for access
-• The locker will close automatically after removing items
-
-Thank you for using our system!
-
----
-Automatic Locker System
-Support: support@cacifo.com"""
-            
-            sms_body = f"Locker {locker_number} PIN: {pin}. Terminal > Unlock Locker"
-        
-        elif current_lang == 'es':
-            email_subject = f"🔐 PIN de Taquilla {locker_number} - Sistema de Taquillas"
-            email_body = f"""Hola {user_data.get('name', 'Cliente')},
-
-✅ ¡Su reserva ha sido confirmada con éxito!
-
-📋 DETALLES DE RESERVA:
-• Taquilla: #{locker_number}
-• PIN de Acceso: {pin}
-• Fecha/Hora: {timestamp}
-• Nombre: {user_data.get('name', 'N/A')}
-• Email: {user_data.get('email', 'N/A')}
-• Teléfono: {user_data.get('phone', 'N/A')}
-
-🔓 CÓMO USAR:
-1. Vaya al terminal para abrir su taquilla
-2. Seleccione "Unlock Locker"
-3. Introduzca su contacto y PIN: {pin}
-4. La taquilla se abrirá automáticamente
-
-⚠️ IMPORTANTE:
-• Mantenga este PIN seguro
-• Use solo el contacto registrado para acceso
-• La taquilla se cerrará automáticamente después de retirar los artículos
-
-¡Gracias por usar nuestro sistema!
-
----
-Sistema de Taquillas Automático
-Soporte: support@cacifo.com"""
-            
-            sms_body = f"Taquilla {locker_number} PIN: {pin}. Terminal > Unlock Locker"
-        
-        else:  # Default to English for other languages
-            email_subject = f"🔐 Locker {locker_number} PIN - Locker System"
-            email_body = f"""Hello {user_data.get('name', 'Customer')},
-
-✅ Your booking has been confirmed successfully!
-
-📋 BOOKING DETAILS:
-• Locker: #{locker_number}
-• Access PIN: {pin}
-• Date/Time: {timestamp}
-
-🔓 HOW TO USE:
-1. Go to the terminal to open your locker
-2. Select "Unlock Locker"  
-3. Enter your contact and PIN: {pin}
-4. The locker will open automatically
-
-Thank you for using our system!
-
----
-Automatic Locker System"""
-            
-            sms_body = f"Locker {locker_number} PIN: {pin}. Terminal > Unlock Locker"
-        
-        # Enviar Email
-        if 'email' in notification_methods and user_data.get('email'):
-            results['email'] = self.send_email(
-                user_data['email'],
-                email_subject,
-                email_body
-            )
-        
-        # Enviar SMS
-        if 'sms' in notification_methods and user_data.get('phone'):
-            # Tentar primeiro Twilio, depois TextBelt como fallback
-            phone = user_data['phone']
-            
-            # Formato do número: garantir que tem código do país
-            if not phone.startswith('+'):
-                if phone.startswith('9'):  # Número português
-                    phone = '+351' + phone
-                else:
-                    phone = '+351' + phone
-            
-            # Tentar Twilio primeiro
-            sms_sent = self.send_sms_twilio(phone, sms_body)
-            
-            # Se Twilio falhar, tentar TextBelt
-            if not sms_sent:
-                sms_sent = self.send_sms_textbelt(phone, sms_body)
-            
-            results['sms'] = sms_sent
+        for message in self.build_pin_messages(user_data, locker_number, pin, notification_methods):
+            results[message['channel']] = self.deliver(message)
         
         return results
     
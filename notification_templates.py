@@ -0,0 +1,137 @@
+# notification_templates.py
+# Templates multilingues das notificações com PIN (email e SMS)
+#
+# Os textos de cada idioma estão em notification_templates.json; acrescentar
+# um idioma é só acrescentar uma entrada ao ficheiro, sem alterar código.
+# Chaves em falta num idioma usam o texto em inglês. Todos os templates são
+# compilados ao carregar o ficheiro: as partes fixas ficam guardadas e cada
+# notificação só preenche os campos variáveis ({locker}, {pin}, ...) antes
+# de juntar o texto.
+
+import json
+import os
+import threading
+from datetime import datetime
+from string import Formatter
+
+from translations import translator
+
+# Ficheiro com os textos por idioma (junto a este módulo)
+NOTIFICATION_TEMPLATES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                           'notification_templates.json')
+
+# Idioma usado quando o atual não tem templates (e para chaves em falta)
+DEFAULT_TEMPLATE_LANGUAGE = 'en'
+
+# Chaves de cada idioma no ficheiro:
+#   date_format, customer, not_available  textos simples
+#   email_subject, email_body, sms_body    templates (texto ou lista de linhas)
+#
+# Campos disponíveis nos templates:
+#   {customer}  nome do utilizador (ou 'customer' do idioma se não houver)
+#   {name} {email} {phone}  dados do utilizador (ou 'not_available')
+#   {locker} {pin} {timestamp}
+TEMPLATE_KEYS = ('email_subject', 'email_body', 'sms_body')
+
+
+def load_notification_templates(path: str = NOTIFICATION_TEMPLATES_FILE) -> dict:
+    """Lê os textos de todos os idiomas (listas de linhas são juntas com \\n)"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    return {
+        language: {key: '\n'.join(value) if isinstance(value, list) else value
+                   for key, value in texts.items()}
+        for language, texts in data.items()
+    }
+
+
+class CompiledTemplate:
+    """Template dividido em partes fixas e campos, pronto a preencher"""
+
+    def __init__(self, text: str):
+        parts = []
+        fields = []
+        for literal, field, spec, conversion in Formatter().parse(text):
+            if literal:
+                if parts and not isinstance(parts[-1], int):
+                    parts[-1] += literal
+                else:
+                    parts.append(literal)
+            if field is not None:
+                if not field or spec or conversion:
+                    raise ValueError(f"Campo inválido no template: {{{field}}}")
+                fields.append((len(parts), field))
+                parts.append(len(fields) - 1)
+
+        # Partes fixas já prontas; os campos ficam vazios até render()
+        self.parts = [part if isinstance(part, str) else '' for part in parts]
+        self.fields = fields
+
+    def render(self, values: dict) -> str:
+        parts = list(self.parts)
+        for index, field in self.fields:
+            parts[index] = str(values[field])
+        return ''.join(parts)
+
+
+class NotificationTemplates:
+    """Templates compilados por idioma (compilados ao carregar o ficheiro)"""
+
+    def __init__(self, path: str = NOTIFICATION_TEMPLATES_FILE, default_language: str = DEFAULT_TEMPLATE_LANGUAGE,
+                 templates: dict = None):
+        self.path = path
+        self.default_language = default_language
+        self._compiled = {}
+        self._lock = threading.Lock()
+        self.reload(templates)
+
+    def reload(self, templates: dict = None):
+        """Volta a ler o ficheiro (ou usa templates) e compila todos os idiomas"""
+        if templates is None:
+            try:
+                templates = load_notification_templates(self.path)
+            except (OSError, ValueError) as e:
+                print(f"❌ Erro ao carregar templates de notificação ({self.path}): {e}")
+                templates = {}
+
+        fallback = templates.get(self.default_language, {})
+        compiled = {}
+        for language, texts in templates.items():
+            try:
+                merged = dict(fallback)
+                merged.update(texts)
+                for key in TEMPLATE_KEYS:
+                    merged[key] = CompiledTemplate(merged[key])
+                compiled[language] = merged
+            except (KeyError, ValueError) as e:
+                print(f"⚠️ Templates de notificação '{language}' ignorados: {e}")
+
+        with self._lock:
+            self._compiled = compiled
+        return sorted(compiled)
+
+    def get(self, language: str) -> dict:
+        """Templates compilados do idioma (ou do idioma por omissão)"""
+        compiled = self._compiled
+        if language in compiled:
+            return compiled[language]
+        return compiled[self.default_language]
+
+    def render_pin(self, user_data: dict, locker_number, pin, language: str = None, when=None) -> dict:
+        """Textos da notificação com PIN: {'email_subject', 'email_body', 'sms_body'}"""
+        templates = self.get(language or translator.get_current_language())
+        missing = templates['not_available']
+        values = {
+            'customer': user_data.get('name') or templates['customer'],
+            'name': user_data.get('name') or missing,
+            'email': user_data.get('email') or missing,
+            'phone': user_data.get('phone') or missing,
+            'locker': locker_number,
+            'pin': pin,
+            'timestamp': (when or datetime.now()).strftime(templates['date_format'])
+        }
+        return {key: templates[key].render(values) for key in TEMPLATE_KEYS}
+
+
+# Instância global (como translator em translations.py)
+notification_templates = NotificationTemplates()
@@ -0,0 +1,217 @@
+# pin_hashing.py
+# Hash e verificação de PINs fora do lock da base de dados e da thread da UI
+#
+# Cada reserva guarda o algoritmo (pin_kdf) e os parâmetros de custo
+# (pin_kdf_params, JSON) usados no seu hash, por isso o custo pode ser
+# ajustado por tipo de dispositivo sem invalidar reservas existentes.
+# Reservas antigas (sem pin_kdf) usam PBKDF2-SHA256 com 100.000 iterações.
+# A configuração do dispositivo vem das variáveis PIN_KDF* no arranque do
+# kiosk e da API (configure_pin_kdf_from_env).
+
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# PBKDF2-SHA256 com 100.000 iterações (~100 ms num Raspberry Pi)
+PBKDF2_ITERATIONS = 100000
+
+# Limites da calibração (para não tornar o desbloqueio inutilizável nem
+# esgotar a memória de um Raspberry Pi com scrypt)
+MIN_PBKDF2_ITERATIONS = 10000
+MAX_SCRYPT_N = 2 ** 16
+
+# O hashlib liberta o GIL durante o PBKDF2/scrypt, por isso threads chegam
+# para correr vários hashes em paralelo sem bloquear a UI do Kivy.
+PIN_WORKERS = 2
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pbkdf2_sha256(pin: str, salt: str, params: dict) -> str:
+    return hashlib.pbkdf2_hmac('sha256', pin.encode(), salt.encode(), params['iterations']).hex()
+
+
+def _scrypt(pin: str, salt: str, params: dict) -> str:
+    n, r, p = params['n'], params['r'], params['p']
+    # Memória necessária ~128 * r * n bytes (mais margem)
+    maxmem = 128 * r * n * (p + 1) + 1024 * 1024
+    return hashlib.scrypt(pin.encode(), salt=salt.encode(), n=n, r=r, p=p, maxmem=maxmem).hex()
+
+
+# Registo de KDFs disponíveis: nome -> função de hash e parâmetros por omissão
+PIN_KDFS = {
+    'pbkdf2_sha256': {
+        'hash': _pbkdf2_sha256,
+        'default_params': {'iterations': PBKDF2_ITERATIONS},
+    },
+    'scrypt': {
+        'hash': _scrypt,
+        'default_params': {'n': 2 ** 14, 'r': 8, 'p': 1},
+    },
+}
+
+# Parâmetros das reservas criadas antes do versionamento (pin_kdf NULL)
+LEGACY_PIN_KDF = 'pbkdf2_sha256'
+LEGACY_PIN_KDF_PARAMS = {'iterations': PBKDF2_ITERATIONS}
+
+# Configuração atual, usada para novos hashes (ver configure_pin_kdf)
+_current_kdf = {'name': LEGACY_PIN_KDF, 'params': dict(LEGACY_PIN_KDF_PARAMS)}
+
+
+def configure_pin_kdf(name: str, **params):
+    """Define o algoritmo e os parâmetros de custo usados para novos PINs"""
+    if name not in PIN_KDFS:
+        raise ValueError(f"KDF desconhecido: {name}")
+    merged = dict(PIN_KDFS[name]['default_params'])
+    merged.update(params)
+    _current_kdf['name'] = name
+    _current_kdf['params'] = merged
+    print(f"PIN KDF configurado: {name} {merged}")
+
+
+def get_pin_kdf() -> tuple:
+    """Algoritmo e parâmetros atuais - devolve (nome, params)"""
+    return _current_kdf['name'], dict(_current_kdf['params'])
+
+
+def _decode_params(kdf: str, params) -> tuple:
+    """Normaliza (kdf, params) vindos da base de dados (NULL = legado)"""
+    if not kdf:
+        return LEGACY_PIN_KDF, dict(LEGACY_PIN_KDF_PARAMS)
+    if isinstance(params, str):
+        params = json.loads(params) if params else {}
+    merged = dict(PIN_KDFS[kdf]['default_params'])
+    merged.update(params or {})
+    return kdf, merged
+
+
+def hash_pin(pin: str) -> tuple:
+    """Gera hash seguro do PIN com a KDF atual
+
+    Devolve (hash_hex, salt, kdf, params_json) - guardar os quatro valores.
+    """
+    kdf, params = get_pin_kdf()
+    salt = secrets.token_hex(16)
+    pin_hash = PIN_KDFS[kdf]['hash'](pin, salt, params)
+    return pin_hash, salt, kdf, json.dumps(params, sort_keys=True)
+
+
+def verify_pin(pin: str, pin_hash: str, salt: str, kdf: str = None, params=None) -> bool:
+    """Verifica se o PIN está correto (comparação em tempo constante)"""
+    kdf, params = _decode_params(kdf, params)
+    test_hash = PIN_KDFS[kdf]['hash'](pin, salt, params)
+    return hmac.compare_digest(test_hash, pin_hash)
+
+
+def _time_kdf_ms(kdf: str, params: dict, rounds: int = 3) -> float:
+    """Tempo médio (ms) de um hash com os parâmetros dados"""
+    salt = secrets.token_hex(16)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        PIN_KDFS[kdf]['hash']('0000', salt, params)
+    return (time.perf_counter() - start) * 1000 / rounds
+
+
+def calibrate_pin_kdf(target_ms: float = 100.0, kdf: str = 'pbkdf2_sha256', apply: bool = True) -> dict:
+    """Escolhe o custo da KDF para atingir target_ms por hash neste hardware
+
+    PBKDF2 escala linearmente com as iterações; no scrypt duplica-se N até
+    atingir o alvo (limitado a MAX_SCRYPT_N por causa da memória).
+    Com apply=True a configuração passa a ser usada em novos PINs.
+    """
+    if kdf not in PIN_KDFS:
+        raise ValueError(f"KDF desconhecido: {kdf}")
+
+    if kdf == 'pbkdf2_sha256':
+        probe_iterations = 20000
+        elapsed = _time_kdf_ms(kdf, {'iterations': probe_iterations})
+        iterations = int(probe_iterations * target_ms / max(elapsed, 0.001))
+        iterations = max(MIN_PBKDF2_ITERATIONS, round(iterations, -3))
+        params = {'iterations': iterations}
+    else:
+        params = dict(PIN_KDFS['scrypt']['default_params'])
+        params['n'] = 2 ** 10
+        while params['n'] < MAX_SCRYPT_N and _time_kdf_ms(kdf, params, rounds=1) < target_ms:
+            params['n'] *= 2
+
+    measured = _time_kdf_ms(kdf, params)
+    print(f"Calibração PIN KDF: {kdf} {params} -> {measured:.1f} ms (alvo {target_ms:.0f} ms)")
+
+    if apply:
+        configure_pin_kdf(kdf, **params)
+    return {'kdf': kdf, 'params': params, 'measured_ms': round(measured, 1)}
+
+
+def configure_pin_kdf_from_env() -> tuple:
+    """Configura a KDF no arranque a partir de variáveis de ambiente
+
+    PIN_KDF              algoritmo (pbkdf2_sha256 ou scrypt)
+    PIN_KDF_PARAMS       parâmetros em JSON, ex.: {"iterations": 200000}
+    PIN_KDF_TARGET_MS    sem PIN_KDF_PARAMS: calibra para este tempo por hash
+
+    Sem nenhuma das variáveis mantém-se a configuração legada. Devolve
+    (nome, params) em uso.
+    """
+    kdf = os.environ.get('PIN_KDF', '').strip()
+    params = os.environ.get('PIN_KDF_PARAMS', '').strip()
+    target_ms = os.environ.get('PIN_KDF_TARGET_MS', '').strip()
+
+    try:
+        if params:
+            configure_pin_kdf(kdf or LEGACY_PIN_KDF, **json.loads(params))
+        elif target_ms:
+            calibrate_pin_kdf(float(target_ms), kdf=kdf or LEGACY_PIN_KDF)
+        elif kdf:
+            configure_pin_kdf(kdf)
+    except (ValueError, TypeError) as e:
+        print(f"⚠️ Configuração da KDF do PIN inválida ({e}) - a usar {_current_kdf['name']}")
+    return get_pin_kdf()
+
+
+def get_pin_executor() -> ThreadPoolExecutor:
+    """Pool de workers partilhado por todas as instâncias de LockerDatabase"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=PIN_WORKERS, thread_name_prefix='pin-worker')
+        return _executor
+
+
+def submit_pin_task(func, *args, callback=None, **kwargs):
+    """Executa func no pool de workers e devolve um Future
+
+    Se callback for fornecido, é chamado com o resultado (ou None em caso de
+    exceção) na thread do worker - a UI deve reencaminhá-lo com Clock.schedule_once.
+    """
+    future = get_pin_executor().submit(func, *args, **kwargs)
+
+    if callback is not None:
+        def on_done(done_future):
+            try:
+                result = done_future.result()
+            except Exception as e:
+                print(f"Erro na tarefa de PIN: {e}")
+                result = None
+            try:
+                callback(result)
+            except Exception as e:
+                print(f"Erro no callback da tarefa de PIN: {e}")
+
+        future.add_done_callback(on_done)
+
+    return future
+
+
+def shutdown_pin_workers(wait: bool = True):
+    """Termina o pool de workers (ex.: ao fechar a aplicação)"""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
@@ -29,6 +29,7 @@ from typing import List, Dict, Optional
 RASPBERRY_PI_IP = "192.168.1.100"  # ⚠️ ALTERE PARA O IP DO SEU RASPBERRY PI
 API_PORT = 5000
 TIMEOUT = 10  # segundos
+PAGE_SIZE = 50  # reservas por página (a API usa paginação por cursor)
 
 class RemoteLockerClient:
     """Cliente para acesso remoto ao sistema de cacifos"""
@@ -43,6 +44,38 @@ class RemoteLockerClient:
         """
         self.base_url = f"http://{host_ip}:{port}/api"
         self.web_url = f"http://{host_ip}:{port}"
+        self.next_cursor = None  # cursor da página seguinte da última consulta
+    
+    def _get_booking_page(self, path: str, params: Optional[Dict] = None,
+                          limit: Optional[int] = PAGE_SIZE, cursor: Optional[str] = None) -> List[Dict]:
+        """
+        Obtém uma página de reservas de um endpoint paginado
+        
+        Guarda em self.next_cursor o cursor da página seguinte (None se for
+        a última). Com limit=None segue os cursores até obter todas.
+        
+        Raises:
+            requests.exceptions.RequestException em caso de erro
+        """
+        # Um pedido falhado não pode deixar o cursor da consulta anterior
+        self.next_cursor = None
+        params = dict(params or {})
+        params['limit'] = limit or PAGE_SIZE
+        bookings = []
+        
+        while True:
+            if cursor:
+                params['cursor'] = cursor
+            response = requests.get(f"{self.base_url}{path}", params=params, timeout=TIMEOUT)
+            response.raise_for_status()
+            page = response.json()
+            bookings.extend(page.get('bookings', []))
+            cursor = page.get('next_cursor')
+            if limit is not None or not cursor:
+                break
+        
+        self.next_cursor = cursor
+        return bookings
         
     def test_connection(self) -> bool:
         """
@@ -72,21 +105,19 @@ class RemoteLockerClient:
             print("   • A rede está acessível")
             return False
     
-    def get_all_bookings(self, limit: Optional[int] = None) -> List[Dict]:
+    def get_all_bookings(self, limit: Optional[int] = None, cursor: Optional[str] = None) -> List[Dict]:
         """
         Consulta todas as reservas
         
         Args:
             limit: Limite de resultados (None para todos)
+            cursor: Cursor devolvido pela página anterior (self.next_cursor)
             
         Returns:
             Lista de reservas
         """
         try:
-            params = {'limit': limit} if limit else {}
-            response = requests.get(f"{self.base_url}/bookings", params=params, timeout=TIMEOUT)
-            response.raise_for_status()
-            return response.json()
+            return self._get_booking_page("/bookings", limit=limit, cursor=cursor)
         except requests.exceptions.RequestException as e:
             print(f"❌ Erro ao consultar reservas: {e}")
             return []
@@ -99,64 +130,64 @@ class RemoteLockerClient:
             Lista de reservas ativas
         """
         try:
-            response = requests.get(f"{self.base_url}/bookings/active", timeout=TIMEOUT)
-            response.raise_for_status()
-            return response.json()
+            return self._get_booking_page("/bookings/active", limit=None)
         except requests.exceptions.RequestException as e:
             print(f"❌ Erro ao consultar reservas ativas: {e}")
             return []
     
-    def get_recent_bookings(self, days: int = 7) -> List[Dict]:
+    def get_recent_bookings(self, days: int = 7, limit: Optional[int] = PAGE_SIZE,
+                            cursor: Optional[str] = None) -> List[Dict]:
         """
         Consulta reservas recentes
         
         Args:
             days: Número de dias para considerar "recente"
+            limit: Reservas por página (None para todas)
+            cursor: Cursor devolvido pela página anterior (self.next_cursor)
             
         Returns:
             Lista de reservas recentes
         """
         try:
-            params = {'days': days}
-            response = requests.get(f"{self.base_url}/bookings/recent", params=params, timeout=TIMEOUT)
-            response.raise_for_status()
-            return response.json()
+            return self._get_booking_page("/bookings/recent", {'days': days}, limit=limit, cursor=cursor)
         except requests.exceptions.RequestException as e:
             print(f"❌ Erro ao consultar reservas recentes: {e}")
             return []
     
-    def search_by_contact(self, contact: str) -> List[Dict]:
+    def search_by_contact(self, contact: str, limit: Optional[int] = PAGE_SIZE,
+                          cursor: Optional[str] = None) -> List[Dict]:
         """
         Pesquisa reservas por contacto
         
         Args:
             contact: Termo de pesquisa (busca parcial)
+            limit: Reservas por página (None para todas)
+            cursor: Cursor devolvido pela página anterior (self.next_cursor)
             
         Returns:
             Lista de reservas encontradas
         """
         try:
-            response = requests.get(f"{self.base_url}/bookings/contact/{contact}", timeout=TIMEOUT)
-            response.raise_for_status()
-            return response.json()
+            return self._get_booking_page(f"/bookings/contact/{contact}", limit=limit, cursor=cursor)
         except requests.exceptions.RequestException as e:
             print(f"❌ Erro ao pesquisar contacto: {e}")
             return []
     
-    def get_locker_history(self, locker_number: str) -> List[Dict]:
+    def get_locker_history(self, locker_number: str, limit: Optional[int] = PAGE_SIZE,
+                           cursor: Optional[str] = None) -> List[Dict]:
         """
         Consulta histórico de um locker específico
         
         Args:
             locker_number: Número do locker (ex: "A1")
+            limit: Reservas por página (None para todas)
+            cursor: Cursor devolvido pela página anterior (self.next_cursor)
             
         Returns:
             Lista de reservas do locker
         """
         try:
-            response = requests.get(f"{self.base_url}/bookings/locker/{locker_number}", timeout=TIMEOUT)
-            response.raise_for_status()
-            return response.json()
+            return self._get_booking_page(f"/bookings/locker/{locker_number}", limit=limit, cursor=cursor)
         except requests.exceptions.RequestException as e:
             print(f"❌ Erro ao consultar locker: {e}")
             return []
@@ -176,25 +207,32 @@ class RemoteLockerClient:
             print(f"❌ Erro ao consultar estatísticas: {e}")
             return {}
     
-    def export_csv(self, filename: Optional[str] = None) -> bool:
+    def export_data(self, filename: Optional[str] = None, fmt: str = 'csv', **filters) -> bool:
         """
-        Exporta todos os dados para CSV
+        Exporta reservas num dos formatos da API (csv, ndjson, arrow, parquet)
+        
+        O ficheiro é escrito à medida que é recebido (sem o carregar todo em memória).
         
         Args:
             filename: Nome do arquivo (None para auto-gerar)
+            fmt: Formato de exportação
+            filters: start, end (YYYY-MM-DD) e locker
             
         Returns:
             True se exportou com sucesso
         """
         try:
-            response = requests.get(f"{self.base_url}/export", timeout=TIMEOUT)
-            response.raise_for_status()
-            
-            if not filename:
-                filename = f"locker_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-            
-            with open(filename, 'wb') as f:
-                f.write(response.content)
+            params = {'format': fmt}
+            params.update({key: value for key, value in filters.items() if value})
+            with requests.get(f"{self.base_url}/export", params=params, timeout=TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                
+                if not filename:
+                    filename = f"locker_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+                
+                with open(filename, 'wb') as f:
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        f.write(chunk)
             
             print(f"✅ Dados exportados para: {filename}")
             return True
@@ -202,6 +240,36 @@ class RemoteLockerClient:
             print(f"❌ Erro ao exportar dados: {e}")
             return False
     
+    def export_csv(self, filename: Optional[str] = None) -> bool:
+        """
+        Exporta todos os dados para CSV
+        
+        Args:
+            filename: Nome do arquivo (None para auto-gerar)
+            
+        Returns:
+            True se exportou com sucesso
+        """
+        return self.export_data(filename, fmt='csv')
+    
+    def iter_export_rows(self, **filters):
+        """
+        Itera as reservas exportadas (NDJSON) sem descarregar o ficheiro todo
+        
+        Args:
+            filters: start, end (YYYY-MM-DD) e locker
+            
+        Yields:
+            Dicionário por reserva
+        """
+        params = {'format': 'ndjson'}
+        params.update({key: value for key, value in filters.items() if value})
+        with requests.get(f"{self.base_url}/export", params=params, timeout=TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+    
     def format_booking(self, booking: Dict) -> str:
         """Formata uma reserva para exibição"""
         lines = []
@@ -339,16 +407,34 @@ class RemoteClientMenu:
                 print(f"\n❌ Erro inesperado: {e}")
                 input("\n⏸️  Pressione Enter para continuar...")
     
+    def _display_paged(self, fetch_page, title: str) -> None:
+        """Mostra uma consulta paginada, pedindo a página seguinte ao utilizador
+        
+        fetch_page(cursor) deve devolver a lista de reservas dessa página.
+        """
+        bookings = fetch_page(None)
+        page_number = 1
+        self.client.display_bookings(bookings, title)
+        
+        while self.client.next_cursor:
+            more = input("\n➡️  Enter para a página seguinte, 'q' para terminar: ").strip().lower()
+            if more == 'q':
+                break
+            page_number += 1
+            bookings = fetch_page(self.client.next_cursor)
+            self.client.display_bookings(bookings, f"{title} (página {page_number})")
+    
     def _query_all_bookings(self) -> None:
         """Consulta todas as reservas"""
         try:
-            limit_input = input("\n🔢 Limitar resultados (Enter para todas, recomendado 50): ").strip()
-            limit = int(limit_input) if limit_input.isdigit() else 50
+            limit_input = input(f"\n🔢 Reservas por página (padrão {PAGE_SIZE}): ").strip()
+            limit = int(limit_input) if limit_input.isdigit() else PAGE_SIZE
             
             print("⏳ Consultando reservas...")
-            bookings = self.client.get_all_bookings(limit=limit)
-            title = f"Todas as Reservas{f' (últimas {limit})' if limit else ''}"
-            self.client.display_bookings(bookings, title)
+            self._display_paged(
+                lambda cursor: self.client.get_all_bookings(limit=limit, cursor=cursor),
+                f"Todas as Reservas ({limit} por página)"
+            )
             
         except Exception as e:
             print(f"❌ Erro ao consultar reservas: {e}")
@@ -370,8 +456,10 @@ class RemoteClientMenu:
             days = int(days_input) if days_input.isdigit() else 7
             
             print(f"⏳ Consultando reservas dos últimos {days} dias...")
-            bookings = self.client.get_recent_bookings(days=days)
-            self.client.display_bookings(bookings, f"Reservas dos Últimos {days} Dias")
+            self._display_paged(
+                lambda cursor: self.client.get_recent_bookings(days=days, cursor=cursor),
+                f"Reservas dos Últimos {days} Dias"
+            )
             
         except Exception as e:
             print(f"❌ Erro ao consultar reservas recentes: {e}")
@@ -385,8 +473,10 @@ class RemoteClientMenu:
                 return
             
             print(f"⏳ Pesquisando por '{contact}'...")
-            bookings = self.client.search_by_contact(contact)
-            self.client.display_bookings(bookings, f"Reservas para '{contact}'")
+            self._display_paged(
+                lambda cursor: self.client.search_by_contact(contact, cursor=cursor),
+                f"Reservas para '{contact}'"
+            )
             
         except Exception as e:
             print(f"❌ Erro ao pesquisar contacto: {e}")
@@ -400,8 +490,10 @@ class RemoteClientMenu:
                 return
             
             print(f"⏳ Consultando histórico do locker {locker}...")
-            bookings = self.client.get_locker_history(locker)
-            self.client.display_bookings(bookings, f"Histórico do Locker {locker}")
+            self._display_paged(
+                lambda cursor: self.client.get_locker_history(locker, cursor=cursor),
+                f"Histórico do Locker {locker}"
+            )
             
         except Exception as e:
             print(f"❌ Erro ao consultar locker: {e}")
@@ -419,11 +511,12 @@ class RemoteClientMenu:
     def _export_data(self) -> None:
         """Exporta dados"""
         try:
-            filename = input("\n📄 Nome do arquivo (Enter para auto): ").strip()
+            fmt = input("\n📄 Formato (csv/ndjson/arrow/parquet, padrão csv): ").strip().lower() or 'csv'
+            filename = input("📄 Nome do arquivo (Enter para auto): ").strip()
             filename = filename if filename else None
             
             print("⏳ Exportando dados...")
-            if self.client.export_csv(filename):
+            if self.client.export_data(filename, fmt=fmt):
                 print("✅ Exportação concluída com sucesso!")
             else:
                 print("❌ Falha na exportação.")
@@ -444,6 +537,7 @@ class RemoteClientMenu:
 
 def main():
     """Função principal"""
+    global RASPBERRY_PI_IP
     print("🔧 Configurando cliente remoto...")
     
     # Verificar se IP está configurado
@@ -455,7 +549,6 @@ def main():
         # Permitir configurar IP temporariamente
         new_ip = input("\n🔧 Digite o IP do Raspberry Pi (ou Enter para usar padrão): ").strip()
         if new_ip:
-            global RASPBERRY_PI_IP
             RASPBERRY_PI_IP = new_ip
         else:
             print("⚠️  Usando IP padrão - pode não funcionar...")
@@ -0,0 +1,239 @@
+# sms_router.py
+# Encaminhamento de SMS entre fornecedores (Twilio, TextBelt)
+#
+# Cada fornecedor tem um circuit breaker: depois de várias falhas seguidas
+# deixa de ser tentado durante reset_timeout segundos, por isso durante
+# uma falha do fornecedor as reservas não ficam todas à espera dele.
+# Um health score (EWMA das taxas de sucesso) escolhe o fornecedor
+# principal e a EWMA da latência define quando lançar o secundário no
+# modo hedged - a latência do SMS fica limitada mesmo durante incidentes.
+#
+# Atenção: no modo hedged, se os dois fornecedores responderem, o
+# utilizador pode receber o SMS duas vezes. Está desligado por omissão.
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Falhas seguidas que abrem o circuito e tempo (s) até voltar a experimentar
+BREAKER_FAILURE_THRESHOLD = 3
+BREAKER_RESET_TIMEOUT = 60.0
+
+# Peso da última medição nas médias móveis (health score e latência)
+EWMA_ALPHA = 0.3
+
+# Meia-vida (s) da recuperação do health score: um fornecedor despromovido
+# deixa de receber tráfego, por isso as falhas antigas vão sendo esquecidas
+HEALTH_RECOVERY_HALF_LIFE = 120.0
+
+# Modo hedged: espera máxima (s) pelo principal antes de lançar o secundário.
+# Com latência conhecida, espera HEDGE_LATENCY_MULTIPLIER x a latência média
+# (nunca menos de HEDGE_MIN_DELAY).
+HEDGE_DELAY = 3.0
+HEDGE_MIN_DELAY = 0.5
+HEDGE_LATENCY_MULTIPLIER = 2.0
+
+
+class CircuitBreaker:
+    """Circuit breaker: closed -> open (após falhas) -> half_open (teste) -> closed"""
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Pode tentar-se agora? Em half_open só passa um pedido de teste"""
+        with self._lock:
+            if self.state == 'open':
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = 'half_open'
+                self._probe_in_flight = False
+            if self.state == 'half_open':
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> bool:
+        """Regista uma falha - True se o circuito acabou de abrir"""
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                opened = self.state != 'open'
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                return opened
+            return False
+
+
+class SMSProvider:
+    """Fornecedor de SMS: send(phone, body) -> bool e estatísticas de saúde"""
+
+    def __init__(self, name: str, send, is_configured=None, breaker: CircuitBreaker = None):
+        self.name = name
+        self.send = send
+        self.is_configured = is_configured or (lambda: True)
+        self.breaker = breaker or CircuitBreaker()
+
+        self.health = 1.0          # EWMA da taxa de sucesso (0..1)
+        self.latency_ewma = None   # EWMA da latência (s) - None até à 1.ª medição
+        self.updated_at = time.monotonic()
+        self.successes = 0
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def _current_health(self) -> float:
+        elapsed = time.monotonic() - self.updated_at
+        return 1.0 - (1.0 - self.health) * 0.5 ** (elapsed / HEALTH_RECOVERY_HALF_LIFE)
+
+    def current_health(self) -> float:
+        """Health score com a recuperação desde a última medição"""
+        with self._lock:
+            return self._current_health()
+
+    def record(self, success: bool, latency: float):
+        with self._lock:
+            self.health = EWMA_ALPHA * (1.0 if success else 0.0) + (1 - EWMA_ALPHA) * self._current_health()
+            self.updated_at = time.monotonic()
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma = EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.latency_ewma
+            if success:
+                self.successes += 1
+            else:
+                self.failures += 1
+        if success:
+            self.breaker.record_success()
+        elif self.breaker.record_failure():
+            print(f"⛔ SMS {self.name}: circuito aberto após {self.breaker.failures} falhas - "
+                  f"pausa de {self.breaker.reset_timeout:.0f}s")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'state': self.breaker.state,
+                'health': round(self._current_health(), 3),
+                'latency_ms': round(self.latency_ewma * 1000, 1) if self.latency_ewma is not None else None,
+                'successes': self.successes,
+                'failures': self.failures
+            }
+
+
+class SMSRouter:
+    """Envia cada SMS pelo fornecedor mais saudável, com fallback ou hedging"""
+
+    def __init__(self, providers: list, hedged: bool = False, hedge_delay: float = HEDGE_DELAY):
+        self.providers = providers
+        self.hedged = hedged
+        self.hedge_delay = hedge_delay
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def configure(self, hedged: bool = None, hedge_delay: float = None,
+                  failure_threshold: int = None, reset_timeout: float = None):
+        """Altera o modo hedged e os parâmetros dos circuit breakers"""
+        if hedged is not None:
+            self.hedged = hedged
+        if hedge_delay is not None:
+            self.hedge_delay = hedge_delay
+        for provider in self.providers:
+            if failure_threshold is not None:
+                provider.breaker.failure_threshold = failure_threshold
+            if reset_timeout is not None:
+                provider.breaker.reset_timeout = reset_timeout
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='sms-hedge')
+            return self._executor
+
+    def ranked_providers(self) -> list:
+        """Fornecedores configurados, do mais saudável para o menos (empate: ordem original)"""
+        configured = [p for p in self.providers if p.is_configured()]
+        return sorted(configured, key=lambda p: -round(p.current_health(), 1))
+
+    def _attempt(self, provider: SMSProvider, phone: str, body: str) -> bool:
+        start = time.monotonic()
+        try:
+            success = bool(provider.send(phone, body))
+        except Exception as e:
+            print(f"❌ Erro no fornecedor de SMS {provider.name}: {e}")
+            success = False
+        provider.record(success, time.monotonic() - start)
+        return success
+
+    def _hedge_deadline(self, provider: SMSProvider) -> float:
+        """Quanto esperar pelo fornecedor antes de lançar o seguinte"""
+        if provider.latency_ewma is None:
+            return self.hedge_delay
+        return min(self.hedge_delay, max(HEDGE_MIN_DELAY, provider.latency_ewma * HEDGE_LATENCY_MULTIPLIER))
+
+    def send(self, phone: str, body: str) -> bool:
+        """Envia um SMS - True se algum fornecedor o aceitou"""
+        candidates = self.ranked_providers()
+        if not candidates:
+            print("⚠️ Nenhum fornecedor de SMS configurado")
+            return False
+        if self.hedged and len(candidates) > 1:
+            return self._send_hedged(candidates, phone, body)
+
+        for provider in candidates:
+            if provider.breaker.allow_request() and self._attempt(provider, phone, body):
+                return True
+        return False
+
+    def _send_hedged(self, candidates: list, phone: str, body: str) -> bool:
+        """Lança o fornecedor seguinte se o atual falhar ou demorar mais que o previsto
+
+        Devolve assim que um aceitar; os pedidos ainda em curso terminam em
+        segundo plano (e contam para as estatísticas).
+        """
+        executor = self._get_executor()
+        remaining = list(candidates)
+        pending = set()
+
+        while remaining or pending:
+            # Sem resposta dentro do prazo, ou o anterior falhou: lançar o seguinte
+            # (o circuit breaker só é consultado no lançamento - em half_open
+            # isso reserva o único pedido de teste)
+            deadline = None
+            while remaining:
+                provider = remaining.pop(0)
+                if provider.breaker.allow_request():
+                    pending.add(executor.submit(self._attempt, provider, phone, body))
+                    if remaining:
+                        deadline = self._hedge_deadline(provider)
+                    break
+            if not pending:
+                break
+
+            done, pending = wait(pending, timeout=deadline, return_when=FIRST_COMPLETED)
+            if any(future.result() for future in done):
+                return True
+        return False
+
+    def stats(self) -> dict:
+        """Estado de cada fornecedor: circuito, health score, latência média e contagens"""
+        return {provider.name: provider.stats() for provider in self.providers}
+
+    def shutdown(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
@@ -0,0 +1,246 @@
+# smtp_pool.py
+# Sessões SMTP autenticadas reutilizadas entre mensagens
+#
+# Cada sessão faz o handshake TCP + STARTTLS + login uma única vez e envia
+# várias mensagens. Sessões paradas há mais de idle_timeout segundos (que o
+# servidor pode já ter fechado) são descartadas; se a ligação cair a meio
+# de um envio, a sessão é refeita e o envio repetido uma vez.
+
+import smtplib
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+
+# Sessões abertas em simultâneo (o Gmail limita ligações por conta)
+SMTP_POOL_SIZE = 2
+
+# Segundos sem uso ao fim dos quais uma sessão já não é reutilizada
+SMTP_IDLE_TIMEOUT = 60.0
+
+# Mensagens por sessão antes de a renovar (alguns servidores limitam)
+SMTP_MAX_MESSAGES_PER_SESSION = 100
+
+# Timeout (s) das operações de rede
+SMTP_TIMEOUT = 30.0
+
+
+def is_connection_error(error: Exception) -> bool:
+    """Erro de ligação (vale a pena reconectar e repetir) e não uma recusa do servidor
+
+    SMTPException herda de OSError, por isso as recusas (ex.: destinatário
+    inválido) têm de ser excluídas explicitamente.
+    """
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    return isinstance(error, OSError) and not isinstance(error, smtplib.SMTPException)
+
+
+class _SMTPSession:
+    """Ligação SMTP autenticada e contadores de uso"""
+
+    def __init__(self, smtp: smtplib.SMTP, settings: tuple):
+        self.smtp = smtp
+        self.settings = settings
+        self.messages = 0
+        self.last_used = time.monotonic()
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+        try:
+            self.smtp.quit()
+        except Exception:
+            try:
+                self.smtp.close()
+            except Exception:
+                pass
+
+
+class SMTPSessionPool:
+    """Pool de sessões SMTP partilhado pelas threads de envio"""
+
+    def __init__(self, max_size: int = SMTP_POOL_SIZE, idle_timeout: float = SMTP_IDLE_TIMEOUT,
+                 max_messages: int = SMTP_MAX_MESSAGES_PER_SESSION, timeout: float = SMTP_TIMEOUT):
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self.timeout = timeout
+
+        self._settings = None
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._local = threading.local()
+
+        self._connects = 0
+        self._reconnects = 0
+        self._sent = 0
+
+    def configure(self, smtp_server: str, smtp_port: int, username: str, password: str):
+        """Define o servidor/credenciais - sessões abertas com outros dados são fechadas"""
+        settings = (smtp_server, int(smtp_port), username, password)
+        with self._lock:
+            changed = settings != self._settings
+            self._settings = settings
+        if changed:
+            self.close_all()
+
+    def _connect(self) -> _SMTPSession:
+        """Abre uma sessão nova: ligação, STARTTLS e login"""
+        settings = self._settings
+        server, port, username, password = settings
+        smtp = smtplib.SMTP(server, port, timeout=self.timeout)
+        try:
+            smtp.starttls(context=ssl.create_default_context())
+            smtp.login(username, password)
+        except Exception:
+            smtp.close()
+            raise
+        with self._lock:
+            self._connects += 1
+        return _SMTPSession(smtp, settings)
+
+    def _acquire(self) -> _SMTPSession:
+        """Sessão ociosa ainda válida ou, se não houver, uma nova"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise TimeoutError("Nenhuma sessão SMTP livre")
+
+        stale = []
+        session = None
+        try:
+            with self._lock:
+                now = time.monotonic()
+                while self._idle:
+                    candidate = self._idle.pop()
+                    if now - candidate.last_used < self.idle_timeout:
+                        session = candidate
+                        break
+                    stale.append(candidate)
+            for old in stale:
+                old.close()
+            return session or self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, session: _SMTPSession, broken: bool = False):
+        """Devolve a sessão ao pool (ou fecha-a se falhou ou já enviou demasiado)"""
+        try:
+            if (broken or session.closed or session.messages >= self.max_messages
+                    or session.settings != self._settings):
+                session.close()
+            else:
+                session.last_used = time.monotonic()
+                with self._lock:
+                    self._idle.append(session)
+        finally:
+            self._slots.release()
+
+    def _send_with(self, session: _SMTPSession, from_addr: str, to_addrs, text: str) -> _SMTPSession:
+        """Envia pela sessão dada; se a ligação caiu, reconecta e repete uma vez
+
+        Devolve a sessão usada (pode ser uma nova).
+        """
+        try:
+            session.smtp.sendmail(from_addr, to_addrs, text)
+        except Exception as e:
+            if not is_connection_error(e):
+                raise
+            session.close()
+            session = self._connect()
+            with self._lock:
+                self._reconnects += 1
+            try:
+                session.smtp.sendmail(from_addr, to_addrs, text)
+            except Exception:
+                session.close()
+                raise
+        session.messages += 1
+        session.last_used = time.monotonic()
+        with self._lock:
+            self._sent += 1
+        return session
+
+    def send(self, from_addr: str, to_addrs, text: str):
+        """Envia uma mensagem (levanta a exceção do smtplib se falhar)
+
+        Dentro de batch(), usa a sessão reservada para a thread atual.
+        """
+        if self._settings is None:
+            raise RuntimeError("Servidor SMTP não configurado")
+
+        batch_session = getattr(self._local, 'session', None)
+        if batch_session is not None:
+            self._local.session = self._send_with(batch_session, from_addr, to_addrs, text)
+            return
+
+        session = self._acquire()
+        broken = False
+        try:
+            session = self._send_with(session, from_addr, to_addrs, text)
+        except Exception as e:
+            # Recusas do servidor (ex.: destinatário inválido) não estragam a sessão
+            broken = is_connection_error(e)
+            raise
+        finally:
+            self._release(session, broken)
+
+    @contextmanager
+    def batch(self):
+        """Reserva uma sessão para a thread atual durante um lote de envios
+
+        Todos os send() dentro do bloco usam a mesma ligação, sem voltar ao
+        pool entre mensagens. Se não for possível ligar, os envios do bloco
+        seguem o caminho normal (e falham um a um).
+        """
+        if self._settings is None or getattr(self._local, 'session', None) is not None:
+            yield
+            return
+
+        try:
+            session = self._acquire()
+        except Exception as e:
+            print(f"❌ Erro ao abrir sessão SMTP: {e}")
+            session = None
+        if session is None:
+            yield
+            return
+
+        self._local.session = session
+        broken = False
+        try:
+            yield
+        except Exception as e:
+            broken = is_connection_error(e)
+            raise
+        finally:
+            session, self._local.session = self._local.session, None
+            self._release(session, broken)
+
+    def close_idle(self):
+        """Fecha as sessões paradas há mais de idle_timeout"""
+        now = time.monotonic()
+        with self._lock:
+            stale = [s for s in self._idle if now - s.last_used >= self.idle_timeout]
+            self._idle = [s for s in self._idle if now - s.last_used < self.idle_timeout]
+        for session in stale:
+            session.close()
+
+    def close_all(self):
+        """Fecha todas as sessões ociosas (as que estão em uso fecham ao ser devolvidas)"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for session in idle:
+            session.close()
+
+    def stats(self) -> dict:
+        """Métricas do pool: sessões ociosas, ligações abertas e mensagens enviadas"""
+        with self._lock:
+            return {
+                'idle': len(self._idle),
+                'max_size': self.max_size,
+                'connects': self._connects,
+                'reconnects': self._reconnects,
+                'sent': self._sent
+            }
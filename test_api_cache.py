@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste da cache HTTP da API (ETag/Last-Modified)
+================================================
+Respostas 304 enquanto data_version não muda, invalidação da cache em cada
+escrita e a chave de validade com a data UTC.
+"""
+
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+from api_cache import ResponseCache
+from api_shared import cache_version
+
+
+@pytest.fixture
+def client(db, tmp_path, monkeypatch):
+    """Cliente de teste do Flask a usar a base de dados temporária"""
+    pytest.importorskip('flask')
+    pytest.importorskip('flask_cors')
+    # O import cria LockerDatabase() no diretório atual - nunca no do projeto
+    monkeypatch.chdir(tmp_path)
+    import database_api
+    monkeypatch.setattr(database_api, 'db', db)
+    monkeypatch.setattr(database_api, 'response_cache', ResponseCache())
+    return database_api.app.test_client()
+
+
+def test_etag_and_not_modified(client):
+    """O mesmo ETag enquanto os dados não mudam; If-None-Match -> 304 sem corpo"""
+    first = client.get('/api/stats')
+    assert first.status_code == 200
+    etag = first.headers['ETag']
+    assert first.headers['Cache-Control'] == 'no-cache'
+    assert first.headers.get('Last-Modified')
+
+    assert client.get('/api/stats').headers['ETag'] == etag
+    cached = client.get('/api/stats', headers={'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+
+def test_write_invalidates_etag_and_cache(client, db):
+    """Uma reserva muda data_version: novo ETag e resposta atualizada"""
+    import database_api
+
+    before = client.get('/api/bookings/active')
+    assert before.get_json()['bookings'] == []
+    etag = before.headers['ETag']
+    assert database_api.response_cache.stats()['entries'] == 1
+
+    assert db.book_locker('001', contact='cache@example.com', pin='2468').get('success')
+
+    after = client.get('/api/bookings/active', headers={'If-None-Match': etag})
+    assert after.status_code == 200
+    assert after.headers['ETag'] != etag
+    assert [booking['contact'] for booking in after.get_json()['bookings']] == ['cache@example.com']
+
+
+def test_cached_response_served_without_query(client, db, monkeypatch):
+    """Com a versão igual, a segunda resposta vem da cache"""
+    import database_api
+
+    first = client.get('/api/stats')
+    monkeypatch.setattr(db, 'get_booking_statistics', lambda: pytest.fail('consultou a base de dados'))
+    second = client.get('/api/stats')
+    assert second.status_code == 200
+    assert second.data == first.data
+    assert database_api.response_cache.stats()['hits'] == 1
+
+
+def test_response_cache_version():
+    """Mudar a versão esvazia a cache; put com versão antiga não fica guardado"""
+    cache = ResponseCache(max_entries=2)
+    cache.put('/a', 1, b'a')
+    assert cache.get('/a', 1) == (b'a', 200, 'application/json')
+    assert cache.get('/a', 2) is None
+    cache.put('/a', 1, b'old')
+    assert cache.get('/a', 2) is None
+
+    for key in ('/a', '/b', '/c'):
+        cache.put(key, 2, key.encode())
+    assert cache.get('/a', 2) is None and cache.get('/c', 2) == (b'/c', 200, 'application/json')
+
+
+def test_cache_version_uses_utc_date():
+    """A data da chave é UTC, como date('now') no SQLite"""
+    assert cache_version(7) == (7, datetime.now(timezone.utc).strftime('%Y%m%d'))
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste da exportação de reservas (booking_export)
+=================================================
+Colunas e ordem do CSV/NDJSON, blocos do stream, filtros por data/cacifo e
+os formatos colunares Arrow/Parquet (só com pyarrow instalado).
+"""
+
+import sys
+import csv
+import json
+from io import StringIO
+
+import pytest
+
+from api_shared import parse_export_filters
+from booking_export import (EXPORT_FIELDS, PYARROW_AVAILABLE, export_bookings, iter_csv, iter_ndjson,
+                            write_columnar)
+
+# Cabeçalho do export CSV original - ler por posição tem de continuar a funcionar
+LEGACY_CSV_FIELDS = ['id', 'locker_number', 'contact', 'pin', 'status',
+                     'booking_time', 'unlock_time', 'return_time', 'notes']
+
+
+@pytest.fixture
+def history(db):
+    """Quatro reservas em dias e cacifos diferentes"""
+    conn = db._get_connection()
+    try:
+        conn.executemany('''
+            INSERT INTO bookings (locker_number, contact, name, email, phone, pin_hash, pin_salt,
+                                  pin_display, status, booking_time, return_time)
+            VALUES (?, ?, ?, ?, ?, 'hash', 'salt', '2468', 'completed', ?, ?)
+        ''', [
+            ('001', 'a@example.com', 'Ana', 'a@example.com', '910000001', '2025-03-01 09:00:00', '2025-03-01 12:00:00'),
+            ('002', 'b@example.com', 'Bruno', 'b@example.com', '910000002', '2025-03-02 09:00:00', None),
+            ('001', 'c@example.com', 'Carla', 'c@example.com', '910000003', '2025-03-02 23:59:59', None),
+            ('003', 'd@example.com', 'Duarte', 'd@example.com', '910000004', '2025-03-03 00:00:00', None),
+        ])
+        conn.commit()
+    finally:
+        db._release_connection(conn)
+    return db
+
+
+def read_csv(text):
+    return list(csv.reader(StringIO(text)))
+
+
+def test_csv_keeps_legacy_column_order(history):
+    """As colunas antigas mantêm a posição; name, email e phone vêm no fim"""
+    assert EXPORT_FIELDS[:len(LEGACY_CSV_FIELDS)] == LEGACY_CSV_FIELDS
+    assert EXPORT_FIELDS[len(LEGACY_CSV_FIELDS):] == ['name', 'email', 'phone']
+
+    rows = read_csv(''.join(iter_csv(history.iter_bookings())))
+    assert rows[0] == EXPORT_FIELDS
+    first = dict(zip(rows[0], rows[1]))
+    assert rows[1][:4] == [first['id'], '001', 'a@example.com', '2468']
+    assert (first['name'], first['email'], first['phone']) == ('Ana', 'a@example.com', '910000001')
+    assert 'birth_date' not in rows[0]
+
+
+def test_csv_batches_join_to_full_export(history):
+    """Os blocos do stream juntos dão o mesmo ficheiro, com o cabeçalho uma vez"""
+    whole = ''.join(iter_csv(history.iter_bookings(), batch_size=1000))
+    chunks = list(iter_csv(history.iter_bookings(), batch_size=1))
+    assert len(chunks) == 5
+    assert ''.join(chunks) == whole
+    assert whole.count('id,locker_number') == 1
+
+
+def test_ndjson_fields_in_export_order(history):
+    """Cada linha NDJSON é um objeto com as mesmas chaves, pela mesma ordem"""
+    lines = ''.join(iter_ndjson(history.iter_bookings(), batch_size=3)).splitlines()
+    assert len(lines) == 4
+    records = [json.loads(line) for line in lines]
+    assert all(list(record) == EXPORT_FIELDS for record in records)
+    assert [record['name'] for record in records] == ['Ana', 'Bruno', 'Carla', 'Duarte']
+    assert records[0]['return_time'] == '2025-03-01 12:00:00'
+    assert records[1]['return_time'] is None
+
+
+def test_export_filters(history):
+    """Datas inclusivas (o dia final inteiro) e filtro por cacifo"""
+    def names(**filters):
+        return [booking['name'] for booking in history.iter_bookings(**filters)]
+
+    assert names(start_date='2025-03-02', end_date='2025-03-02') == ['Bruno', 'Carla']
+    assert names(start_date='2025-03-02') == ['Bruno', 'Carla', 'Duarte']
+    assert names(end_date='2025-03-01') == ['Ana']
+    assert names(locker_number='001') == ['Ana', 'Carla']
+    assert names(locker_number='001', start_date='2025-03-02') == ['Carla']
+
+
+def test_parse_export_filters():
+    """Parâmetros do pedido -> filtros; datas inválidas levantam ValueError"""
+    assert parse_export_filters({'start': '2025-03-01', 'locker': '002'}) == {
+        'start_date': '2025-03-01', 'end_date': None, 'locker_number': '002'}
+    with pytest.raises(ValueError):
+        parse_export_filters({'end': '03/01/2025'})
+
+
+def test_export_bookings_to_file(history, tmp_path):
+    """export_bookings escreve o ficheiro e devolve o número de reservas"""
+    filename = str(tmp_path / 'export.csv')
+    result = export_bookings(history, filename, 'csv', locker_number='001')
+    assert result == {'filename': filename, 'format': 'csv', 'count': 2}
+    with open(filename, newline='', encoding='utf-8') as f:
+        rows = read_csv(f.read())
+    assert [row[EXPORT_FIELDS.index('name')] for row in rows[1:]] == ['Ana', 'Carla']
+
+    with pytest.raises(ValueError):
+        export_bookings(history, filename, 'xml')
+
+
+@pytest.mark.skipif(not PYARROW_AVAILABLE, reason='requer pyarrow')
+@pytest.mark.parametrize('fmt', ['arrow', 'parquet'])
+def test_columnar_round_trip(history, tmp_path, fmt):
+    """Arrow/Parquet: mesmas colunas, timestamps tipados e vários RecordBatches"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from datetime import datetime
+
+    filename = str(tmp_path / f'export.{fmt}')
+    assert write_columnar(history.iter_bookings(), filename, fmt, batch_size=3) == 4
+
+    if fmt == 'parquet':
+        table = pq.read_table(filename)
+    else:
+        with pa.memory_map(filename) as source:
+            reader = pa.ipc.open_file(source)
+            assert reader.num_record_batches == 2
+            table = reader.read_all()
+
+    assert table.column_names == EXPORT_FIELDS
+    assert table.schema.field('id').type == pa.int64()
+    # O Parquet guarda timestamps em ms no mínimo; o valor é o mesmo
+    assert pa.types.is_timestamp(table.schema.field('booking_time').type)
+    rows = table.to_pylist()
+    assert [row['name'] for row in rows] == ['Ana', 'Bruno', 'Carla', 'Duarte']
+    assert rows[0]['return_time'] == datetime(2025, 3, 1, 12, 0)
+    assert rows[1]['return_time'] is None
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
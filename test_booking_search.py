@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste da pesquisa de reservas por contacto
+===========================================
+Índice FTS5 trigram (bookings_fts) e o LIKE usado em pesquisas com menos de
+3 caracteres ou quando o SQLite não tem FTS5.
+"""
+
+import sys
+
+import pytest
+
+USERS = [
+    {'name': 'Ana Silva', 'email': 'ana.silva@example.com', 'phone': '+351 912 345 678'},
+    {'name': 'João Costa', 'email': 'jcosta@example.org', 'phone': '913 000 111'},
+    {'name': 'Maria 50% Lopes', 'email': 'maria@example.net', 'phone': '+44 20 7946 0000'},
+]
+
+
+@pytest.fixture
+def bookings(db):
+    """Uma reserva por utilizador (cacifos 001-003)"""
+    for index, user in enumerate(USERS):
+        result = db.book_locker(f'00{index + 1}', user_data=user, pin='2468')
+        assert result.get('success')
+    return db
+
+
+def found(db, query):
+    return sorted(booking['name'] for booking in db.get_bookings_by_contact(query))
+
+
+@pytest.mark.parametrize('use_fts', [True, False])
+def test_search_by_any_contact_field(bookings, use_fts):
+    """Substrings de nome, email e telefone - com FTS e com LIKE dão o mesmo"""
+    db = bookings
+    if use_fts:
+        assert db.fts_enabled, "SQLite sem FTS5 trigram"
+    else:
+        db.fts_enabled = False
+
+    assert found(db, 'silva') == ['Ana Silva']
+    assert found(db, 'example.org') == ['João Costa']
+    assert found(db, 'Costa') == ['João Costa']
+    assert found(db, 'example') == ['Ana Silva', 'João Costa', 'Maria 50% Lopes']
+    assert found(db, 'nobody') == []
+
+
+def test_phone_search_ignores_spaces_and_country_prefix(bookings):
+    """O FTS procura também os dígitos normalizados do telefone"""
+    assert found(bookings, '912345678') == ['Ana Silva']
+    assert found(bookings, '+351912345678') == ['Ana Silva']
+    assert found(bookings, '913 000') == ['João Costa']
+
+
+def test_short_terms_use_like(bookings):
+    """Termos com menos de 3 caracteres não passam pelo FTS"""
+    db = bookings
+    assert db._fts_match_expression('an') is None
+    assert db._fts_match_expression('ana') is not None
+    assert found(db, 'Jo') == ['João Costa']
+    assert found(db, '50') == ['Maria 50% Lopes']
+
+
+def test_like_wildcards_are_literal(bookings):
+    """% e _ na pesquisa são caracteres normais"""
+    db = bookings
+    db.fts_enabled = False
+    assert found(db, '%') == ['Maria 50% Lopes']
+    assert found(db, '_') == []
+
+
+def test_index_follows_updates(bookings):
+    """Os triggers mantêm o índice quando o contacto muda"""
+    db = bookings
+    conn = db._get_connection()
+    try:
+        conn.execute("UPDATE bookings SET name = 'Ana Pereira' WHERE name = 'Ana Silva'")
+        conn.commit()
+    finally:
+        db._release_connection(conn)
+
+    assert found(db, 'Pereira') == ['Ana Pereira']
+    assert found(db, 'Ana Silva') == []
+
+
+def test_search_bookings_ranks_prefix_matches_first(bookings):
+    """search_bookings devolve primeiro quem começa pelo termo"""
+    db = bookings
+    result = db.search_bookings('costa')
+    assert result['total'] == 1
+    assert [booking['name'] for booking in result['results']] == ['João Costa']
+
+    result = db.search_bookings('ana')
+    assert result['results'][0]['name'] == 'Ana Silva'
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
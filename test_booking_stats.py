@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste das estatísticas de reservas (booking_stats)
+===================================================
+Os triggers mantêm os agregados a cada reserva, mudança de estado e
+devolução; o resultado tem de coincidir com o cálculo direto sobre bookings.
+"""
+
+import sys
+
+import pytest
+
+
+def execute(db, sql, params=()):
+    conn = db._get_connection()
+    try:
+        conn.execute(sql, params)
+        conn.commit()
+    finally:
+        db._release_connection(conn)
+
+
+def stats_from_bookings(db):
+    """Agregados calculados diretamente a partir de bookings (sem triggers)"""
+    conn = db._get_connection()
+    try:
+        status_counts = dict(conn.execute('SELECT status, COUNT(*) FROM bookings GROUP BY status'))
+        locker_counts = dict(conn.execute('SELECT locker_number, COUNT(*) FROM bookings GROUP BY locker_number'))
+        daily_counts = dict(conn.execute('''
+            SELECT DATE(booking_time), COUNT(*) FROM bookings
+            WHERE DATE(booking_time) >= date('now', '-7 days') GROUP BY 1
+        '''))
+        average = conn.execute('''
+            SELECT AVG((julianday(return_time) - julianday(booking_time)) * 24)
+            FROM bookings WHERE status = 'completed' AND return_time IS NOT NULL
+        ''').fetchone()[0]
+        total = conn.execute('SELECT COUNT(*) FROM bookings').fetchone()[0]
+    finally:
+        db._release_connection(conn)
+    return total, status_counts, locker_counts, daily_counts, round(average or 0, 2)
+
+
+def assert_stats_match(db):
+    stats = db.get_booking_statistics()
+    total, status_counts, locker_counts, daily_counts, average = stats_from_bookings(db)
+    assert stats['total_bookings'] == total
+    assert stats['status_counts'] == status_counts
+    assert stats['daily_counts'] == daily_counts
+    assert stats['average_duration_hours'] == pytest.approx(average, abs=0.01)
+    if locker_counts:
+        assert stats['most_used_locker']['count'] == max(locker_counts.values())
+    return stats
+
+
+def test_insert_counts_booking(db):
+    """Uma reserva soma ao total, ao estado, ao cacifo e ao dia"""
+    assert db.get_booking_statistics()['total_bookings'] == 0
+    assert db.book_locker('001', contact='stats1@example.com', pin='2468').get('success')
+
+    stats = assert_stats_match(db)
+    assert stats['total_bookings'] == 1
+    assert stats['status_counts'] == {'booked': 1}
+    assert stats['most_used_locker'] == {'locker': '001', 'count': 1}
+    assert sum(stats['daily_counts'].values()) == 1
+
+
+def test_status_change_moves_counts(db):
+    """Desbloquear muda a reserva de estado sem alterar o total"""
+    db.book_locker('001', contact='stats1@example.com', pin='2468')
+    db.book_locker('002', contact='stats2@example.com', pin='1357')
+    assert db.unlock_locker('stats1@example.com', '2468') == '001'
+
+    stats = assert_stats_match(db)
+    assert stats['total_bookings'] == 2
+    assert stats['status_counts'] == {'booked': 1, 'returned': 1}
+
+
+def test_return_adds_duration(db):
+    """Devolver uma reserva conta a duração no tempo médio de utilização"""
+    db.book_locker('003', contact='stats3@example.com', pin='2468')
+    execute(db, "UPDATE bookings SET booking_time = datetime('now', '-2 hours')")
+    db.return_locker('003')
+
+    stats = assert_stats_match(db)
+    assert stats['status_counts'] == {'completed': 1}
+    assert stats['average_duration_hours'] == pytest.approx(2.0, abs=0.01)
+
+
+def test_delete_and_move_keep_aggregates_consistent(db):
+    """Apagar reservas ou mudar o dia/cacifo retira-as dos agregados antigos"""
+    for locker, contact in (('001', 'a@example.com'), ('002', 'b@example.com'), ('003', 'c@example.com')):
+        db.book_locker(locker, contact=contact, pin='2468')
+    execute(db, "UPDATE bookings SET booking_time = datetime('now', '-3 days'), locker_number = '004' "
+                "WHERE contact = 'a@example.com'")
+    execute(db, "DELETE FROM bookings WHERE contact = 'b@example.com'")
+
+    stats = assert_stats_match(db)
+    assert stats['total_bookings'] == 2
+    assert len(stats['daily_counts']) == 2
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste dos envios em massa (bulk_notifications)
+===============================================
+Seleção das reservas ativas, resultado por destinatário, cancelamento
+(o que não saiu fica 'failed') e limite de ritmo - com um serviço simulado.
+"""
+
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from bulk_notifications import BulkNotifier, TokenBucket
+from notification_service import NotificationService
+
+
+class FakeService:
+    """Substitui o NotificationService nos envios em massa"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.smtp_pool = SimpleNamespace(max_size=1)
+        self.http = SimpleNamespace(pool_size=1)
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+        self.sent = []
+
+    format_phone = staticmethod(NotificationService.format_phone)
+
+    @contextmanager
+    def batch(self):
+        yield
+
+    def _send(self, recipient, text):
+        self.started.set()
+        self.release.wait(5)
+        self.sent.append((recipient, text))
+        return recipient not in self.failing
+
+    def send_email(self, recipient, subject, body):
+        return self._send(recipient, f'{subject}|{body}')
+
+    def send_sms(self, recipient, body):
+        return self._send(recipient, body)
+
+
+@pytest.fixture
+def active(db):
+    """Três reservas ativas; a do cacifo 001 tem 5 horas"""
+    for locker, name in (('001', 'Ana'), ('002', 'Bruno'), ('003', 'Carla')):
+        user = {'name': name, 'email': f'{name.lower()}@example.com', 'phone': f'91000000{locker[-1]}'}
+        assert db.book_locker(locker, user_data=user, pin='2468').get('success')
+    conn = db._get_connection()
+    try:
+        conn.execute("UPDATE bookings SET booking_time = datetime('now', '-5 hours') WHERE locker_number = '001'")
+        conn.execute("UPDATE active_bookings SET booking_time = datetime('now', '-5 hours') "
+                     "WHERE locker_number = '001'")
+        conn.commit()
+    finally:
+        db._release_connection(conn)
+    return db
+
+
+def wait_finished(notifier, bulk_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = notifier.get_status(bulk_id, include_results=True)
+        if status['completed_at']:
+            return status
+        time.sleep(0.05)
+    pytest.fail('envio em massa não terminou')
+
+
+def test_overstay_selects_old_bookings(active):
+    """notify_overstay só envia a quem tem reserva há mais de N horas"""
+    service = FakeService()
+    notifier = BulkNotifier(active, service=service, email_rate=100, sms_rate=100)
+    result = notifier.notify_overstay(2, 'Cacifo {locker}', 'Olá {customer}', 'SMS {locker}', wait=True)
+    assert result['success'] and result['total'] == 2
+
+    assert sorted(service.sent) == [('+351910000001', 'SMS 001'), ('ana@example.com', 'Cacifo 001|Olá Ana')]
+    status = notifier.get_status(result['bulk_id'])
+    assert status['status'] == 'completed'
+    assert status['counts'] == {'pending': 0, 'sent': 2, 'failed': 0}
+
+
+def test_failures_recorded_per_recipient(active):
+    """Cada destinatário tem o seu resultado; falhas ficam com o erro"""
+    service = FakeService(failing={'bruno@example.com'})
+    notifier = BulkNotifier(active, service=service, email_rate=100, sms_rate=100)
+    result = notifier.notify_all_active('Aviso', 'Fecho às 20h', 'Fecho', channels=('email',), wait=True)
+
+    status = notifier.get_status(result['bulk_id'], include_results=True)
+    assert status['counts'] == {'pending': 0, 'sent': 2, 'failed': 1}
+    failed = [r for r in status['results'] if r['status'] == 'failed']
+    assert [r['recipient'] for r in failed] == ['bruno@example.com']
+    assert failed[0]['error']
+
+
+def test_cancel_marks_unsent_failed(active):
+    """Cancelar a meio: o que já saiu fica 'sent', o resto 'failed' (não enviado)"""
+    service = FakeService()
+    service.release.clear()
+    notifier = BulkNotifier(active, service=service, email_rate=100, sms_rate=100)
+    result = notifier.notify_all_active('Aviso', 'Texto', 'SMS', channels=('email',))
+    assert service.started.wait(5)
+
+    assert notifier.cancel(result['bulk_id'])
+    service.release.set()
+    status = wait_finished(notifier, result['bulk_id'])
+
+    assert status['status'] == 'cancelled'
+    assert status['counts'] == {'pending': 0, 'sent': 1, 'failed': 2}
+    assert {r['error'] for r in status['results'] if r['status'] == 'failed'} == {'não enviado'}
+    assert not notifier.cancel(result['bulk_id'])
+
+
+def test_unknown_template_field_rejected(active):
+    """Campos fora de {customer}, {locker}, {booking_time} são recusados antes de registar"""
+    notifier = BulkNotifier(active, service=FakeService())
+    result = notifier.notify_all_active('Aviso', 'PIN {pin}', 'SMS', wait=True)
+    assert not result['success'] and 'pin' in result['error']
+    assert notifier.get_status(1) is None
+
+
+def test_token_bucket_limits_rate():
+    """Depois da rajada inicial, uma vaga a cada 1/rate segundos"""
+    bucket = TokenBucket(rate=20, burst=2)
+    start = time.monotonic()
+    for _ in range(4):
+        assert bucket.acquire()
+    assert time.monotonic() - start >= 0.09
+
+    cancelled = threading.Event()
+    cancelled.set()
+    empty = TokenBucket(rate=0.1, burst=1)
+    assert empty.acquire(cancelled)
+    assert not empty.acquire(cancelled)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste do feed de alterações (change_events)
+============================================
+Os triggers acrescentam um evento por escrita; os eventos antigos têm de
+ser apagados para a tabela não crescer sem limite.
+"""
+
+import sys
+import time
+
+import database
+
+
+def insert_event(db, age_hours):
+    """Evento de alteração com created_at no passado"""
+    conn = db._get_connection()
+    try:
+        conn.execute('''
+            INSERT INTO change_events (event, locker_number, status, created_at)
+            VALUES ('locker_status', '001', 'available', datetime('now', ?))
+        ''', (f'-{age_hours} hours',))
+        conn.commit()
+    finally:
+        db._release_connection(conn)
+
+
+def count_events(db):
+    conn = db._get_connection()
+    try:
+        return conn.execute('SELECT COUNT(*) FROM change_events').fetchone()[0]
+    finally:
+        db._release_connection(conn)
+
+
+def test_triggers_record_changes(db):
+    """Uma reserva gera eventos no feed"""
+    before = db.get_last_change_event_id()
+    result = db.book_locker('001', contact='feed@example.com', pin='4821')
+    assert result.get('success')
+    assert db.get_last_change_event_id() > before
+
+
+def test_prune_change_events(db):
+    """Eventos com mais de CHANGE_EVENTS_RETENTION_HOURS são apagados"""
+    db.prune_change_events(max_age_hours=0)
+    insert_event(db, database.CHANGE_EVENTS_RETENTION_HOURS + 2)
+    insert_event(db, database.CHANGE_EVENTS_RETENTION_HOURS + 48)
+    insert_event(db, 1)
+
+    assert db.prune_change_events() == 2
+    assert count_events(db) == 1
+
+
+def test_cleanup_old_logs_prunes_change_events(db):
+    """A limpeza diária do kiosk também apaga eventos antigos"""
+    db.prune_change_events(max_age_hours=0)
+    insert_event(db, database.CHANGE_EVENTS_RETENTION_HOURS + 2)
+    insert_event(db, 1)
+
+    db.cleanup_old_logs()
+    assert count_events(db) == 1
+
+
+def test_watcher_prunes_periodically(db, monkeypatch):
+    """O watcher do feed apaga eventos antigos a cada CHANGE_PRUNE_INTERVAL"""
+    insert_event(db, database.CHANGE_EVENTS_RETENTION_HOURS + 2)
+    monkeypatch.setattr(database, 'CHANGE_PRUNE_INTERVAL', 0)
+    received = []
+    db.add_change_listener(received.extend)
+    deadline = time.time() + 5
+    while count_events(db) and time.time() < deadline:
+        time.sleep(0.1)
+    assert count_events(db) == 0
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
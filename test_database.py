@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste da base de dados (LockerDatabase)
+========================================
+Reservas, desbloqueio, devolução, migrações do schema e paginação por cursor
+numa base de dados temporária.
+"""
+
+import sys
+import sqlite3
+import threading
+
+import pytest
+
+from database import SCHEMA_VERSION, SCHEMA_MIGRATIONS
+
+
+def create_legacy_database(path):
+    """Base de dados com o schema anterior ao versionamento (user_version = 0)"""
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE lockers (
+            locker_number TEXT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'available',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE bookings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            locker_number TEXT NOT NULL,
+            contact TEXT NOT NULL,
+            pin_hash TEXT NOT NULL,
+            pin_salt TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'active',
+            booking_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+            unlock_time DATETIME,
+            return_time DATETIME,
+            notes TEXT
+        );
+        CREATE TABLE system_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            locker_number TEXT,
+            action TEXT NOT NULL,
+            details TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            gpio_state TEXT
+        );
+        INSERT INTO lockers (locker_number, status) VALUES ('001', 'occupied');
+        INSERT INTO bookings (locker_number, contact, pin_hash, pin_salt, status)
+        VALUES ('001', 'legacy@example.com', 'hash', 'salt', 'active');
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def applied_migrations(db):
+    conn = sqlite3.connect(db.db_path)
+    try:
+        return [row[0] for row in conn.execute('SELECT version FROM schema_version ORDER BY version')]
+    finally:
+        conn.close()
+
+
+def insert_bookings(db, booking_times):
+    """Reservas já devolvidas com booking_time fixo (podem repetir-se)"""
+    conn = db._get_connection()
+    try:
+        conn.executemany('''
+            INSERT INTO bookings (locker_number, contact, pin_hash, pin_salt, status, booking_time)
+            VALUES ('003', ?, 'hash', 'salt', 'returned', ?)
+        ''', [(f'page{i}@example.com', booking_time) for i, booking_time in enumerate(booking_times)])
+        conn.commit()
+    finally:
+        db._release_connection(conn)
+
+
+def test_fresh_database_reaches_schema_version(db):
+    """Uma base de dados nova aplica todas as migrações por ordem"""
+    assert db.get_schema_version() == SCHEMA_VERSION
+    assert applied_migrations(db) == [version for version, _, _ in SCHEMA_MIGRATIONS]
+
+
+def test_migrations_not_reapplied_on_reopen(db, open_database):
+    """Reabrir a base de dados não volta a correr migrações"""
+    db.close()
+    conn = sqlite3.connect(db.db_path)
+    applied_at = conn.execute('SELECT version, applied_at FROM schema_version').fetchall()
+    conn.close()
+
+    reopened = open_database()
+    assert reopened.get_schema_version() == SCHEMA_VERSION
+    conn = sqlite3.connect(db.db_path)
+    assert conn.execute('SELECT version, applied_at FROM schema_version').fetchall() == applied_at
+    conn.close()
+
+
+def test_legacy_database_is_migrated(db_path, open_database):
+    """Uma base de dados antiga ganha as colunas novas e mantém as reservas"""
+    create_legacy_database(db_path)
+    db = open_database()
+    assert db.get_schema_version() == SCHEMA_VERSION
+
+    conn = sqlite3.connect(db.db_path)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(bookings)')}
+    conn.close()
+    assert {'name', 'email', 'phone', 'birth_date', 'pin_display'} <= columns
+
+    assert db.count_active_bookings() == 1
+    assert db.get_active_bookings_by_locker()['001']['contact'] == 'legacy@example.com'
+
+
+def test_booking_cursor_round_trip(db):
+    """Percorrer as páginas devolve todas as reservas, sem repetições nem falhas"""
+    # Vários booking_time iguais: o id desempata a ordem
+    insert_bookings(db, ['2025-01-01 10:00:00'] * 7 + ['2025-01-02 10:00:00'] * 6 +
+                    ['2025-01-03 10:00:00'] * 10)
+    expected = [booking['id'] for booking in db.get_bookings_page(limit=None)['bookings']]
+    assert len(expected) == 23
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = db.get_bookings_page(limit=5, cursor=cursor)
+        seen.extend(booking['id'] for booking in page['bookings'])
+        pages += 1
+        cursor = page['next_cursor']
+        if cursor is None:
+            break
+
+    assert seen == expected
+    assert pages == 5
+
+    # Reservas novas não deslocam as páginas seguintes de um cursor já emitido
+    first = db.get_bookings_page(limit=5)
+    insert_bookings(db, ['2025-01-04 10:00:00'] * 3)
+    second = db.get_bookings_page(limit=5, cursor=first['next_cursor'])
+    assert [booking['id'] for booking in second['bookings']] == expected[5:10]
+
+    with pytest.raises(ValueError):
+        db.get_bookings_page(limit=5, cursor='not-a-cursor')
+
+
+def test_unlock_with_pin(db):
+    """PIN certo liberta o cacifo; PIN errado ou KDF desconhecida não"""
+    assert db.book_locker('001', contact='unlock@example.com', pin='2468').get('success')
+    assert db.book_locker('002', contact='unknown-kdf@example.com', pin='1357').get('success')
+    conn = db._get_connection()
+    try:
+        conn.execute("UPDATE bookings SET pin_kdf = 'argon9' WHERE contact = 'unknown-kdf@example.com'")
+        conn.commit()
+    finally:
+        db._release_connection(conn)
+
+    assert db.unlock_locker('unlock@example.com', '0000') is None
+    assert db.unlock_locker('unknown-kdf@example.com', '1357') is None
+    assert db.unlock_locker('unlock@example.com', '2468') == '001'
+    assert db.count_active_bookings() == 1
+
+
+def test_concurrent_booking_from_two_processes(db, open_database):
+    """Duas instâncias (como a API e o kiosk) não reservam o mesmo cacifo"""
+    other = open_database()
+    barrier = threading.Barrier(8)
+    results = []
+
+    def book(database, index):
+        barrier.wait()
+        results.append(database.book_locker('002', contact=f'user{index}@example.com', pin='1357'))
+
+    threads = [threading.Thread(target=book, args=(db if i % 2 else other, i)) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(1 for result in results if result.get('success')) == 1
+    assert db.count_active_bookings() == 1
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste dos eventos das portas (DoorEventMonitor, LockerStateReconciler)
+=======================================================================
+Deteção de flancos com debounce e reconciliação com a base de dados, sem
+hardware: o GPIO é simulado.
+"""
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from door_events import DoorEventMonitor, LockerStateReconciler
+
+LOCKER_PINS = {
+    '001': {'output': 17, 'input': 23},
+    '002': {'output': 18, 'input': 24},
+}
+DEBOUNCE = 0.05
+
+
+class FakeGPIO:
+    """GPIO simulado: set_input altera o pin e dispara o callback de flanco"""
+    HIGH = 1
+    LOW = 0
+    BOTH = 33
+
+    def __init__(self):
+        self.levels = {}
+        self.callbacks = {}
+
+    def input(self, pin):
+        return self.levels.get(pin, self.LOW)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        self.callbacks[pin] = callback
+
+    def remove_event_detect(self, pin):
+        self.callbacks.pop(pin, None)
+
+    def set_input(self, pin, level):
+        self.levels[pin] = level
+        callback = self.callbacks.get(pin)
+        if callback:
+            callback(pin)
+
+
+def wait_settle():
+    time.sleep(DEBOUNCE * 4)
+
+
+def create_monitor():
+    gpio = FakeGPIO()
+    monitor = DoorEventMonitor(gpio, LOCKER_PINS, debounce=DEBOUNCE)
+    monitor.start()
+    return gpio, monitor
+
+
+def test_bounces_collapse_into_one_event():
+    """Ressaltos do contacto publicam uma única transição"""
+    gpio, monitor = create_monitor()
+    events = []
+    monitor.subscribe(lambda locker, is_open: events.append((locker, is_open)))
+    try:
+        for level in (1, 0, 1, 0, 1):
+            gpio.set_input(23, level)
+        wait_settle()
+        assert events == [('001', True)]
+        assert monitor.is_open('001')
+
+        # Ressalto que volta ao estado anterior não gera evento
+        gpio.set_input(23, 0)
+        gpio.set_input(23, 1)
+        wait_settle()
+        assert events == [('001', True)]
+
+        gpio.set_input(23, 0)
+        wait_settle()
+        assert events == [('001', True), ('001', False)]
+        assert not monitor.is_open('001')
+    finally:
+        monitor.stop()
+
+
+def test_subscription_per_locker_and_unsubscribe():
+    """subscribe(locker_number=...) filtra o cacifo; unsubscribe deixa de notificar"""
+    gpio, monitor = create_monitor()
+    only_002 = []
+    callback = lambda locker, is_open: only_002.append((locker, is_open))
+    monitor.subscribe(callback, locker_number='002')
+    try:
+        gpio.set_input(23, 1)
+        gpio.set_input(24, 1)
+        wait_settle()
+        assert only_002 == [('002', True)]
+
+        monitor.unsubscribe(callback)
+        gpio.set_input(24, 0)
+        wait_settle()
+        assert only_002 == [('002', True)]
+    finally:
+        monitor.stop()
+
+
+def test_initial_state_and_stop():
+    """start lê o estado inicial; stop remove a deteção e cancela o debounce pendente"""
+    gpio = FakeGPIO()
+    gpio.levels[24] = FakeGPIO.HIGH
+    monitor = DoorEventMonitor(gpio, LOCKER_PINS, debounce=DEBOUNCE)
+    monitor.start()
+    events = []
+    monitor.subscribe(lambda locker, is_open: events.append((locker, is_open)))
+
+    assert monitor.is_open('002') and not monitor.is_open('001')
+    assert set(gpio.callbacks) == {23, 24}
+
+    gpio.set_input(23, 1)
+    monitor.stop()
+    wait_settle()
+    assert gpio.callbacks == {}
+    assert events == []
+
+
+class FakeController:
+    """O que o reconciliador usa do GPIOController: pins, leitura e base de dados"""
+
+    def __init__(self, gpio, db):
+        self.gpio = gpio
+        self.db = db
+        self.locker_pins = LOCKER_PINS
+        self.log_batches = []
+        log_actions = db.log_actions
+        def record(entries):
+            self.log_batches.append(list(entries))
+            return log_actions(entries)
+        db.log_actions = record
+
+    def is_locker_occupied(self, locker_number):
+        return self.gpio.input(self.locker_pins[locker_number]['input']) == self.gpio.HIGH
+
+
+def sync_logs(db):
+    conn = db._get_connection()
+    try:
+        return conn.execute("SELECT locker_number, details, gpio_state FROM system_logs "
+                            "WHERE action = 'GPIO_SYNC' ORDER BY id").fetchall()
+    finally:
+        db._release_connection(conn)
+
+
+def test_reconcile_logs_each_mismatch_once(db):
+    """Porta aberta num cacifo 'available': um registo quando começa, em lote"""
+    gpio = FakeGPIO()
+    controller = FakeController(gpio, db)
+    reconciler = LockerStateReconciler(gpio, controller)
+    assert reconciler.reconcile() == []
+
+    gpio.levels[23] = gpio.levels[24] = FakeGPIO.HIGH
+    assert [entry[0] for entry in reconciler.reconcile()] == ['001', '002']
+    assert reconciler.reconcile() == []  # divergência contínua não repete o registo
+    assert len(controller.log_batches) == 1
+    assert sync_logs(db) == [
+        ('001', 'Physical state: occupied, DB state: available', 'Pin 23: 1'),
+        ('002', 'Physical state: occupied, DB state: available', 'Pin 24: 1'),
+    ]
+
+    # Fechou e voltou a abrir: nova divergência
+    gpio.levels[23] = FakeGPIO.LOW
+    reconciler.reconcile()
+    gpio.levels[23] = FakeGPIO.HIGH
+    assert [entry[0] for entry in reconciler.reconcile()] == ['001']
+    assert len(sync_logs(db)) == 3
+
+
+def test_occupied_locker_is_not_a_mismatch(db):
+    """Porta aberta num cacifo reservado é o estado esperado"""
+    assert db.book_locker('001', contact='ana@example.com', pin='2468').get('success')
+    gpio = FakeGPIO()
+    gpio.levels[23] = FakeGPIO.HIGH
+    reconciler = LockerStateReconciler(gpio, FakeController(gpio, db))
+    assert reconciler.reconcile() == []
+    assert sync_logs(db) == []
+
+
+def test_door_event_wakes_reconciler(db):
+    """A thread corre no arranque e logo depois de um evento de porta"""
+    gpio, monitor = create_monitor()
+    reconciler = LockerStateReconciler(gpio, FakeController(gpio, db), interval=60, min_interval=0)
+    reconciler.start(monitor)
+    try:
+        gpio.set_input(24, FakeGPIO.HIGH)
+        deadline = time.time() + 2
+        while not sync_logs(db) and time.time() < deadline:
+            time.sleep(0.02)
+        assert [row[0] for row in sync_logs(db)] == ['002']
+    finally:
+        reconciler.stop(monitor)
+        monitor.stop()
+    assert monitor._subscribers == []
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste da sessão HTTP dos fornecedores de SMS (http_session)
+============================================================
+Repetição automática só quando é seguro (429/503, falha de ligação),
+timeouts de leitura sem repetição e reutilização da ligação keep-alive -
+contra um servidor HTTP local.
+"""
+
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from http_session import HTTPSessionPool
+
+
+class ProviderHandler(BaseHTTPRequestHandler):
+    """Responde com os status programados em server.statuses (200 no fim)"""
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            server.ports.add(self.client_address[1])
+            status = server.statuses.pop(0) if server.statuses else 200
+        if server.delay:
+            time.sleep(server.delay)
+        body = b'{"success": true}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def provider():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ProviderHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.ports = set()
+    server.statuses = []
+    server.delay = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/text'
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_pool(**kwargs):
+    kwargs.setdefault('backoff_factor', 0)
+    return HTTPSessionPool(connect_timeout=1, read_timeout=1, **kwargs)
+
+
+def test_connection_reused(provider):
+    """Vários POST pela mesma ligação keep-alive"""
+    pool = make_pool()
+    try:
+        for _ in range(3):
+            assert pool.post(provider.url, data={'phone': '910000001'}).status_code == 200
+    finally:
+        pool.close()
+    assert provider.requests == 3
+    assert len(provider.ports) == 1
+
+
+def test_retries_on_unavailable(provider):
+    """429/503: o fornecedor não processou o pedido, repetir é seguro"""
+    provider.statuses = [503, 429]
+    pool = make_pool(max_retries=2)
+    try:
+        assert pool.post(provider.url, data={}).status_code == 200
+    finally:
+        pool.close()
+    assert provider.requests == 3
+
+
+def test_gives_up_after_max_retries(provider):
+    """Esgotadas as tentativas devolve a última resposta (sem exceção)"""
+    provider.statuses = [503, 503, 503, 503]
+    pool = make_pool(max_retries=1)
+    try:
+        assert pool.post(provider.url, data={}).status_code == 503
+    finally:
+        pool.close()
+    assert provider.requests == 2
+
+
+def test_server_error_not_retried(provider):
+    """500: o SMS pode ter sido enviado - não repetir"""
+    provider.statuses = [500]
+    pool = make_pool()
+    try:
+        assert pool.post(provider.url, data={}).status_code == 500
+    finally:
+        pool.close()
+    assert provider.requests == 1
+
+
+def test_read_timeout_not_retried(provider):
+    """Timeout de leitura levanta logo, sem segundo POST
+
+    Com read=0 o urllib3 devolve-o como MaxRetryError, que o requests
+    apresenta como ConnectionError - por isso só se verifica RequestException.
+    """
+    provider.delay = 0.5
+    pool = make_pool()
+    pool.configure(read_timeout=0.1)
+    try:
+        with pytest.raises(requests.exceptions.RequestException, match='Read timed out'):
+            pool.post(provider.url, data={})
+    finally:
+        pool.close()
+    assert provider.requests == 1
+
+
+def test_connect_failure_raises():
+    """Sem servidor: ConnectionError depois das tentativas de ligação"""
+    pool = make_pool(max_retries=1)
+    try:
+        with pytest.raises(requests.exceptions.ConnectionError):
+            pool.post('http://127.0.0.1:9/text', data={})
+    finally:
+        pool.close()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste das métricas de notificações (notification_metrics)
+==========================================================
+Histograma de latência e percentis, contadores por fornecedor, envios
+sem credenciais e o snapshot gravado na base de dados para /api/metrics.
+"""
+
+import sys
+
+import pytest
+
+from api_shared import notification_metrics
+from notification_metrics import LatencyHistogram, NotificationMetrics
+from notification_service import NotificationService
+
+
+def test_histogram_buckets_and_percentiles():
+    """Cada latência cai no primeiro intervalo que a contém; percentis interpolados"""
+    histogram = LatencyHistogram(buckets=(10, 100))
+    assert histogram.percentile(50) is None
+    for latency in (5, 5, 50, 50, 50, 50, 50, 50, 50, 400):
+        histogram.observe(latency)
+
+    snapshot = histogram.snapshot()
+    assert snapshot['buckets'] == {'10': 2, '100': 7, '+Inf': 1}
+    assert (snapshot['count'], snapshot['avg'], snapshot['max']) == (10, 76.0, 400.0)
+    assert snapshot['p50'] == pytest.approx(10 + 90 * 3 / 7, abs=0.1)
+    assert snapshot['p95'] == 250.0  # entre 100 e o máximo observado
+    assert snapshot['p99'] <= snapshot['max']
+
+
+def provider_timeout(phone):
+    raise RuntimeError('timeout')
+
+
+def test_timed_records_result_and_exceptions():
+    """timed conta sucesso, False e exceções (como falha) e mede a latência"""
+    metrics = NotificationMetrics()
+    assert metrics.timed('twilio', lambda phone: True, '+351910000001')
+    assert not metrics.timed('twilio', lambda phone: None, '+351910000001')
+    with pytest.raises(RuntimeError):
+        metrics.timed('twilio', provider_timeout, '+351910000001')
+
+    twilio = metrics.snapshot()['providers']['twilio']
+    assert (twilio['sent'], twilio['failed'], twilio['success_rate']) == (1, 2, 0.333)
+    assert twilio['latency_ms']['count'] == 3
+    assert metrics.version == 3
+
+
+def test_not_configured_and_retries():
+    """Envios sem credenciais não entram na latência nem na taxa de sucesso"""
+    metrics = NotificationMetrics()
+    metrics.record_not_configured('smtp')
+    metrics.record_retry('sms')
+    metrics.record_retry('sms')
+
+    snapshot = metrics.snapshot()
+    smtp = snapshot['providers']['smtp']
+    assert (smtp['not_configured'], smtp['success_rate'], smtp['latency_ms']['count']) == (1, None, 0)
+    assert snapshot['retries'] == {'sms': 2}
+
+
+def test_service_counts_unconfigured_email():
+    """NotificationService sem credenciais: email recusado e contado como not_configured"""
+    service = NotificationService()
+    try:
+        assert not service.send_email('ana@example.com', 'PIN', '1234')
+        metrics = service.get_metrics()
+    finally:
+        service.close_idle_connections()
+    assert metrics['providers']['smtp']['not_configured'] == 1
+    assert metrics['smtp_pool']['sent'] == 0
+
+
+def test_snapshot_round_trip(db):
+    """O snapshot gravado pelo kiosk é o que a API devolve (outro processo)"""
+    assert notification_metrics(db)['notifications'] is None
+
+    metrics = NotificationMetrics()
+    metrics.record('smtp', True, 0.02)
+    assert db.save_metrics_snapshot('notifications', metrics.snapshot())
+    metrics.record('smtp', False, 0.5)
+    assert db.save_metrics_snapshot('notifications', metrics.snapshot())
+
+    data = notification_metrics(db)
+    smtp = data['notifications']['providers']['smtp']
+    assert (smtp['sent'], smtp['failed']) == (1, 1)
+    assert smtp['latency_ms']['buckets']['25'] == 1
+    assert 'queue' in data
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
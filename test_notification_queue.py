@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste da fila de notificações (notification_outbox)
+====================================================
+Estados pending -> sending -> sent/failed, retry com backoff e o número
+de mensagens reclamadas pelo dispatcher.
+"""
+
+import sys
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from notification_metrics import NotificationMetrics
+from notification_service import NotificationService
+from notification_queue import NotificationDispatcher, retry_delay, RETRY_BASE_DELAY, RETRY_MAX_DELAY
+
+
+def outbox_row(db, notification_id):
+    conn = sqlite3.connect(db.db_path)
+    try:
+        return conn.execute('''
+            SELECT status, attempts, body, last_error, next_attempt_at > CURRENT_TIMESTAMP
+            FROM notification_outbox WHERE id = ?
+        ''', (notification_id,)).fetchone()
+    finally:
+        conn.close()
+
+
+def sms(recipient, body='PIN 1234'):
+    return {'channel': 'sms', 'recipient': recipient, 'subject': '', 'body': body}
+
+
+def email(recipient, body='PIN 1234'):
+    return {'channel': 'email', 'recipient': recipient, 'subject': 'PIN', 'body': body}
+
+
+class FakeService:
+    """Substitui o NotificationService: regista os envios e pode bloqueá-los"""
+
+    def __init__(self, succeed=True):
+        self.succeed = succeed
+        self.metrics = NotificationMetrics()
+        self.release = threading.Event()
+        self.release.set()
+        self.delivered = []
+
+    @contextmanager
+    def batch(self):
+        yield
+
+    def deliver(self, message):
+        self.release.wait(5)
+        self.delivered.append(message['recipient'])
+        return self.succeed
+
+    def is_configured(self, channel):
+        return True
+
+    def close_idle_connections(self):
+        pass
+
+    def get_metrics(self):
+        return self.metrics.snapshot()
+
+
+def test_outbox_state_machine(db):
+    """pending -> sending -> sent (corpo apagado) / pending com backoff / failed"""
+    sent_id, retry_id, failed_id = db.enqueue_notifications([sms('+351910000001'), sms('+351910000002'),
+                                                             sms('+351910000003')])
+    assert outbox_row(db, sent_id)[0] == 'pending'
+
+    claimed = db.claim_due_notifications(limit=10)
+    assert [message['id'] for message in claimed] == [sent_id, retry_id, failed_id]
+    assert all(message['attempts'] == 1 for message in claimed)
+    assert outbox_row(db, sent_id)[:2] == ('sending', 1)
+    assert db.claim_due_notifications(limit=10) == []
+
+    db.complete_notification(sent_id, True)
+    db.complete_notification(retry_id, False, 'timeout', retry_in=60)
+    db.complete_notification(failed_id, False, 'rejected')
+
+    status, attempts, body, error, in_future = outbox_row(db, sent_id)
+    assert (status, body) == ('sent', '')
+    status, attempts, body, error, in_future = outbox_row(db, retry_id)
+    assert (status, error, in_future) == ('pending', 'timeout', 1)
+    status, attempts, body, error, in_future = outbox_row(db, failed_id)
+    assert (status, error, body) == ('failed', 'rejected', '')
+
+    # A mensagem em retry só volta a ser reclamada quando vencer
+    assert db.claim_due_notifications(limit=10) == []
+
+
+def test_claim_by_channel_and_requeue(db):
+    """claim_due_notifications filtra por canal; requeue devolve 'sending' a 'pending'"""
+    db.enqueue_notifications([email('a@example.com'), sms('+351910000001'), email('b@example.com')])
+
+    claimed = db.claim_due_notifications(limit=10, channel='email')
+    assert [message['recipient'] for message in claimed] == ['a@example.com', 'b@example.com']
+    assert db.get_notification_queue_depth()['sending'] == 2
+
+    assert db.requeue_stale_notifications() == 2
+    depth = db.get_notification_queue_depth()
+    assert (depth['pending'], depth['sending']) == (3, 0)
+
+
+def test_retry_delay_backoff():
+    """Backoff exponencial com jitter entre metade e o valor total, até ao máximo"""
+    for attempt in range(1, 12):
+        delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** (attempt - 1))
+        for _ in range(20):
+            assert delay / 2 <= retry_delay(attempt) <= delay
+
+
+def test_dispatcher_claims_only_what_free_workers_can_send(db):
+    """Com um worker livre só uma SMS fica 'sending' de cada vez"""
+    service = FakeService()
+    service.release.clear()
+    dispatcher = NotificationDispatcher(db, service=service, workers=1, poll_interval=0.1)
+    dispatcher.start()
+    try:
+        dispatcher.enqueue([sms(f'+3519100000{i:02d}') for i in range(10)])
+        time.sleep(0.5)
+        assert db.get_notification_queue_depth()['sending'] == 1
+
+        service.release.set()
+        deadline = time.time() + 10
+        while len(service.delivered) < 10 and time.time() < deadline:
+            time.sleep(0.05)
+        assert len(service.delivered) == 10
+    finally:
+        dispatcher.stop()
+    
+
+def test_dispatcher_reports_first_attempt(db):
+    """O callback recebe o resultado da primeira tentativa de cada canal"""
+    dispatcher = NotificationDispatcher(db, service=FakeService(succeed=False), workers=2, poll_interval=0.1)
+    dispatcher.start()
+    results = []
+    done = threading.Event()
+    try:
+        dispatcher.enqueue([email('a@example.com'), sms('+351910000001')],
+                           callback=lambda result: (results.append(result), done.set()))
+        assert done.wait(5)
+        assert results[0]['email'] is False and results[0]['sms'] is False
+        assert sorted(results[0]['retrying']) == ['email', 'sms']
+        assert db.get_notification_queue_depth()['pending'] == 2
+    finally:
+        dispatcher.stop()
+    
+
+def test_enqueue_writes_outside_dispatcher_lock(db, monkeypatch):
+    """A escrita na fila não bloqueia os workers nem o dispatcher"""
+    dispatcher = NotificationDispatcher(db, service=FakeService(), workers=1, poll_interval=0.1)
+    lock_held = []
+    enqueue_notifications = db.enqueue_notifications
+
+    def checking_enqueue(messages):
+        lock_held.append(dispatcher._lock.locked())
+        return enqueue_notifications(messages)
+
+    monkeypatch.setattr(db, 'enqueue_notifications', checking_enqueue)
+    dispatcher.start()
+    done = threading.Event()
+    try:
+        dispatcher.enqueue([sms('+351910000001')], callback=lambda result: done.set())
+        assert done.wait(5)
+        assert lock_held == [False]
+    finally:
+        dispatcher.stop()
+
+
+def test_sms_configuration_must_be_explicit():
+    """A chave TextBelt padrão não conta; Twilio precisa também do from_number"""
+    service = NotificationService()
+    assert not service.is_configured('sms')
+
+    service.configure_sms_twilio('AC123', 'token', '')
+    assert not service.is_configured('sms')
+    service.configure_sms_twilio('AC123', 'token', '+15550001111')
+    assert service.is_configured('sms')
+
+    service = NotificationService()
+    service.configure_sms_textbelt('textbelt')
+    assert service.is_configured('sms')
+
+
+def test_unconfigured_sms_is_not_retried(db):
+    """Sem fornecedor de SMS a mensagem falha logo, sem backoff até max_attempts"""
+    dispatcher = NotificationDispatcher(db, service=NotificationService(), workers=1, poll_interval=0.1)
+    dispatcher.start()
+    results = []
+    done = threading.Event()
+    try:
+        dispatcher.enqueue([sms('+351910000001')],
+                           callback=lambda result: (results.append(result), done.set()))
+        assert done.wait(5)
+        assert results[0]['sms'] is False and results[0]['retrying'] == []
+        assert outbox_row(db, 1)[:2] == ('failed', 1)
+    finally:
+        dispatcher.stop()
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste dos templates de notificação (notification_templates)
+============================================================
+Ficheiro de templates, compilação, fallback para inglês em chaves ou
+idiomas em falta e templates inválidos.
+"""
+
+import sys
+import json
+from datetime import datetime
+
+import pytest
+
+from notification_templates import (CompiledTemplate, NotificationTemplates, TEMPLATE_KEYS,
+                                    load_notification_templates)
+
+ENGLISH = {
+    'date_format': '%Y-%m-%d %H:%M',
+    'customer': 'Customer',
+    'not_available': 'N/A',
+    'email_subject': 'Locker {locker}',
+    'email_body': ['Hello {customer},', 'PIN: {pin}', 'Phone: {phone}'],
+    'sms_body': 'Locker {locker} PIN {pin} at {timestamp}',
+}
+
+USER = {'name': 'Ana', 'email': 'ana@example.com', 'phone': ''}
+WHEN = datetime(2025, 3, 1, 9, 30)
+
+
+@pytest.fixture
+def templates_file(tmp_path):
+    path = tmp_path / 'notification_templates.json'
+    path.write_text(json.dumps({
+        'en': ENGLISH,
+        # Só o assunto e o SMS: o resto vem do inglês
+        'pt': {'customer': 'Cliente', 'email_subject': 'Cacifo {locker}', 'sms_body': 'Cacifo {locker} PIN {pin}'},
+        'xx': {'sms_body': 'PIN {pin!r}'},
+    }), encoding='utf-8')
+    return str(path)
+
+
+def test_lists_become_lines(templates_file):
+    """Corpos em lista de linhas são juntos com \\n"""
+    texts = load_notification_templates(templates_file)
+    assert texts['en']['email_body'] == 'Hello {customer},\nPIN: {pin}\nPhone: {phone}'
+
+
+def test_render_and_missing_values(templates_file):
+    """Campos preenchidos; dados em falta usam not_available"""
+    templates = NotificationTemplates(templates_file)
+    texts = templates.render_pin(USER, '003', '2468', language='en', when=WHEN)
+    assert texts == {
+        'email_subject': 'Locker 003',
+        'email_body': 'Hello Ana,\nPIN: 2468\nPhone: N/A',
+        'sms_body': 'Locker 003 PIN 2468 at 2025-03-01 09:30',
+    }
+
+
+def test_missing_keys_fall_back_to_english(templates_file):
+    """Chaves que o idioma não define vêm do inglês"""
+    templates = NotificationTemplates(templates_file)
+    texts = templates.render_pin({'name': ''}, '001', '1357', language='pt', when=WHEN)
+    assert texts['email_subject'] == 'Cacifo 001'
+    assert texts['sms_body'] == 'Cacifo 001 PIN 1357'
+    assert texts['email_body'] == 'Hello Cliente,\nPIN: 1357\nPhone: N/A'
+
+
+def test_unknown_or_invalid_language_uses_default(templates_file):
+    """Idioma desconhecido ou com template inválido: usa o inglês"""
+    templates = NotificationTemplates(templates_file)
+    assert sorted(templates._compiled) == ['en', 'pt']
+    for language in ('xx', 'ja'):
+        assert templates.render_pin(USER, '002', '1111', language=language, when=WHEN)['email_subject'] == 'Locker 002'
+
+
+def test_missing_file_then_reload(tmp_path):
+    """Ficheiro em falta não rebenta no arranque; reload com dados recupera"""
+    templates = NotificationTemplates(str(tmp_path / 'missing.json'))
+    assert templates._compiled == {}
+    assert templates.reload({'en': dict(ENGLISH, email_body='PIN {pin}')}) == ['en']
+    assert templates.render_pin(USER, '001', '9999', language='pt', when=WHEN)['email_body'] == 'PIN 9999'
+
+
+def test_compiled_template():
+    """Partes fixas guardadas; campos com formato ou conversão são recusados"""
+    template = CompiledTemplate('{a}-{b} {a}!')
+    assert template.render({'a': 1, 'b': 'x'}) == '1-x 1!'
+    assert CompiledTemplate('no fields').render({}) == 'no fields'
+    with pytest.raises(ValueError):
+        CompiledTemplate('{pin:>6}')
+    with pytest.raises(ValueError):
+        CompiledTemplate('{}')
+
+
+def test_shipped_templates_complete():
+    """O ficheiro distribuído tem todas as chaves em inglês e compila em todos os idiomas"""
+    texts = load_notification_templates()
+    assert set(texts['en']) >= set(TEMPLATE_KEYS) | {'date_format', 'customer', 'not_available'}
+    templates = NotificationTemplates()
+    assert sorted(templates._compiled) == sorted(texts)
+    for language in texts:
+        rendered = templates.render_pin(USER, '004', '8642', language=language, when=WHEN)
+        assert all('8642' in rendered[key] for key in ('email_body', 'sms_body'))
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
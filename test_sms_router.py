@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste do encaminhamento de SMS (sms_router)
+============================================
+Circuit breaker (closed -> open -> half_open -> closed), fallback entre
+fornecedores e modo hedged - com fornecedores simulados.
+"""
+
+import sys
+import threading
+import time
+
+import pytest
+
+from sms_router import CircuitBreaker, SMSProvider, SMSRouter
+
+
+class FakeProvider:
+    """Função send de um fornecedor: resultados programados e envios registados"""
+
+    def __init__(self, results=None, delay=0.0):
+        self.results = list(results or [])
+        self.delay = delay
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, phone, body):
+        with self._lock:
+            self.calls.append(phone)
+            result = self.results.pop(0) if self.results else True
+        if self.delay:
+            time.sleep(self.delay)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def make_router(primary, secondary, hedged=False, **breaker):
+    return SMSRouter([
+        SMSProvider('primary', primary, breaker=CircuitBreaker(**breaker)),
+        SMSProvider('secondary', secondary, breaker=CircuitBreaker(**breaker)),
+    ], hedged=hedged, hedge_delay=0.05)
+
+
+def test_breaker_opens_and_recovers():
+    """Abre após failure_threshold falhas; depois do reset_timeout passa um só teste"""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    assert breaker.allow_request()
+    assert not breaker.record_failure()
+    assert breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    assert breaker.state == 'half_open'
+    assert not breaker.allow_request()  # só um pedido de teste de cada vez
+
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.failures == 0
+    assert breaker.allow_request()
+
+
+def test_half_open_failure_reopens():
+    """Uma falha no pedido de teste volta a abrir o circuito"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    assert breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow_request()
+
+
+def test_fallback_to_secondary():
+    """Falha ou exceção no principal: o secundário envia a mesma mensagem"""
+    for result in (False, RuntimeError('timeout')):
+        primary = FakeProvider([result])
+        secondary = FakeProvider()
+        router = make_router(primary, secondary)
+
+        assert router.send('+351910000001', 'PIN')
+        assert primary.calls == secondary.calls == ['+351910000001']
+        assert router.stats()['primary']['failures'] == 1
+
+
+def test_open_circuit_skips_provider():
+    """Com o circuito aberto o fornecedor não é chamado até ao reset_timeout"""
+    send = FakeProvider([False] * 3)
+    router = SMSRouter([SMSProvider('twilio', send, breaker=CircuitBreaker(failure_threshold=3,
+                                                                           reset_timeout=60))])
+    for _ in range(5):
+        assert not router.send('+351910000001', 'PIN')
+    assert len(send.calls) == 3
+    assert router.stats()['twilio']['state'] == 'open'
+
+
+def test_all_providers_fail():
+    """Nenhum fornecedor aceitou: False"""
+    router = make_router(FakeProvider([False]), FakeProvider([False]))
+    assert not router.send('+351910000001', 'PIN')
+
+
+def test_unconfigured_providers_are_skipped():
+    """Fornecedores sem credenciais não entram no ranking"""
+    send = FakeProvider()
+    router = SMSRouter([SMSProvider('twilio', send, is_configured=lambda: False)])
+    assert router.ranked_providers() == []
+    assert not router.send('+351910000001', 'PIN')
+    assert send.calls == []
+
+
+def test_unhealthy_provider_is_demoted():
+    """Uma falha baixa o health score e o outro fornecedor passa a principal"""
+    primary = FakeProvider([False])
+    secondary = FakeProvider()
+    router = make_router(primary, secondary, failure_threshold=10)
+    assert [p.name for p in router.ranked_providers()] == ['primary', 'secondary']
+
+    router.send('+351910000001', 'PIN')
+    assert [p.name for p in router.ranked_providers()] == ['secondary', 'primary']
+    router.send('+351910000002', 'PIN')
+    assert primary.calls == ['+351910000001']
+    assert secondary.calls == ['+351910000001', '+351910000002']
+
+
+def test_hedged_launches_secondary_when_primary_is_slow():
+    """Modo hedged: o principal lento não atrasa o SMS além do hedge_delay"""
+    primary = FakeProvider(delay=1.0)
+    secondary = FakeProvider()
+    router = make_router(primary, secondary, hedged=True)
+    try:
+        start = time.monotonic()
+        assert router.send('+351910000001', 'PIN')
+        assert time.monotonic() - start < 0.5
+        assert len(secondary.calls) == 1
+    finally:
+        router.shutdown()
+
+
+def test_hedged_failure_launches_secondary_immediately():
+    """Modo hedged: se o principal falhar, o secundário é lançado logo"""
+    router = make_router(FakeProvider([False]), FakeProvider(), hedged=True)
+    try:
+        assert router.send('+351910000001', 'PIN')
+    finally:
+        router.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Teste do pool de sessões SMTP (smtp_pool)
+==========================================
+Reutilização de sessões, reconexão única quando a ligação cai e recusas do
+servidor que não estragam a sessão - com um servidor SMTP simulado.
+"""
+
+import sys
+import smtplib
+
+import pytest
+
+import smtp_pool
+from smtp_pool import SMTPSessionPool
+
+
+class FakeSMTP:
+    """Substitui smtplib.SMTP: cada sendmail consome a próxima falha programada"""
+    instances = []
+    send_failures = []
+    login_error = None
+
+    def __init__(self, server, port, timeout=None):
+        self.sent = []
+        self.closed = False
+        FakeSMTP.instances.append(self)
+
+    def starttls(self, context=None):
+        pass
+
+    def login(self, username, password):
+        if FakeSMTP.login_error:
+            raise FakeSMTP.login_error
+
+    def sendmail(self, from_addr, to_addrs, text):
+        if FakeSMTP.send_failures:
+            error = FakeSMTP.send_failures.pop(0)
+            if error:
+                raise error
+        self.sent.append(to_addrs)
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    FakeSMTP.instances = []
+    FakeSMTP.send_failures = []
+    FakeSMTP.login_error = None
+    monkeypatch.setattr(smtp_pool.smtplib, 'SMTP', FakeSMTP)
+    pool = SMTPSessionPool(max_size=1, timeout=1)
+    pool.configure('smtp.example.com', 587, 'user', 'secret')
+    yield pool
+    pool.close_all()
+
+
+def send(pool, to='a@example.com'):
+    pool.send('kiosk@example.com', [to], 'Subject: PIN\n\n1234')
+
+
+def test_session_reused_between_messages(pool):
+    """Várias mensagens, uma única ligação (sem STARTTLS + login por mensagem)"""
+    for _ in range(3):
+        send(pool)
+    stats = pool.stats()
+    assert (stats['connects'], stats['sent'], stats['idle']) == (1, 3, 1)
+    assert len(FakeSMTP.instances[0].sent) == 3
+
+
+def test_reconnects_once_when_connection_drops(pool):
+    """Ligação fechada pelo servidor: reconecta e repete o envio uma vez"""
+    send(pool)
+    FakeSMTP.send_failures = [smtplib.SMTPServerDisconnected('closed')]
+    send(pool, 'b@example.com')
+
+    stats = pool.stats()
+    assert (stats['connects'], stats['reconnects'], stats['sent']) == (2, 1, 2)
+    old, new = FakeSMTP.instances
+    assert old.closed and not new.closed
+    assert new.sent == [['b@example.com']]
+
+
+def test_second_failure_raises_and_discards_session(pool):
+    """Se a repetição também falhar, o erro sobe e a sessão não volta ao pool"""
+    FakeSMTP.send_failures = [ConnectionResetError('reset'), ConnectionResetError('reset')]
+    with pytest.raises(ConnectionResetError):
+        send(pool)
+    assert pool.stats()['idle'] == 0
+    assert all(instance.closed for instance in FakeSMTP.instances)
+
+    # O lugar no pool foi libertado: o envio seguinte abre uma sessão nova
+    send(pool)
+    assert pool.stats()['sent'] == 1
+
+
+def test_refusal_keeps_session(pool):
+    """Recusa do destinatário não é erro de ligação: sem reconexão, sessão reutilizada"""
+    FakeSMTP.send_failures = [smtplib.SMTPRecipientsRefused({'x@example.com': (550, b'no such user')})]
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        send(pool, 'x@example.com')
+    send(pool)
+
+    stats = pool.stats()
+    assert (stats['connects'], stats['reconnects'], stats['sent']) == (1, 0, 1)
+
+
+def test_login_failure_releases_slot(pool):
+    """Falha no login não deixa o pool sem lugares livres"""
+    FakeSMTP.login_error = smtplib.SMTPAuthenticationError(535, b'bad credentials')
+    for _ in range(2):
+        with pytest.raises(smtplib.SMTPAuthenticationError):
+            send(pool)
+    FakeSMTP.login_error = None
+    send(pool)
+    assert pool.stats()['sent'] == 1
+
+
+def test_idle_sessions_expire(pool):
+    """Sessões paradas mais de idle_timeout não são reutilizadas"""
+    pool.idle_timeout = 0
+    send(pool)
+    send(pool)
+    assert pool.stats()['connects'] == 2
+    assert FakeSMTP.instances[0].closed
+
+
+def test_batch_uses_one_session(pool):
+    """Dentro de batch() todas as mensagens seguem pela mesma ligação"""
+    with pool.batch():
+        for index in range(3):
+            send(pool, f'user{index}@example.com')
+    assert len(FakeSMTP.instances) == 1
+    assert pool.stats()['idle'] == 1
+
+
+def test_is_connection_error():
+    """Erros de rede contam como ligação; recusas SMTP não"""
+    assert smtp_pool.is_connection_error(smtplib.SMTPServerDisconnected())
+    assert smtp_pool.is_connection_error(TimeoutError())
+    assert not smtp_pool.is_connection_error(smtplib.SMTPDataError(554, b'rejected'))
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, '-q']))